@@ -0,0 +1,62 @@
+""" Memory per instance and construction time of the models vs. their slotted variants
+
+    python benchmarks/compact_models.py [instances]
+
+Builds one Pose, AgentCurrentResources, AssignmentCurrentStatus and AssignmentMetadata per simulated agent and
+reports the memory allocated by the instances (tracemalloc; the field values are shared, so only the instances
+themselves are counted), the construction time and the attribute read time.
+"""
+import sys
+import time
+import tracemalloc
+from helyos_agent_sdk import models, compact_models
+
+
+NOW = 1700000000.0
+ORIENTATIONS = [0.0]
+EMPTY_LIST = []
+EMPTY_DICT = {}
+
+
+def build(module, count):
+    return [(module.Pose(1.5, 2.5, 0.0, ORIENTATIONS),
+             module.AgentCurrentResources(EMPTY_LIST, 1, False),
+             module.AssignmentCurrentStatus('1', 'executing', EMPTY_DICT),
+             module.AssignmentMetadata(1, 1, 1, 'executing', NOW, EMPTY_DICT))
+            for _ in range(count)]
+
+
+def read(agents):
+    total = 0.0
+    for pose, resources, status, metadata in agents:
+        total += pose.x + pose.y + resources.work_process_id + metadata.id
+    return total
+
+
+def measure(module, count):
+    tracemalloc.start()
+    agents = build(module, count)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del agents
+
+    started = time.perf_counter()
+    agents = build(module, count)
+    build_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    read(agents)
+    read_time = time.perf_counter() - started
+    return memory / count, build_time / count, read_time / count
+
+
+def main(count=100000):
+    print(f'{count} agents, 4 model instances each')
+    print(f"{'variant':<10}{'bytes/agent':>12}{'build us/agent':>16}{'read ns/agent':>15}")
+    for name, module in (('models', models), ('compact', compact_models)):
+        memory, build_time, read_time = measure(module, count)
+        print(f'{name:<10}{memory:>12.0f}{1e6 * build_time:>16.2f}{1e9 * read_time:>15.1f}')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
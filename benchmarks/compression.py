@@ -0,0 +1,57 @@
+""" Compression ratio and CPU time for large assignment and update messages
+
+    python benchmarks/compression.py [iterations]
+
+Compresses a dense trajectory assignment and an agent update with a factsheet and geometry with every available
+algorithm, and reports the envelope size and the compression/decompression CPU time per message.
+"""
+import math
+import sys
+from helyos_agent_sdk import envelope
+from helyos_agent_sdk.compression import PayloadCompressor, ZLIB, ZSTD, zstandard
+
+
+def trajectory_assignment(points=5000):
+    trajectory = [{'x': round(1000 * math.cos(i / 200.0), 3), 'y': round(1000 * math.sin(i / 200.0), 3),
+                   'orientations': [round(i / 200.0 + math.pi / 2, 5)], 'time': i * 0.1}
+                  for i in range(points)]
+    return {'type': 'assignment_execution', 'uuid': 'a5b9d7a4-6c7a-4bb8-8b6d-4a0a5d1ad0b1',
+            'metadata': {'id': 1042, 'yard_id': 1, 'work_process_id': 142},
+            'body': {'trajectory': trajectory, 'operation': 'drive'}, '_version': '3.0.0'}
+
+
+def general_update(polygons=300):
+    geometry = {'type': 'FeatureCollection',
+                'features': [{'type': 'Feature', 'properties': {'id': i, 'name': f'parking_{i}'},
+                              'geometry': {'type': 'Polygon',
+                                           'coordinates': [[[i * 10.0, 0.0], [i * 10.0 + 8, 0.0],
+                                                            [i * 10.0 + 8, 5.0], [i * 10.0, 5.0]]]}}
+                             for i in range(polygons)]}
+    factsheet = {'typeSpecification': {'seriesName': 'truck', 'agvKinematic': 'DIFF', 'agvClass': 'CARRIER'},
+                 'physicalParameters': {'speedMax': 2.0, 'accelerationMax': 1.0, 'length': 12.5, 'width': 2.5},
+                 'protocolFeatures': {'optionalParameters': [{'parameter': f'order.nodes[].nodeDescription{i}',
+                                                              'support': 'SUPPORTED'} for i in range(100)]}}
+    return {'type': 'agent_update', 'uuid': 'a5b9d7a4-6c7a-4bb8-8b6d-4a0a5d1ad0b1',
+            'body': {'factsheet': factsheet, 'geometry': geometry}}
+
+
+def main(iterations=20):
+    algorithms = [ZLIB] + ([ZSTD] if zstandard is not None else [])
+    print(f"{'message':<12}{'algorithm':<10}{'raw bytes':>11}{'sent bytes':>12}{'ratio':>8}"
+          f"{'compress ms':>13}{'decompress ms':>15}")
+    for name, message in (('assignment', trajectory_assignment()), ('update', general_update())):
+        serialized = envelope.encode(message)
+        for algorithm in algorithms:
+            compressor = PayloadCompressor(threshold=0, algorithm=algorithm)
+            for _ in range(iterations):
+                _, compressed = compressor.compress(serialized.encode('utf-8'))
+                compressor.decompress(algorithm, compressed)
+            stats = compressor.summary()
+            body = envelope.encode_envelope(serialized, compressor=compressor)
+            print(f"{name:<12}{algorithm:<10}{len(serialized):>11}{len(body):>12}{stats['ratio']:>8.1f}"
+                  f"{stats['compress_cpu_ms'] / stats['compressed']:>13.2f}"
+                  f"{stats['decompress_cpu_ms'] / stats['decompressed']:>15.2f}")
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
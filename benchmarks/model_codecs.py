@@ -0,0 +1,76 @@
+""" Precompiled model codecs vs. the dataclasses_json route
+
+    python benchmarks/model_codecs.py [iterations]
+
+Outbound: an agent state message serialized as AgentConnector.publish_state did before (to_json, json.loads, dumps)
+and with the precompiled encoder. Inbound: an assignment built field by field as parse_assignment_message did before,
+with dataclasses_json's from_dict and with the precompiled decoder.
+"""
+import json
+import sys
+import timeit
+from dataclasses_json import dataclass_json
+from helyos_agent_sdk import envelope
+from helyos_agent_sdk.model_codecs import codec, to_dict
+from helyos_agent_sdk.models import (AGENT_STATE, ASSIGNMENT_STATUS, AgentCurrentResources, AgentStateBody,
+                                     AgentStateMessage, AssignmentCommandMessage, AssignmentCurrentStatus,
+                                     AssignmentMetadata)
+
+STATE = AgentStateMessage(uuid='a5b9d7a4-6c7a-4bb8-8b6d-4a0a5d1ad0b1',
+                          body=AgentStateBody(AGENT_STATE.BUSY,
+                                              AgentCurrentResources(['drive', 'load'], 142, True),
+                                              AssignmentCurrentStatus('1042', ASSIGNMENT_STATUS.EXECUTING,
+                                                                      {'distance': 1520.5, 'stops': [1, 2, 3]})))
+
+ASSIGNMENT = {'type': 'assignment_execution', 'uuid': 'a5b9d7a4-6c7a-4bb8-8b6d-4a0a5d1ad0b1', '_version': '3.0.0',
+              'metadata': {'id': 1042, 'work_process_id': 142, 'yard_id': 1, 'status': 'executing',
+                           'start_time_stamp': 1700000000.0, 'context': {}},
+              'body': {'operation': 'drive', 'destination': {'x': 1000, 'y': 2000}}}
+
+# dataclasses_json variant of the inbound model, as a reference for its from_dict cost
+AssignmentCommandMessageJson = dataclass_json(AssignmentCommandMessage)
+
+
+def legacy_state_bytes():
+    return envelope.dumps(json.loads(STATE.to_json()))
+
+
+def codec_state_bytes():
+    return envelope.dumps(to_dict(STATE))
+
+
+def legacy_assignment():
+    command_message = {'type': ASSIGNMENT['type'],
+                       'uuid': ASSIGNMENT['uuid'],
+                       'metadata': AssignmentMetadata(**ASSIGNMENT.get('metadata', {})),
+                       'body': ASSIGNMENT['body'],
+                       '_version': ASSIGNMENT['_version']}
+    return AssignmentCommandMessage(**command_message)
+
+
+def dataclasses_json_assignment():
+    return AssignmentCommandMessageJson.from_dict(ASSIGNMENT)
+
+
+decode_assignment = codec(AssignmentCommandMessage).from_dict
+
+
+def codec_assignment():
+    return decode_assignment(ASSIGNMENT)
+
+
+def main(iterations=20000):
+    assert legacy_state_bytes() == codec_state_bytes()
+    assert legacy_assignment() == codec_assignment()
+    print(f'JSON backend: {envelope.JSON_BACKEND}, {iterations} iterations')
+    for name, function in (('state: to_json + loads + dumps', legacy_state_bytes),
+                           ('state: precompiled to_dict + dumps', codec_state_bytes),
+                           ('assignment: field by field', legacy_assignment),
+                           ('assignment: dataclasses_json from_dict', dataclasses_json_assignment),
+                           ('assignment: precompiled from_dict', codec_assignment)):
+        elapsed = timeit.timeit(function, number=iterations) / iterations
+        print(f'{name:<42}{1e6 * elapsed:8.2f} us')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,71 @@
+""" Size and encode/decode time of the envelope payload formats
+
+    python benchmarks/payload_formats.py [iterations]
+
+Compares the JSON envelope with the MessagePack and CBOR envelopes for typical sensor and state messages, signed
+with an RSA key. Formats whose package is not installed are skipped.
+"""
+import sys
+import time
+from helyos_agent_sdk import envelope
+from helyos_agent_sdk.crypto import Signing, generate_private_public_keys
+
+
+SENSORS_MESSAGE = {'type': 'agent_sensors',
+                   'uuid': 'a5b9d7a4-6c7a-4bb8-8b6d-4a0a5d1ad0b1',
+                   'body': {'pose': {'x': 1234.5, 'y': -6789.25, 'z': 0, 'orientations': [1571.2, 12.5]},
+                            'sensors': {'temperature': {'title': 'temperature', 'type': 'number', 'value': 35.3,
+                                                        'unit': 'C', 'minimum': -20, 'maximum': 90},
+                                        'velocity': {'title': 'velocity', 'type': 'number', 'value': 1.25,
+                                                     'unit': 'm/s'},
+                                        'battery': {'title': 'battery', 'type': 'number', 'value': 87,
+                                                    'unit': '%'}}}}
+
+STATE_MESSAGE = {'type': 'agent_state',
+                 'uuid': 'a5b9d7a4-6c7a-4bb8-8b6d-4a0a5d1ad0b1',
+                 'body': {'status': 'busy',
+                          'resources': {'work_process_id': 142, 'reserved': True, 'operation_types_available': []},
+                          'assignment': {'id': 1042, 'status': 'executing', 'result': {}}},
+                 '_version': '3.0.0'}
+
+HEADERS = {'user_id': 'a5b9d7a4-6c7a-4bb8-8b6d-4a0a5d1ad0b1', 'timestamp': 1700000000000,
+           'reply_to': None, 'correlation_id': None}
+
+
+def available_formats():
+    formats = [envelope.JSON]
+    if envelope.msgpack is not None:
+        formats.append(envelope.MSGPACK)
+    if envelope.cbor2 is not None:
+        formats.append(envelope.CBOR)
+    return formats
+
+
+def measure(message, payload_format, signing, iterations):
+    signature = signing.return_signature(envelope.encode(message, payload_format, canonical=True))
+
+    started = time.perf_counter()
+    for _ in range(iterations):
+        body = envelope.encode_envelope(envelope.encode(message, payload_format), signature, HEADERS, payload_format)
+    encode_time = (time.perf_counter() - started) / iterations
+
+    started = time.perf_counter()
+    for _ in range(iterations):
+        envelope.decode_message(body)
+    decode_time = (time.perf_counter() - started) / iterations
+
+    return len(body), encode_time, decode_time
+
+
+def main(iterations=20000):
+    signing = Signing(generate_private_public_keys()[0])
+    print(f'JSON backend: {envelope.JSON_BACKEND}, {iterations} iterations, RSA-2048 signature, MQTT headers')
+    print(f"{'message':<10}{'format':<10}{'bytes':>8}{'encode us':>12}{'decode us':>12}")
+    for name, message in (('sensors', SENSORS_MESSAGE), ('state', STATE_MESSAGE)):
+        for payload_format in available_formats():
+            size, encode_time, decode_time = measure(message, payload_format, signing, iterations)
+            print(f'{name:<10}{payload_format:<10}{size:>8}{1e6 * encode_time:>12.2f}{1e6 * decode_time:>12.2f}')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,64 @@
+""" Bytes on the wire and serialization CPU of full vs. delta-encoded sensor messages
+
+    python benchmarks/sensor_delta.py [messages]
+
+Simulates an agent at 10 Hz with 200 sensor entries, alternating between driving (3 sensors change per message)
+and standing still (nothing changes), and compares the full messages with the delta encoding (keyframe every 5 s,
+5 mm / 0.1 deg dead-bands). Every delta is checked against the full state rebuilt by the reference decoder.
+"""
+import math
+import sys
+import time
+from helyos_agent_sdk import envelope
+from helyos_agent_sdk.sensor_delta import SensorDeltaEncoder, SensorDeltaDecoder
+
+RATE = 10
+KEYFRAME_INTERVAL = 5
+
+
+def samples(count, keys=200):
+    sensors = {f'sensor_{i}': {'title': f'sensor {i}', 'type': 'number', 'value': 0.0, 'unit': 'mm'}
+               for i in range(keys)}
+    angle = 0.0
+    for n in range(count):
+        if (n // 100) % 2 == 0:
+            angle = n / 500.0
+            for i in range(3):
+                key = f'sensor_{(n + i) % keys}'
+                sensors[key] = {**sensors[key], 'value': n}
+        yield {'x': 1000 * math.cos(angle), 'y': 1000 * math.sin(angle), 'z': 0, 'orientations': [angle]}, sensors
+
+
+def main(count=5000):
+    # keyframes are forced by message count so that the result does not depend on the machine speed
+    encoder = SensorDeltaEncoder(keyframe_interval=math.inf, position_deadband=5,
+                                 orientation_deadband=0.1 * math.pi / 180)
+    decoder = SensorDeltaDecoder()
+
+    full_bytes = delta_bytes = 0
+    full_time = delta_time = 0.0
+    for n, (pose, sensors) in enumerate(samples(count)):
+        started = time.perf_counter()
+        full = envelope.encode({'type': 'agent_sensors', 'uuid': 'u', 'body': {'pose': pose, 'sensors': sensors}})
+        full_time += time.perf_counter() - started
+        full_bytes += len(full)
+
+        if n % (RATE * KEYFRAME_INTERVAL) == 0:
+            encoder.force_keyframe()
+        started = time.perf_counter()
+        body = encoder.encode(pose, sensors)
+        delta = None if body is None else envelope.encode({'type': 'agent_sensors', 'uuid': 'u', 'body': body})
+        delta_time += time.perf_counter() - started
+        if delta is None:
+            continue
+        delta_bytes += len(delta)
+        assert decoder.decode(envelope.decode(delta))['body']['sensors'] == sensors
+
+    print(f'{count} messages, 200 sensors, JSON backend {envelope.JSON_BACKEND}: {encoder.summary()}')
+    print(f'full : {full_bytes / 1e6:8.2f} MB {1000 * full_time:8.1f} ms')
+    print(f'delta: {delta_bytes / 1e6:8.2f} MB {1000 * delta_time:8.1f} ms  '
+          f'({full_bytes / delta_bytes:.0f}x fewer bytes, {full_time / delta_time:.1f}x less CPU)')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
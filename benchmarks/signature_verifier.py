@@ -0,0 +1,59 @@
+""" Verification time with the cached SignatureVerifier and with per-call key parsing
+
+    python benchmarks/signature_verifier.py [iterations]
+
+The per-call variant parses the PEM public key and builds the padding objects for every message, as
+`verify_signature()` did before parsed keys were cached. The cached variant is `SignatureVerifier.verify()`.
+"""
+import json
+import sys
+import time
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, padding
+from helyos_agent_sdk.crypto import SIGNATURE_ALGORITHMS, Signing, SignatureVerifier, generate_private_public_keys
+
+
+STATE_MESSAGE = json.dumps({'type': 'agent_state',
+                            'uuid': 'a5b9d7a4-6c7a-4bb8-8b6d-4a0a5d1ad0b1',
+                            'body': {'status': 'busy',
+                                     'resources': {'work_process_id': 142, 'reserved': True,
+                                                   'operation_types_available': []},
+                                     'assignment': {'id': 1042, 'status': 'executing', 'result': {}}},
+                            '_version': '3.0.0'}, sort_keys=True)
+
+
+def verify_per_call(message_string, signature, public_key):
+    pubkey = serialization.load_pem_public_key(public_key, backend=default_backend())
+    data = message_string.encode('utf-8')
+    if isinstance(pubkey, ed25519.Ed25519PublicKey):
+        pubkey.verify(signature, data)
+    elif isinstance(pubkey, ec.EllipticCurvePublicKey):
+        pubkey.verify(signature, data, ec.ECDSA(hashes.SHA256()))
+    else:
+        pubkey.verify(signature, data, padding.PSS(mgf=padding.MGF1(hashes.SHA256()),
+                                                   salt_length=padding.PSS.MAX_LENGTH), hashes.SHA256())
+    return True
+
+
+def measure(verify, signature, public_key, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        verify(STATE_MESSAGE, signature, public_key)
+    return (time.perf_counter() - started) / iterations
+
+
+def main(iterations=2000):
+    print(f'{iterations} iterations, {len(STATE_MESSAGE)} B state message, bytes signature')
+    print(f"{'algorithm':<12}{'per call us':>13}{'cached us':>12}{'speedup':>10}")
+    for algorithm in SIGNATURE_ALGORITHMS:
+        private_key, public_key = generate_private_public_keys(algorithm)
+        signature = Signing(private_key).return_signature(STATE_MESSAGE)
+        per_call_time = measure(verify_per_call, signature, public_key, iterations)
+        cached_time = measure(SignatureVerifier().verify, signature, public_key, iterations)
+        print(f'{algorithm:<12}{1e6 * per_call_time:>13.2f}{1e6 * cached_time:>12.2f}'
+              f'{per_call_time / cached_time:>9.1f}x')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,53 @@
+""" Sign and verify time and signature size of the signature algorithms
+
+    python benchmarks/signatures.py [iterations]
+
+Compares RSA-2048 (PSS, SHA-256), Ed25519 and ECDSA P-256 (SHA-256) on a typical agent state message, and reports
+the key generation time, which matters for agents generating their keys at start-up.
+"""
+import json
+import sys
+import time
+from helyos_agent_sdk.crypto import SIGNATURE_ALGORITHMS, Signing, SignatureVerifier, generate_private_public_keys
+
+
+STATE_MESSAGE = json.dumps({'type': 'agent_state',
+                            'uuid': 'a5b9d7a4-6c7a-4bb8-8b6d-4a0a5d1ad0b1',
+                            'body': {'status': 'busy',
+                                     'resources': {'work_process_id': 142, 'reserved': True,
+                                                   'operation_types_available': []},
+                                     'assignment': {'id': 1042, 'status': 'executing', 'result': {}}},
+                            '_version': '3.0.0'}, sort_keys=True)
+
+
+def measure(algorithm, iterations):
+    started = time.perf_counter()
+    private_key, public_key = generate_private_public_keys(algorithm)
+    keygen_time = time.perf_counter() - started
+
+    signing = Signing(private_key)
+    started = time.perf_counter()
+    for _ in range(iterations):
+        signature = signing.return_signature(STATE_MESSAGE)
+    sign_time = (time.perf_counter() - started) / iterations
+
+    verifier = SignatureVerifier()
+    started = time.perf_counter()
+    for _ in range(iterations):
+        verifier.verify(STATE_MESSAGE, signature, public_key)
+    verify_time = (time.perf_counter() - started) / iterations
+
+    return len(signature), keygen_time, sign_time, verify_time
+
+
+def main(iterations=2000):
+    print(f'{iterations} iterations, {len(STATE_MESSAGE)} B state message, cached public keys')
+    print(f"{'algorithm':<12}{'sig bytes':>10}{'keygen ms':>12}{'sign us':>12}{'verify us':>12}")
+    for algorithm in SIGNATURE_ALGORITHMS:
+        size, keygen_time, sign_time, verify_time = measure(algorithm, iterations)
+        print(f'{algorithm:<12}{size:>10}{1e3 * keygen_time:>12.2f}{1e6 * sign_time:>12.2f}'
+              f'{1e6 * verify_time:>12.2f}')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -1,6 +1,24 @@
 from .client import HelyOSClient,  connect_rabbitmq
 from .mqtt_client import HelyOSMQTTClient,  connect_mqtt
+from .connection_profile import ConnectionProfile
 
 from .connector import AgentConnector
+from .dispatcher import CallbackDispatcher, AsyncCallbackDispatcher
+from .cancellation import CancelToken, CancelLane
 from .summary_request import SummaryRPC
 from .database_connector import DatabaseConnector
+from .query_cache import QueryCache
+
+from .async_client import AsyncHelyOSClient, connect_rabbitmq_async
+from .publisher import ConfirmPublisher
+from .scheduler import OutboundScheduler, TrafficClass
+from .async_mqtt_client import AsyncHelyOSMQTTClient, connect_mqtt_async
+from .async_connector import AsyncAgentConnector
+from .sensor_publisher import SensorPublisher, AsyncSensorPublisher
+from .keystore import AgentKeystore
+from .compression import PayloadCompressor
+from .outbox import Outbox
+from .acks import Acknowledger
+from .sensor_delta import SensorDeltaEncoder, SensorDeltaDecoder
+from .fleet import AgentFleet
+from .fleet_consumer import FleetConsumer, AsyncFleetConsumer
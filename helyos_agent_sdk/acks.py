@@ -0,0 +1,162 @@
+import inspect
+import logging
+import threading
+from concurrent.futures import Future
+
+
+class _ChannelAcks():
+    """ Delivery tags of one channel: deliveries being processed and processed deliveries not yet acknowledged. """
+
+    def __init__(self):
+        self.outstanding = set()
+        self.pending = []
+        self.flush_scheduled = False
+
+
+class Acknowledger():
+
+    def __init__(self, prefetch_count=10, batch_size=1, max_delay=0.05, requeue=True, call_later=None,
+                 threadsafe=None):
+        """ Manual acknowledgements of consumed deliveries (AMQP)
+
+            Wraps the delivery callbacks given to `consume_assignment_messages()` and
+            `consume_instant_actions_messages()`. A delivery is acknowledged when its callback returns, or when the
+            task or future returned by an asynchronous or dispatched callback is done; it is rejected (basic_nack) if
+            the callback raises, and requeued unless `requeue` is False. With the broker prefetch (basic_qos) limited
+            to `prefetch_count` unacknowledged deliveries, the backlog of a slow agent stays on the broker instead of
+            in the client's memory, and an assignment whose callback crashes is not lost. A redelivered message whose
+            callback fails again is dropped (or dead-lettered by the broker) instead of being requeued forever.
+
+            Acknowledgements are sent in batches of up to `batch_size`, at the latest `max_delay` seconds after the
+            first one. A batch is acknowledged with a single cumulative basic_ack (multiple=True) when no earlier
+            delivery is still being processed, individually otherwise.
+
+            Usually created by :meth:`HelyOSClient.enable_manual_ack`.
+
+            :param prefetch_count: Maximum number of unacknowledged deliveries per consumer channel, defaults to 10
+            :type prefetch_count: int
+            :param batch_size: Number of acknowledgements sent together, at most half of `prefetch_count`,
+                               defaults to 1
+            :type batch_size: int
+            :param max_delay: Maximum delay in seconds of a batched acknowledgement, defaults to 0.05
+            :type max_delay: float
+            :param requeue: Requeue the deliveries whose callback failed, defaults to True
+            :type requeue: bool
+            :param call_later: call_later(delay, func) of the connection, needed for batches
+            :type call_later: func
+            :param threadsafe: threadsafe(func) runs func on the connection's thread, needed when callbacks complete
+                               on other threads
+            :type threadsafe: func
+        """
+        if prefetch_count:
+            # a full batch must not use up the prefetch window, or the broker stops delivering
+            batch_size = max(1, min(batch_size, prefetch_count // 2))
+        self.prefetch_count = prefetch_count
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.requeue = requeue
+        self.call_later = call_later
+        self.threadsafe = threadsafe
+
+        self.acked = 0
+        self.nacked = 0
+        self.ack_frames = 0
+
+        self._channels = {}
+        self._lock = threading.Lock()
+
+    def wrap(self, callback):
+        """ Return a delivery callback (ch, method, properties, body) that acknowledges the processed deliveries. """
+        def on_message(ch, method, properties, body):
+            delivery_tag = method.delivery_tag
+            # a delivery that already failed once is not requeued again, so that it cannot loop forever
+            requeue = self.requeue and not method.redelivered
+            self._state(ch).outstanding.add(delivery_tag)
+            try:
+                result = callback(ch, method, properties, body)
+            except Exception:
+                logging.exception('Error occurred in delivery callback, the delivery is rejected.')
+                self._settle(ch, delivery_tag, False, requeue)
+                return None
+            if isinstance(result, Future):
+                # dispatched to a worker thread (see CallbackDispatcher)
+                result.add_done_callback(lambda future: self.settle(
+                    ch, delivery_tag, future.cancelled() or future.exception() is None, requeue))
+            elif inspect.isawaitable(result) and hasattr(result, 'add_done_callback'):
+                result.add_done_callback(lambda task: self._settle(
+                    ch, delivery_tag, task.cancelled() or task.exception() is None, requeue))
+            else:
+                self._settle(ch, delivery_tag, True)
+            return result
+
+        return on_message
+
+    def _state(self, channel):
+        with self._lock:
+            state = self._channels.get(channel, None)
+            if state is None:
+                # deliveries of closed channels were requeued by the broker
+                for closed in [closed for closed in self._channels if not closed.is_open]:
+                    del self._channels[closed]
+                state = self._channels[channel] = _ChannelAcks()
+            return state
+
+    def settle(self, channel, delivery_tag, success, requeue=True):
+        """ Acknowledge (or reject) a delivery whose processing has completed; safe to call from any thread. """
+        if self.threadsafe is not None:
+            return self.threadsafe(lambda: self._settle(channel, delivery_tag, success, requeue))
+        return self._settle(channel, delivery_tag, success, requeue)
+
+    def _settle(self, channel, delivery_tag, success, requeue=True):
+        state = self._state(channel)
+        state.outstanding.discard(delivery_tag)
+        if not channel.is_open:
+            return
+
+        if not success:
+            self._flush(channel, state)
+            channel.basic_nack(delivery_tag, requeue=requeue)
+            self.nacked += 1
+            return
+
+        state.pending.append(delivery_tag)
+        if len(state.pending) >= self.batch_size or self.call_later is None:
+            self._flush(channel, state)
+        elif not state.flush_scheduled:
+            state.flush_scheduled = True
+            self.call_later(self.max_delay, lambda: self._flush(channel, state))
+
+    def _flush(self, channel, state):
+        state.flush_scheduled = False
+        if not state.pending or not channel.is_open:
+            state.pending.clear()
+            return
+
+        pending = sorted(state.pending)
+        state.pending.clear()
+        # a cumulative ack covers all earlier deliveries: only use it below the oldest delivery still processed
+        limit = min(state.outstanding) if state.outstanding else None
+        cumulative = [tag for tag in pending if limit is None or tag < limit]
+        if len(cumulative) > 1:
+            channel.basic_ack(cumulative[-1], multiple=True)
+            self.ack_frames += 1
+            individual = pending[len(cumulative):]
+        else:
+            individual = pending
+        for delivery_tag in individual:
+            channel.basic_ack(delivery_tag)
+            self.ack_frames += 1
+        self.acked += len(pending)
+
+    def flush(self):
+        """ Send the pending acknowledgements now. Must run on the connection's thread. """
+        for channel, state in list(self._channels.items()):
+            self._flush(channel, state)
+
+    def summary(self):
+        """ Acknowledged and rejected deliveries, ack frames sent and deliveries being processed. """
+        return {'acked': self.acked,
+                'nacked': self.nacked,
+                'ack_frames': self.ack_frames,
+                'in_progress': sum(len(state.outstanding) for state in self._channels.values()),
+                'pending_acks': sum(len(state.pending) for state in self._channels.values())}
@@ -0,0 +1,512 @@
+import asyncio
+import time
+from . import envelope
+import pika
+from pika.adapters.asyncio_connection import AsyncioConnection
+from .exceptions import *
+from .models import AGENT_STATE, CheckinResponseMessage
+from .publisher import ConfirmPublisher
+from .acks import Acknowledger
+from .connection_profile import ASYNC_PROFILE
+from .crypto import public_key_format, RSA
+from .client import (HelyOSClient, rabbitmq_connection_parameters, AGENTS_UL_EXCHANGE, AGENTS_DL_EXCHANGE,
+                     AGENT_ANONYMOUS_EXCHANGE, REGISTRATION_TOKEN)
+
+
+def _call_async(method, *args, **kwargs):
+    """ Call a callback-style pika method and return a future resolved with the callback argument. """
+    future = asyncio.get_running_loop().create_future()
+
+    def callback(result):
+        if not future.done():
+            future.set_result(result)
+
+    method(*args, callback=callback, **kwargs)
+    return future
+
+
+async def connect_rabbitmq_async(rabbitmq_host, rabbitmq_port, username, passwd, enable_ssl=False, ca_certificate=None,
+                                 temporary=False, on_close_callback=None, profile=None):
+    """ Open a pika AsyncioConnection on the running event loop.
+
+        Same parameters as :func:`helyos_agent_sdk.client.connect_rabbitmq`; `on_close_callback(connection, reason)`
+        is called if the connection is closed after it was opened.
+    """
+    params = rabbitmq_connection_parameters(rabbitmq_host, rabbitmq_port, username, passwd,
+                                            enable_ssl, ca_certificate, temporary, profile)
+    loop = asyncio.get_running_loop()
+    opened = loop.create_future()
+
+    def on_open(connection):
+        if not opened.done():
+            opened.set_result(connection)
+
+    def on_open_error(connection, err):
+        if not opened.done():
+            opened.set_exception(err if isinstance(err, Exception) else Exception(err))
+
+    def on_close(connection, reason):
+        if not opened.done():
+            opened.set_exception(reason)
+        elif on_close_callback is not None:
+            on_close_callback(connection, reason)
+
+    AsyncioConnection(params, on_open_callback=on_open, on_open_error_callback=on_open_error,
+                      on_close_callback=on_close, custom_ioloop=loop)
+    return await opened
+
+
+async def open_channel_async(connection):
+    """ Open a channel on an AsyncioConnection. """
+    future = asyncio.get_running_loop().create_future()
+
+    def on_open(channel):
+        if not future.done():
+            future.set_result(channel)
+
+    connection.channel(on_open_callback=on_open)
+    return await future
+
+
+def parse_checkin_response(helyos_client, channel, sender, received_str):
+    """ Parse the check-in response shared by the asyncio clients.
+
+        Returns None while the message is not a check-in response. A new RabbitMQ account sent by helyOS is stored in
+        `helyos_client._pending_credentials`; the connection is opened by `get_checkin_result()`.
+    """
+    received_message, received_message_str, signature = envelope.decode_message(received_str)
+
+    msg_type = received_message['type']
+    if msg_type != 'checkin':
+        print('waiting response...')
+        return None
+
+    body = received_message['body']
+    response_code = body.get('response_code', 500)
+    if response_code != '200':
+        print(body)
+        message = body.get('message', 'Check in refused')
+        raise HelyOSCheckinError(f'{message}: code {response_code}')
+
+    try:
+        checkin_data = CheckinResponseMessage(**received_message)
+    except:
+        raise HelyOSCheckinError('Check in refused: received invalid message format')
+
+    if not helyos_client.checkin_guard_interceptor(channel, sender, checkin_data, received_message_str, signature):
+        raise HelyOSCheckinError('Check in refused: checkin_guard_interceptor returned False')
+
+    password = body.pop('rbmq_password', None)
+    helyos_client.ca_certificate = body.get('ca_certificate', helyos_client.ca_certificate)
+    if helyos_client.helyos_public_key is None:
+        helyos_client.helyos_public_key = body.get('helyos_public_key', helyos_client.helyos_public_key)
+
+    if password:
+        helyos_client._pending_credentials = (body['rbmq_username'], password)
+        print('uuid', helyos_client.uuid)
+        print('username', body['rbmq_username'])
+        print('password', len(password)*'*')
+
+    helyos_client.uuid = received_message['uuid']
+    try:
+        helyos_client.checkin_data = CheckinResponseMessage(**received_message)
+    except:
+        helyos_client.checkin_data = body
+
+    return received_message
+
+
+class AsyncHelyOSClient(HelyOSClient):
+
+    def __init__(self, rabbitmq_host, rabbitmq_port=5672, uuid=None, enable_ssl=False, ca_certificate=None,
+                 helyos_public_key=None, agent_privkey=None, agent_pubkey=None, signature_algorithm=RSA,
+                 keystore=None, publisher_confirms=False, max_in_flight=1000, connection_profile=None):
+        """ HelyOS asyncio client class
+
+            Asyncio variant of :class:`HelyOSClient` built on pika's `AsyncioConnection`. It shares the routing-key
+            properties, the message envelope and the AMQP properties of the blocking client, but connection, check-in,
+            publishing and listening are coroutines running on the caller's event loop.
+
+            .. code-block:: python
+
+                helyos_client = AsyncHelyOSClient('myrabbitmq.com', 5672, uuid='3452345-52453-43525')
+                await helyos_client.connect('my_username', 'secret_password')
+                await helyos_client.perform_checkin(yard_uid='yard_A', status='free')
+                await helyos_client.get_checkin_result()
+
+            With `publisher_confirms=True` the channel is put in confirm mode and messages are pipelined: `publish()`
+            returns a future per message, resolved when the broker acks it, while up to `max_in_flight` messages
+            can be unconfirmed at once. Use `flush()` to wait for all confirmations and `publisher_stats()` for
+            throughput and confirm latency.
+
+            .. code-block:: python
+
+                helyos_client = AsyncHelyOSClient('myrabbitmq.com', 5672, uuid='3452345-52453-43525', publisher_confirms=True)
+                await helyos_client.connect('my_username', 'secret_password')
+                confirmation = await helyos_client.publish(helyos_client.sensors_routing_key, message)
+                await helyos_client.flush()
+
+            The other parameters are the same as in :class:`HelyOSClient`.
+
+            The outbox (`enable_outbox()`, `replay_outbox()`) and the I/O thread (`start_io_thread()`) of the blocking
+            client are not part of the asyncio API and raise :class:`HelyOSUnsupportedError`: the connection is
+            served by the event loop, where `publish()` runs, and `publish()` does not store messages in an outbox.
+
+            :param publisher_confirms: Enable pipelined publisher confirms, defaults to False
+            :type publisher_confirms: bool
+            :param max_in_flight: Maximum number of unconfirmed messages in confirm mode, defaults to 1000
+            :type max_in_flight: int
+            :param connection_profile: Heartbeat, blocked-connection timeout and socket options of the account
+                                       connection, defaults to ASYNC_PROFILE: the event loop processes the broker
+                                       events continuously, so a short heartbeat detects dead links quickly.
+            :type connection_profile: ConnectionProfile
+        """
+        super().__init__(rabbitmq_host, rabbitmq_port, uuid, enable_ssl, ca_certificate,
+                         helyos_public_key, agent_privkey, agent_pubkey, signature_algorithm, keystore,
+                         connection_profile or ASYNC_PROFILE)
+        self.publisher = ConfirmPublisher(max_in_flight) if publisher_confirms else None
+        self.guest_channel = None
+        self.checkin_timeout = 60
+        self._guest_connection = None
+        self._checkin_response = None
+        self._checkin_error = None
+        self._pending_credentials = None
+        self._listening = None
+        self._closing = False
+
+    @property
+    def is_connection_open(self):
+        """ Check if the connection is open """
+        return self.connection is not None and self.connection.is_open
+
+    def check_connection(self):
+        """ The event loop processes broker events continuously: same as `is_connection_open`. """
+        return self.is_connection_open
+
+    def _on_connection_closed(self, connection, reason):
+        if connection is not self.connection:
+            return
+        if self._listening is not None and not self._listening.done():
+            if self._closing:
+                self._listening.set_result(None)
+            else:
+                self._listening.set_exception(HelyOSAccountConnectionError(f'Connection closed: {reason}'))
+
+    async def connect_rabbitmq(self, username, password):
+        return await self.connect(username, password)
+
+    async def reconnect(self):
+        self.is_reconecting = True
+        try:
+            await self.connect(self.rbmq_username, self.rbmq_password)
+        finally:
+            self.is_reconecting = False
+
+    async def connect(self, username, password):
+        """
+        Creates the connection between agent and the RabbitMQ server.
+
+        :param username:  username previously registered in RabbitMQ server
+        :type username: str
+        :param password: password previously registered in RabbitMQ server'
+        :type password: str
+        """
+        print("connecting... ")
+        try:
+            self.connection = await connect_rabbitmq_async(self.rabbitmq_host, self.rabbitmq_port, username, password,
+                                                           self.enable_ssl, self.ca_certificate,
+                                                           on_close_callback=self._on_connection_closed,
+                                                           profile=self.connection_profile)
+            self._watch_connection(self.connection)
+            self.channel = await open_channel_async(self.connection)
+            if self.publisher is not None:
+                await self.publisher.bind(self.channel)
+            self.rbmq_username = username
+            self.rbmq_password = password
+            print("connected")
+
+        except Exception as inst:
+            raise HelyOSAccountConnectionError(
+                f'Not able to connect as {username} to rabbitMQ. {inst}')
+
+    async def perform_checkin(self, yard_uid, status=AGENT_STATE.FREE, agent_data={}, signed=False, checkin_guard_interceptor=None):
+        """
+        Asynchronous version of :meth:`HelyOSClient.perform_checkin`. Await `get_checkin_result()` afterwards to
+        receive the check-in data.
+        """
+        if self.connection:
+            self.guest_channel = self.channel
+            username = self.rbmq_username
+        else:
+            try:
+                self.guest_channel = await self._open_guest_channel()
+            except Exception as inst:
+                print(inst)
+                raise HelyOSAnonymousConnectionError(
+                    'Not able to connect as anonymous to rabbitMQ to perform check in.')
+            username = 'anonymous'
+
+        if checkin_guard_interceptor:
+            self.checkin_guard_interceptor = checkin_guard_interceptor
+
+        self._checkin_response = asyncio.get_running_loop().create_future()
+        self._checkin_error = None
+        temp_queue = await _call_async(self.guest_channel.queue_declare, queue='', exclusive=True)
+        self.checkin_response_queue = temp_queue.method.queue
+        await _call_async(self.guest_channel.basic_consume, queue=self.checkin_response_queue, auto_ack=True,
+                          on_message_callback=self.__checkin_callback_wrapper)
+
+        self.yard_uid = yard_uid
+        checkin_msg = {'type': 'checkin',
+                       'uuid': self.uuid,
+                       'body': {'yard_uid': yard_uid,
+                                'status': status,
+                                'public_key': self.public_key.decode('utf-8'),
+                                'public_key_format': public_key_format(self.signing_helper.algorithm),
+                                'registration_token': REGISTRATION_TOKEN,
+                                **agent_data},
+                       }
+
+        message = envelope.dumps(checkin_msg, canonical=True)
+        signature = None
+        if signed:
+            signature = self.signing_helper.return_signature(message).hex()
+
+        body = envelope.encode_envelope(message, signature)
+
+        properties = pika.BasicProperties(reply_to=self.checkin_response_queue, user_id=username,
+                                          timestamp=int(time.time()*1000))
+        if self.guest_channel is self.channel:
+            await self._send(AGENT_ANONYMOUS_EXCHANGE, self.checking_routing_key, body, properties)
+        else:
+            self.guest_channel.basic_publish(AGENT_ANONYMOUS_EXCHANGE, self.checking_routing_key, body, properties=properties)
+
+    async def _open_guest_channel(self):
+        """ Open the anonymous connection used for the check-in and return its channel. """
+        self._guest_connection = await connect_rabbitmq_async(
+            self.rabbitmq_host, self.rabbitmq_port, 'anonymous', 'anonymous', self.enable_ssl, temporary=True)
+        return await open_channel_async(self._guest_connection)
+
+    def _close_guest_channel(self):
+        if self._guest_connection is not None:
+            self._guest_connection.close()
+            self._guest_connection = None
+
+    async def get_checkin_result(self, timeout=None):
+        """ Wait for the check-in response published by helyOS and save it into the client instance as `checkin_data`.
+
+            :param timeout: Seconds to wait for the response, defaults to `checkin_timeout`
+            :type timeout: float
+        """
+        self.tries = 0
+        try:
+            await asyncio.wait_for(asyncio.shield(self._checkin_response), timeout or self.checkin_timeout)
+        except asyncio.TimeoutError:
+            if self._checkin_error is not None:
+                raise self._checkin_error
+            raise HelyOSCheckinError('Check in refused: no response from helyOS')
+        finally:
+            self._close_guest_channel()
+
+        if self._pending_credentials:
+            username, password = self._pending_credentials
+            self._pending_credentials = None
+            await self.connect(username, password)
+
+        return self.checkin_data
+
+    def __checkin_callback_wrapper(self, channel, method, properties, received_str):
+        sender = getattr(properties, 'user_id', None)
+        try:
+            received_message = parse_checkin_response(self, channel, sender, received_str)
+        except Exception as inst:
+            self._checkin_error = inst
+            self.tries += 1
+            print(f'try {self.tries}')
+            if self.tries > 3 and not self._checkin_response.done():
+                self._checkin_response.set_exception(inst)
+            return
+
+        if received_message is not None and not self._checkin_response.done():
+            self._checkin_response.set_result(received_message)
+
+    @HelyOSClient.auth_required
+    async def publish(self, routing_key, message, signed=False, reply_to=None, corr_id=None, exchange=AGENTS_UL_EXCHANGE,
+                      payload_format=envelope.JSON):
+        """ Publish message in RabbitMQ without blocking the event loop.
+
+            Same parameters and message envelope as :meth:`HelyOSClient.publish`. In confirm mode, the coroutine
+            returns once the message is written and returns the future of its broker confirmation.
+        """
+
+        if self.is_reconecting:
+            return None
+
+        signature = None
+        if signed:
+            signature = self.signing_helper.return_signature(message)
+
+        headers = pika.BasicProperties(user_id=self.rbmq_username,
+                                       timestamp=int(time.time()*1000),
+                                       reply_to=reply_to,
+                                       correlation_id=corr_id,
+                                       content_type=envelope.content_type(payload_format))
+
+        body = envelope.encode_envelope(message, signature, payload_format=payload_format,
+                                         compressor=self.compressor)
+
+        while True:
+            try:
+                confirmation = await self._send(exchange, routing_key, body, headers)
+                self.tries = 0
+                break
+
+            except (pika.exceptions.AMQPConnectionError, pika.exceptions.AMQPChannelError):
+                print(f"Connection error when publishing. Reconnecting... try {self.tries}")
+                self.tries += 1
+                if self.tries > 3:
+                    self.tries = 0
+                    raise HelyOSAccountConnectionError("Connection error when publishing.")
+
+                try:
+                    await self.reconnect()
+                except Exception as err:
+                    print(err)
+                await asyncio.sleep(3)  # Wait for a few seconds before reconnecting
+
+        # let the connection flush its output buffer
+        await asyncio.sleep(0)
+        return confirmation
+
+    async def _send(self, exchange, routing_key, body, properties):
+        if self.publisher is not None:
+            return await self.publisher.publish(exchange, routing_key, body, properties)
+        self.channel.basic_publish(exchange, routing_key, body, properties=properties)
+        return None
+
+    async def publish_batch(self, messages, signed=False, exchange=AGENTS_UL_EXCHANGE, wait=False):
+        """ Publish several messages back to back.
+
+            :param messages: (routing_key, message) pairs
+            :type messages: iterable
+            :param signed: If the messages should be signed, defaults to False
+            :type signed: boolean
+            :param exchange: RabbitMQ exchange, defaults to env.AGENTS_UL_EXCHANGE
+            :type exchange: str
+            :param wait: In confirm mode, wait for all confirmations before returning, defaults to False
+            :type wait: boolean
+            :return: the confirmation futures (None items if confirm mode is disabled)
+            :rtype: list
+        """
+        confirmations = [await self.publish(routing_key, message, signed=signed, exchange=exchange)
+                         for routing_key, message in messages]
+        if wait:
+            await self.flush()
+        return confirmations
+
+    async def flush(self, timeout=None):
+        """ Wait until all published messages are confirmed by the broker.
+
+            :param timeout: Seconds to wait, defaults to None (no limit)
+            :type timeout: float
+            :return: number of messages that were rejected or lost
+            :rtype: int
+        """
+        if self.publisher is None:
+            return 0
+        return await self.publisher.flush(timeout)
+
+    def publisher_stats(self):
+        """ Published/acked/nacked counters, confirmed throughput (msg/s) and confirm latency (ms) in confirm mode. """
+        if self.publisher is None:
+            return None
+        return self.publisher.summary()
+
+    def enable_outbox(self, *args, **kwargs):
+        raise HelyOSUnsupportedError('The outbox is only supported by the blocking HelyOSClient: '
+                                     'AsyncHelyOSClient.publish() does not store messages in it.')
+
+    def replay_outbox(self, max_messages=None):
+        raise HelyOSUnsupportedError('The outbox is only supported by the blocking HelyOSClient.')
+
+    def start_io_thread(self, *args, **kwargs):
+        raise HelyOSUnsupportedError('AsyncHelyOSClient has no I/O thread: its connection is served by the event '
+                                     'loop, where publish() already runs.')
+
+    @HelyOSClient.auth_required
+    async def set_assignment_queue(self, exchange=AGENTS_DL_EXCHANGE):
+        self.assignment_queue = await _call_async(self.channel.queue_declare, queue='')
+        await _call_async(self.channel.queue_bind, queue=self.assignment_queue.method.queue,
+                          exchange=exchange, routing_key=self.assignment_routing_key)
+        return self.assignment_queue
+
+    @HelyOSClient.auth_required
+    async def set_instant_actions_queue(self, exchange=AGENTS_DL_EXCHANGE):
+        self.instant_actions_queue = await _call_async(self.channel.queue_declare, queue='')
+        await _call_async(self.channel.queue_bind, queue=self.instant_actions_queue.method.queue,
+                          exchange=exchange, routing_key=self.instant_actions_routing_key)
+        return self.instant_actions_queue
+
+    @HelyOSClient.auth_required
+    async def consume_assignment_messages(self, assignment_callback):
+        await self.set_assignment_queue()
+        await self._basic_consume(self.assignment_queue.method.queue, assignment_callback)
+        self._consumers['assignment'] = assignment_callback
+
+    @HelyOSClient.auth_required
+    async def consume_instant_actions_messages(self, instant_actions_callback):
+        """ Receive instant actions messages.
+            Instant actions are used by helyOS to reserve, release or cancel an assignment.
+
+            :param instant_actions_callback: call back for instant actions
+            :type instant_actions_callback: func
+
+        """
+        await self.set_instant_actions_queue()
+        await self._basic_consume(self.instant_actions_queue.method.queue, instant_actions_callback)
+        self._consumers['instant_actions'] = instant_actions_callback
+
+    async def restore_consumers(self):
+        """ See :meth:`HelyOSClient.restore_consumers`. Await it after `reconnect()`. """
+        if 'assignment' in self._consumers:
+            await self.consume_assignment_messages(self._consumers['assignment'])
+        if 'instant_actions' in self._consumers:
+            await self.consume_instant_actions_messages(self._consumers['instant_actions'])
+
+    async def _basic_consume(self, queue, callback):
+        if self.acknowledger is None:
+            return await _call_async(self.channel.basic_consume, queue=queue, auto_ack=True,
+                                     on_message_callback=callback)
+        if self.acknowledger.prefetch_count:
+            await _call_async(self.channel.basic_qos, prefetch_count=self.acknowledger.prefetch_count)
+        return await _call_async(self.channel.basic_consume, queue=queue, auto_ack=False,
+                                 on_message_callback=self.acknowledger.wrap(callback))
+
+    def enable_manual_ack(self, prefetch_count=10, batch_size=1, max_delay=0.05, requeue=True):
+        """ See :meth:`HelyOSClient.enable_manual_ack`. The tasks of coroutine callbacks are acknowledged when done.
+            Call it from the event loop.
+        """
+        loop = asyncio.get_running_loop()
+        self.acknowledger = Acknowledger(prefetch_count, batch_size, max_delay, requeue,
+                                         call_later=loop.call_later, threadsafe=loop.call_soon_threadsafe)
+        return self.acknowledger
+
+    async def start_listening(self):
+        """ Wait until `stop_listening()` is called. Deliveries are dispatched by the event loop meanwhile. """
+        self._listening = asyncio.get_running_loop().create_future()
+        await self._listening
+
+    def stop_listening(self):
+        if self._listening is not None and not self._listening.done():
+            self._listening.set_result(None)
+
+    async def close_connection(self):
+        """ Close the AMQP connection with RabbitMQ server """
+        self._closing = True
+        self.stop_listening()
+        if self.connection.is_open:
+            closed = asyncio.get_running_loop().create_future()
+            self.connection.add_on_close_callback(lambda *args: closed.done() or closed.set_result(None))
+            self.connection.close()
+            await closed
+        self._closing = False
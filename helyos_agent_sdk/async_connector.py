@@ -0,0 +1,156 @@
+import asyncio
+import inspect
+import logging
+from .connector import AgentConnector, parse_assignment_message, parse_instant_actions
+from .dispatcher import AsyncCallbackDispatcher
+
+
+class AsyncAgentConnector(AgentConnector):
+    # coroutine callbacks run as tasks: a cancel message is consumed while an assignment awaits
+    _callbacks_block_consumer = False
+
+    def __init__(self, helyos_client, pose=None, encrypted=False, payload_formats=None):
+        """ Asyncio Agent Connector class
+
+            Usage:
+            helyos_client = AsyncHelyOSClient('rabbitmq.host.com', 5672, uuid='123-456')
+            await helyos_client.connect('my_username', 'secret_password')
+            await helyos_client.perform_checkin(yard_uid='1')
+            await helyos_client.get_checkin_result()
+            agent_connector = AsyncAgentConnector(helyos_client)
+
+            Asyncio variant of :class:`AgentConnector` to be used with :class:`AsyncHelyOSClient` or
+            :class:`AsyncHelyOSMQTTClient`. The publish methods are coroutines and the callbacks can be either
+            plain functions or coroutine functions; coroutines are scheduled as tasks on the event loop so that a
+            long-running handler does not hold back further deliveries.
+
+            The publish methods return the result of the client's `publish()`: with `publisher_confirms=True`, the
+            future of the broker confirmation of the message.
+
+            :param helyos_client: Instance of an asyncio HelyOS Client. The instance should be "checked in".
+            :type helyos_client: AsyncHelyOSClient
+            :param pose:  (Optional) save the initial agent position in AgentConnector.agent_pose.
+            :type pose: Pose
+            :param encrypted: Set if the published messages should be encrypted, defaults to False.
+            :type encrypted: bool
+            :param payload_formats: Payload format per agent message type, see :class:`AgentConnector`.
+            :type payload_formats: dict
+
+        """
+        super().__init__(helyos_client, pose, encrypted, payload_formats)
+        self._tasks = set()
+
+    def _schedule(self, result):
+        """ Run the result of a coroutine callback as a task and keep a reference to it until it is done. """
+        if inspect.isawaitable(result):
+            task = asyncio.ensure_future(result)
+            self._tasks.add(task)
+            task.add_done_callback(self._on_task_done)
+            return task
+        return result
+
+    def _on_task_done(self, task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logging.error('Error occurred in asynchronous callback.', exc_info=task.exception())
+
+    async def consume_instant_action_messages(self, reserve_callback=None, release_callback=None, cancel_callback=None,  other_callback=None):
+        """Register the callback functions for instant actions. See :meth:`AgentConnector.consume_instant_action_messages`.
+           The callbacks may be coroutine functions.
+        """
+
+        if cancel_callback is not None:
+            self.cancel_callback = cancel_callback
+        if reserve_callback is not None:
+            self.reserve_callback = reserve_callback
+        if release_callback is not None:
+            self.release_callback = release_callback
+        if other_callback is not None:
+            self.other_instant_actions_callback = other_callback
+
+        def amqp_callback(ch, method, properties, message):
+            return self._schedule(parse_instant_actions(self, ch, properties, received_str=message))
+
+        def mqtt_callback(ch, userdata, message):
+            return self._schedule(parse_instant_actions(self, ch, {'user_id': None}, received_str=message.payload,
+                                                        text_payload=True))
+
+        if self.helyos_client._protocol == 'AMQP':
+            callback = amqp_callback
+
+        if self.helyos_client._protocol == 'MQTT':
+            callback = mqtt_callback
+
+        await self.helyos_client.consume_instant_actions_messages(callback)
+
+    async def consume_assignment_messages(self, assignment_callback=None, other_callback=None):
+        """Register the callback functions for assignments. See :meth:`AgentConnector.consume_assignment_messages`.
+           The callbacks may be coroutine functions.
+        """
+
+        if assignment_callback is not None:
+            self.assignment_callback = assignment_callback
+        if other_callback is not None:
+            self.other_assignment_callback = other_callback
+
+        def amqp_callback(ch, method, properties, message):
+            return self._schedule(parse_assignment_message(self, ch, properties, received_str=message))
+
+        def mqtt_callback(ch, userdata, message):
+            return self._schedule(parse_assignment_message(self, ch, {'user_id': None}, received_str=message.payload,
+                                                           text_payload=True))
+
+        if self.helyos_client._protocol == 'AMQP':
+            callback = amqp_callback
+
+        if self.helyos_client._protocol == 'MQTT':
+            callback = mqtt_callback
+
+        await self.helyos_client.consume_assignment_messages(callback)
+
+    def enable_dispatcher(self, max_in_flight=100, max_queued=1000):
+        """ Run the callbacks as tasks, at most `max_in_flight` at a time and in order per work process, with at most
+            `max_queued` callbacks waiting or running. See :class:`AsyncCallbackDispatcher`.
+        """
+        self.dispatcher = AsyncCallbackDispatcher(max_in_flight, max_queued)
+        return self.dispatcher
+
+    def disable_dispatcher(self):
+        self.dispatcher = None
+
+    async def start_listening(self):
+        await self.helyos_client.start_listening()
+
+    def stop_listening(self):
+        self.helyos_client.stop_listening()
+
+    async def publish_general_updates(self, body={}, signed=False):
+        """ Asynchronous version of :meth:`AgentConnector.publish_general_updates`.
+
+            :return: the result of the client's `publish()`
+        """
+        return await super().publish_general_updates(body, signed)
+
+    async def publish_state(self, status, resources=None, assignment_status=None, signed=False):
+        """ Asynchronous version of :meth:`AgentConnector.publish_state`.
+
+            :return: the result of the client's `publish()`
+        """
+        return await super().publish_state(status, resources, assignment_status, signed)
+
+    async def publish_sensors(self, x, y, z, orientations, sensors={}, signed=False):
+        """ Asynchronous version of :meth:`AgentConnector.publish_sensors`.
+
+            :return: the result of the client's `publish()`, None if the message is suppressed by the sensor dead-bands
+        """
+        result = super().publish_sensors(x, y, z, orientations, sensors, signed)
+        if result is None:  # suppressed by the sensor dead-bands
+            return None
+        return await result
+
+    async def request_mission(self, mission_name, data, agent_uuids=[],  signed=False):
+        """ Asynchronous version of :meth:`AgentConnector.request_mission`.
+
+            :return: the result of the client's `publish()`
+        """
+        return await super().request_mission(mission_name, data, agent_uuids, signed)
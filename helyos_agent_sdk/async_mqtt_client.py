@@ -0,0 +1,300 @@
+import asyncio
+from . import envelope
+import time
+import paho.mqtt.client as mqtt
+from .exceptions import *
+from .mqtt_client import HelyOSMQTTClient, create_mqtt_client, AGENTS_DL_EXCHANGE, AGENTS_MQTT_EXCHANGE, REGISTRATION_TOKEN
+from .async_client import parse_checkin_response
+from .crypto import public_key_format, RSA
+from .connection_profile import ASYNC_PROFILE, DEFAULT_PROFILE, TEMPORARY_PROFILE
+
+
+class AsyncioMQTTHelper():
+    """ Drive the paho network loop from an asyncio event loop instead of a background thread. """
+
+    def __init__(self, loop, client):
+        self.loop = loop
+        self.client = client
+        self.misc = None
+        client.on_socket_open = self.on_socket_open
+        client.on_socket_close = self.on_socket_close
+        client.on_socket_register_write = self.on_socket_register_write
+        client.on_socket_unregister_write = self.on_socket_unregister_write
+
+    def on_socket_open(self, client, userdata, sock):
+        self.loop.add_reader(sock, client.loop_read)
+        self.misc = self.loop.create_task(self.misc_loop())
+
+    def on_socket_close(self, client, userdata, sock):
+        self.loop.remove_reader(sock)
+        if self.misc is not None:
+            self.misc.cancel()
+
+    def on_socket_register_write(self, client, userdata, sock):
+        self.loop.add_writer(sock, client.loop_write)
+
+    def on_socket_unregister_write(self, client, userdata, sock):
+        self.loop.remove_writer(sock)
+
+    async def misc_loop(self):
+        # keep-alive pings and retries
+        while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                break
+
+
+async def connect_mqtt_async(rabbitmq_host, rabbitmq_port, username, passwd, enable_ssl=False, ca_certificate=None, temporary=False,
+                             profile=None):
+    """ Connect a paho client whose network loop runs on the running event loop.
+
+        Same parameters as :func:`helyos_agent_sdk.mqtt_client.connect_mqtt`.
+    """
+    loop = asyncio.get_running_loop()
+    mqtt_client = create_mqtt_client(username, passwd, enable_ssl, ca_certificate, temporary)
+    AsyncioMQTTHelper(loop, mqtt_client)
+    connected = loop.create_future()
+
+    def on_connect(client, userdata, flags, rc):
+        if connected.done():
+            return
+        if rc == mqtt.CONNACK_ACCEPTED:
+            connected.set_result(client)
+        else:
+            connected.set_exception(Exception(mqtt.connack_string(rc)))
+
+    mqtt_client.on_connect = on_connect
+    if profile is None:
+        profile = TEMPORARY_PROFILE if temporary else DEFAULT_PROFILE
+    mqtt_client.connect(rabbitmq_host, rabbitmq_port, keepalive=profile.mqtt_keepalive)
+    profile.apply_to_socket(mqtt_client.socket())
+    try:
+        return await asyncio.wait_for(connected, 3.0)
+    except asyncio.TimeoutError:
+        mqtt_client.disconnect()
+        raise Exception('not connected')
+
+
+class AsyncHelyOSMQTTClient(HelyOSMQTTClient):
+
+    def __init__(self, rabbitmq_host, rabbitmq_port=1883, uuid=None, enable_ssl=False, ca_certificate=None,
+                 helyos_public_key=None, agent_privkey=None, agent_pubkey=None, signature_algorithm=RSA,
+                 keystore=None, connection_profile=None):
+        """ HelyOS asyncio MQTT client class
+
+            Asyncio variant of :class:`HelyOSMQTTClient`. The paho network loop is driven by the caller's event loop,
+            so no background thread is started. Topics, envelope and headers are the same as in the blocking client.
+
+            The parameters are the same as in :class:`HelyOSMQTTClient`; `connection_profile` defaults to
+            ASYNC_PROFILE.
+        """
+        super().__init__(rabbitmq_host, rabbitmq_port, uuid, enable_ssl, ca_certificate,
+                         helyos_public_key, agent_privkey, agent_pubkey, signature_algorithm, keystore,
+                         connection_profile or ASYNC_PROFILE)
+        self.guest_channel = None
+        self.checkin_timeout = 60
+        self._checkin_response = None
+        self._checkin_error = None
+        self._pending_credentials = None
+        self._listening = None
+
+    async def reconnect(self):
+        self.is_reconecting = True
+        try:
+            await self.connect(self.rbmq_username, self.rbmq_password)
+        finally:
+            self.is_reconecting = False
+
+    async def connect(self, username, password):
+        """
+        Creates the connection between agent and the message broker server.
+
+        :param username:  username previously registered in RabbitMQ server
+        :type username: str
+        :param password: password previously registered in RabbitMQ server'
+        :type password: str
+        """
+        try:
+            self.connection = await connect_mqtt_async(self.rabbitmq_host, self.rabbitmq_port,
+                                                       username, password, self.enable_ssl, self.ca_certificate,
+                                                       profile=self.connection_profile)
+            self.channel = self.connection
+            self.rbmq_username = username
+            self.rbmq_password = password
+
+        except Exception as inst:
+            print(inst)
+            raise HelyOSAccountConnectionError(
+                f'Not able to connect as {username}.')
+
+    async def perform_checkin(self, yard_uid, status='free', agent_data={}, signed=False, checkin_guard_interceptor=None):
+        """
+        Asynchronous version of :meth:`HelyOSMQTTClient.perform_checkin`. Await `get_checkin_result()` afterwards to
+        receive the check-in data.
+        """
+        if not self.connection:
+            raise HelyOSAnonymousConnectionError(
+                'Anonymous check-in is implemented only for AMPQ agents. You must manually create an account.')
+
+        if checkin_guard_interceptor:
+            self.checkin_guard_interceptor = checkin_guard_interceptor
+
+        self._checkin_response = asyncio.get_running_loop().create_future()
+        self._checkin_error = None
+        self.guest_channel = self.channel
+        temp_topic = f'agent/{self.uuid}/checkinresponse'
+        self.checkin_response_queue = temp_topic
+        self.guest_channel.subscribe(temp_topic)
+        self.guest_channel.message_callback_add(temp_topic, self.__checkin_callback_wrapper)
+
+        self.yard_uid = yard_uid
+        checkin_msg = {'type': 'checkin',
+                       'uuid': self.uuid,
+                       'body': {'yard_uid': yard_uid,
+                                'status': status,
+                                'public_key': self.public_key.decode('utf-8'),
+                                'public_key_format': public_key_format(self.signing_helper.algorithm),
+                                'registration_token': REGISTRATION_TOKEN,
+                                **agent_data},
+                       }
+
+        message = envelope.dumps(checkin_msg, canonical=True)
+        signature = None
+        if signed:
+            signature = list(self.signing_helper.return_signature(message))
+
+        body = envelope.encode_envelope(message, signature, headers={'timestamp': int(time.time()*1000),
+                                                                     'replyTo': self.checkin_response_queue,
+                                                                     'reply_to': self.checkin_response_queue,
+                                                                     'user_id': self.rbmq_username})
+
+        self.guest_channel.publish(self.checking_routing_key, payload=body)
+
+    async def get_checkin_result(self, timeout=None):
+        """ Wait for the check-in response published by helyOS and save it into the client instance as `checkin_data`.
+
+            :param timeout: Seconds to wait for the response, defaults to `checkin_timeout`
+            :type timeout: float
+        """
+        self.tries = 0
+        try:
+            await asyncio.wait_for(asyncio.shield(self._checkin_response), timeout or self.checkin_timeout)
+        except asyncio.TimeoutError:
+            if self._checkin_error is not None:
+                raise self._checkin_error
+            raise HelyOSCheckinError('Check in refused: no response from helyOS')
+        finally:
+            self.guest_channel.message_callback_remove(self.checkin_response_queue)
+            self.guest_channel.unsubscribe(self.checkin_response_queue)
+
+        if self._pending_credentials:
+            username, password = self._pending_credentials
+            self._pending_credentials = None
+            self.connection.disconnect()
+            await self.connect(username, password)
+
+        return self.checkin_data
+
+    def __checkin_callback_wrapper(self, client, userdata, message):
+        try:
+            received_message = parse_checkin_response(self, client, None, message.payload)
+        except Exception as inst:
+            print('error check-in callback', inst)
+            self._checkin_error = inst
+            if not self._checkin_response.done():
+                self._checkin_response.set_exception(inst)
+            return
+
+        if received_message is not None and not self._checkin_response.done():
+            self._checkin_response.set_result(received_message)
+
+    @HelyOSMQTTClient.auth_required
+    async def publish(self, routing_key, message, signed=False, reply_to=None, corr_id=None, exchange=AGENTS_MQTT_EXCHANGE,
+                      payload_format=envelope.JSON):
+        """ Publish message in RabbitMQ-MQTT without blocking the event loop.
+
+            Same parameters and message envelope as :meth:`HelyOSMQTTClient.publish`.
+        """
+
+        if self.is_reconecting:
+            return
+
+        signature = None
+        if signed:
+            signature = self.signing_helper.return_signature(message)
+
+        headers = {'user_id': self.rbmq_username,
+                   'timestamp': int(time.time()*1000),
+                   'reply_to': reply_to,
+                   'correlation_id': corr_id}
+
+        body = envelope.encode_envelope(message, signature, headers, payload_format, self.compressor)
+
+        while True:
+            try:
+                result = self.channel.publish(routing_key, payload=body)
+                if result.rc != mqtt.MQTT_ERR_SUCCESS:
+                    raise Exception("Error when publishing.")
+                self.tries = 0
+                break
+
+            except Exception:
+                print(f"Connection error when publishing. Reconnecting... try {self.tries}")
+                self.tries += 1
+                if self.tries > 3:
+                    self.tries = 0
+                    raise HelyOSAccountConnectionError("Connection error when publishing.")
+
+                try:
+                    await self.reconnect()
+                except Exception as err:
+                    print(err)
+                await asyncio.sleep(3)  # Wait for a few seconds before reconnecting
+
+        # let the event loop write the packet
+        await asyncio.sleep(0)
+
+    @HelyOSMQTTClient.auth_required
+    async def set_assignment_queue(self, exchange=AGENTS_DL_EXCHANGE):
+        """ There are no queues in MQTT protocol """
+        return None
+
+    @HelyOSMQTTClient.auth_required
+    async def set_instant_actions_queue(self, exchange=AGENTS_DL_EXCHANGE):
+        """ There are no queues in MQTT protocol """
+        return None
+
+    @HelyOSMQTTClient.auth_required
+    async def consume_assignment_messages(self, assignment_callback):
+        """ Subscribe to the MQTT assignment topic """
+        mqtt_topic = self.assignment_routing_key
+        self.channel.subscribe(mqtt_topic)
+        self.channel.message_callback_add(mqtt_topic, assignment_callback)
+
+    @HelyOSMQTTClient.auth_required
+    async def consume_instant_actions_messages(self, instant_actions_callback):
+        """ Receive instant actions messages.
+            Instant actions are used by helyOS to reserve, release or cancel an assignment.
+
+            :param instant_actions_callback: call back for instant actions
+            :type instant_actions_callback: func
+
+        """
+        mqtt_topic = self.instant_actions_routing_key
+        self.channel.subscribe(mqtt_topic)
+        self.channel.message_callback_add(mqtt_topic, instant_actions_callback)
+
+    async def start_listening(self):
+        """ Wait until `stop_listening()` is called. Deliveries are dispatched by the event loop meanwhile. """
+        self._listening = asyncio.get_running_loop().create_future()
+        await self._listening
+
+    def stop_listening(self):
+        if self._listening is not None and not self._listening.done():
+            self._listening.set_result(None)
+
+    async def close_connection(self):
+        """ Close the MQTT connection with RabbitMQ server """
+        self.stop_listening()
+        self.connection.disconnect()
@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from .metrics import LatencyHistogram
+from .exceptions import HelyOSCancelledError
+
+
+def assignment_id(message):
+    """ Assignment id of a parsed assignment or cancel message, or None. """
+    body = getattr(message, 'body', None)
+    if isinstance(body, dict) and body.get('assignment_id', None) is not None:
+        return body['assignment_id']
+    metadata = getattr(message, 'metadata', None)
+    if isinstance(metadata, dict):
+        return metadata.get('id', None)
+    return getattr(metadata, 'id', None)
+
+
+class CancelToken():
+
+    def __init__(self, assignment_id=None):
+        """ Cooperative cancellation of a running assignment
+
+            Set by the connector as soon as helyOS cancels the assignment, before the cancel callback runs. The
+            assignment handler polls `cancelled`, blocks on `wait()`, awaits `wait_async()` or registers a callback.
+            The blocking :class:`AgentConnector` can only set it during the assignment callback when the callbacks run
+            on its dispatcher (:meth:`AgentConnector.enable_dispatcher`).
+
+            .. code-block:: python
+
+                def my_assignment_callback(ch, sender, assignment, message_str, signature):
+                    token = agent_connector.cancel_token(assignment)
+                    for step in plan(assignment):
+                        token.raise_if_cancelled()
+                        drive(step)
+
+            :param assignment_id: Assignment id
+            :type assignment_id: int
+        """
+        self.assignment_id = assignment_id
+        self.message = None
+        self.cancelled_at = None
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self, message=None):
+        """ Cancel the assignment and run the registered callbacks; later calls are ignored. """
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.message = message
+            self.cancelled_at = time.monotonic()
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception:
+                logging.exception('Error occurred in cancel token callback.')
+
+    def add_callback(self, callback):
+        """ Call callback(token) when the assignment is cancelled, at once if it already is. """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def wait(self, timeout=None):
+        """ Block until the assignment is cancelled; return False on timeout. """
+        return self._event.wait(timeout)
+
+    async def wait_async(self):
+        """ Wait on the event loop until the assignment is cancelled. """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def wake(token):
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(token))
+
+        self.add_callback(wake)
+        return await future
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise HelyOSCancelledError(f'Assignment {self.assignment_id} was cancelled.')
+
+
+class CancelLane():
+
+    def __init__(self, max_tokens=256):
+        """ Cancel tokens and cancellation latency of an :class:`AgentConnector`
+
+            Cancel instant actions do not wait behind the assignment callbacks: the cancel token of the assignment is
+            set on the consuming thread as soon as the message is parsed, and the cancel callback bypasses the queues
+            of the connector's dispatcher. Reserve and release instant actions stay in order with the assignments of
+            their work process. The tokens of the last `max_tokens` assignments are kept; a cancellation received
+            before its assignment is kept too.
+
+            `summary()` reports the time from reception to the start of the cancel callback (`handler_latency`), and
+            from the message timestamp to the cancel token (`delivery_latency`), which depends on the clock offset
+            between helyOS and the agent.
+
+            :param max_tokens: Number of cancel tokens kept, defaults to 256
+            :type max_tokens: int
+        """
+        self.max_tokens = max_tokens
+        self.cancels = 0
+        self.handler_latency = LatencyHistogram()
+        self.delivery_latency = LatencyHistogram()
+        self._tokens = OrderedDict()
+        self._lock = threading.Lock()
+
+    def token(self, assignment_id):
+        """ Return the cancel token of an assignment, creating it if needed. """
+        if assignment_id is None:
+            return CancelToken()
+        with self._lock:
+            token = self._tokens.get(assignment_id, None)
+            if token is None:
+                token = self._tokens[assignment_id] = CancelToken(assignment_id)
+                while len(self._tokens) > self.max_tokens:
+                    self._tokens.popitem(last=False)
+            else:
+                self._tokens.move_to_end(assignment_id)
+            return token
+
+    def cancel(self, message, timestamp=None):
+        """ Set the cancel token of the assignment of a cancel message.
+
+            :param timestamp: Publication time in ms since the epoch (AMQP `timestamp` property), defaults to None
+        """
+        self.token(assignment_id(message)).cancel(message)
+        with self._lock:
+            self.cancels += 1
+            if timestamp:
+                self.delivery_latency.record(max(0.0, time.time() - timestamp / 1000))
+
+    def record_handler(self, received_at):
+        with self._lock:
+            self.handler_latency.record(time.monotonic() - received_at)
+
+    def summary(self):
+        """ Cancellations, tokens kept and latencies. """
+        with self._lock:
+            return {'cancels': self.cancels,
+                    'tokens': len(self._tokens),
+                    'handler_latency': self.handler_latency.summary(),
+                    'delivery_latency': self.delivery_latency.summary()}
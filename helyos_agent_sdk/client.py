@@ -2,11 +2,18 @@ import time
 from functools import wraps
 import pika
 import os
-import json
+from . import envelope
+from .compression import PayloadCompressor, DEFAULT_THRESHOLD
+from .outbox import Outbox, is_sensor_message
+import logging
 import ssl
 from .exceptions import *
 from helyos_agent_sdk.models import AGENT_STATE, CheckinResponseMessage
-from .crypto import Signing, generate_private_public_keys
+from .crypto import public_key_format, RSA
+from .keystore import AgentKeysMixin
+from .io_thread import AMQPIOThread
+from .acks import Acknowledger
+from .connection_profile import DEFAULT_PROFILE, TEMPORARY_PROFILE
 
 AGENTS_UL_EXCHANGE = os.environ.get(
     'AGENTS_UL_EXCHANGE', 'xchange_helyos.agents.ul')
@@ -18,7 +25,9 @@ REGISTRATION_TOKEN = os.environ.get(
     'REGISTRATION_TOKEN', '0000-0000-0000-0000-0000')
 
 
-def connect_rabbitmq(rabbitmq_host, rabbitmq_port, username, passwd, enable_ssl=False, ca_certificate=None, temporary=False):
+def rabbitmq_connection_parameters(rabbitmq_host, rabbitmq_port, username, passwd, enable_ssl=False, ca_certificate=None, temporary=False,
+                                   profile=None):
+    """ Build the pika connection parameters shared by the blocking and the asyncio clients. """
     credentials = pika.PlainCredentials(username, passwd)
     if enable_ssl:
         context = ssl.create_default_context(cadata=ca_certificate)
@@ -33,21 +42,33 @@ def connect_rabbitmq(rabbitmq_host, rabbitmq_port, username, passwd, enable_ssl=
     else:
         ssl_options = None
 
-    if temporary:
-        params = pika.ConnectionParameters(rabbitmq_host,  rabbitmq_port, '/', credentials, heartbeat=60, blocked_connection_timeout=60,
-                                           ssl_options=ssl_options)
-    else:
-        params = pika.ConnectionParameters(rabbitmq_host,  rabbitmq_port, '/', credentials, heartbeat=3600,
-                                           ssl_options=ssl_options)
+    if profile is None:
+        profile = TEMPORARY_PROFILE if temporary else DEFAULT_PROFILE
+    params = pika.ConnectionParameters(rabbitmq_host,  rabbitmq_port, '/', credentials, ssl_options=ssl_options,
+                                       **profile.pika_parameters())
+    return params
+
+
+def connect_rabbitmq(rabbitmq_host, rabbitmq_port, username, passwd, enable_ssl=False, ca_certificate=None, temporary=False,
+                     profile=None):
+    """ Open a pika BlockingConnection.
+
+        :param profile: Heartbeat, blocked-connection timeout and socket options, defaults to DEFAULT_PROFILE, or
+                        TEMPORARY_PROFILE for temporary connections
+        :type profile: ConnectionProfile
+    """
+    params = rabbitmq_connection_parameters(rabbitmq_host, rabbitmq_port, username, passwd,
+                                            enable_ssl, ca_certificate, temporary, profile)
     _connection = pika.BlockingConnection(params)
     return _connection
 
 
 
-class HelyOSClient():
+class HelyOSClient(AgentKeysMixin):
 
     def __init__(self, rabbitmq_host, rabbitmq_port=5672, uuid=None, enable_ssl=False, ca_certificate=None,
-                 helyos_public_key=None, agent_privkey=None, agent_pubkey=None ):
+                 helyos_public_key=None, agent_privkey=None, agent_pubkey=None, signature_algorithm=RSA,
+                 keystore=None, connection_profile=None):
         """ HelyOS client class
 
             The client implements several functions to facilitate the
@@ -73,6 +94,17 @@ class HelyOSClient():
             :type agent_privkey:  string (PEM format), optional
             :param agent_pubkey: Agent RSA public key is saved in helyOS core, defaults to None
             :type agent_pubkey:  string (PEM format), optional
+            :param signature_algorithm: Algorithm of the keys generated when no keys are provided: crypto.RSA,
+                                        crypto.ED25519 or crypto.ECDSA_P256, defaults to RSA. It is announced to helyOS
+                                        in the check-in `public_key_format`.
+            :type signature_algorithm: str, optional
+            :param keystore: Keystore (or keystore directory) where the agent keys are loaded from or stored in,
+                             keyed by uuid, when no keys are provided. Without keystore, the keys are generated
+                             in memory. In both cases, keys are only loaded or generated when first used.
+            :type keystore: AgentKeystore, str, optional
+            :param connection_profile: Heartbeat, blocked-connection timeout and socket options of the account
+                                       connection, defaults to DEFAULT_PROFILE (see :class:`ConnectionProfile`)
+            :type connection_profile: ConnectionProfile, optional
 
         """
         self.rabbitmq_host = rabbitmq_host
@@ -92,26 +124,69 @@ class HelyOSClient():
         self.is_reconecting = False
         self.rbmq_username = None
         self.rbmq_password = None
-
-        if agent_pubkey is None or agent_privkey is None:
-            self.private_key, self.public_key = generate_private_public_keys()
-        else:
-            self.private_key, self.public_key = agent_privkey, agent_pubkey
-
-        self.signing_helper = Signing(self.private_key)
+        self.io_thread = None
+        self.compressor = None
+        self.outbox = None
+        self.acknowledger = None
+        self._consumers = {}  # queue kind -> callback, registered again after reconnections
+        self.connection_profile = connection_profile
+        self.is_blocked = False
+        self.reconnection_interval = 3
+        self._next_reconnection = 0
+
+        self._init_agent_keys(agent_privkey, agent_pubkey, signature_algorithm, keystore)
 
         self.rabbitmq_host = rabbitmq_host
         self.rabbitmq_port = rabbitmq_port
 
     @property
     def is_connection_open(self):
-        """ Check if the connection is open """
-        try:
-            self.connection.sleep(0.01)
-        except:
-            return False 
+        """ Check if the connection is open.
+
+            Cheap: returns the state last seen by pika when it processed broker events, without doing any I/O. Use
+            `check_connection()` to process pending broker events first.
+        """
+        return self.connection is not None and self.connection.is_open
+
+    @property
+    def connection_state(self):
+        """ 'open', 'blocked' (by the broker's flow control), 'reconnecting' or 'closed', without doing any I/O. """
+        if self.is_reconecting:
+            return 'reconnecting'
+        if not self.is_connection_open:
+            return 'closed'
+        return 'blocked' if self.is_blocked else 'open'
+
+    def check_connection(self):
+        """ Process pending broker events without waiting, then return `is_connection_open`.
+
+            With the I/O thread, which processes the events continuously, it only returns the cached state.
+        """
+        if self.connection is None:
+            return False
+        if self.io_thread is None or not self.io_thread.is_alive:
+            try:
+                self.connection.process_data_events(time_limit=0)
+            except Exception:
+                return False
         return self.connection.is_open
 
+    def _watch_connection(self, connection):
+        """ Track the flow-control state of a new account connection. """
+        self.is_blocked = False
+
+        def on_blocked(blocked_connection, method_frame):
+            if blocked_connection is self.connection:
+                logging.warning('The broker is blocking the connection (flow control).')
+                self.is_blocked = True
+
+        def on_unblocked(unblocked_connection, method_frame):
+            if unblocked_connection is self.connection:
+                self.is_blocked = False
+
+        connection.add_on_connection_blocked_callback(on_blocked)
+        connection.add_on_connection_unblocked_callback(on_unblocked)
+
     @property
     def checking_routing_key(self):
         """ Routing key value used for check in messages """
@@ -199,6 +274,16 @@ class HelyOSClient():
 
         return wrap
 
+    def io_thread_bound(func):  # pylint: disable=no-self-argument
+        """ Run the decorated method on the I/O thread when the I/O thread mode is active. """
+        @wraps(func)
+        def wrap(self, *args, **kwargs):
+            if self.io_thread is not None:
+                return self.io_thread.call(func, self, *args, **kwargs)  # pylint: disable=not-callable
+            return func(self, *args, **kwargs)  # pylint: disable=not-callable
+
+        return wrap
+
     def __connect_as_anonymous(self):
 
         # step 1 - connect anonymously
@@ -231,8 +316,10 @@ class HelyOSClient():
     
     def reconnect(self):
         self.is_reconecting = True
-        self.connect(self.rbmq_username, self.rbmq_password)
-        self.is_reconecting = False
+        try:
+            self.connect(self.rbmq_username, self.rbmq_password)
+        finally:
+            self.is_reconecting = False
 
 
     def connect(self, username, password):
@@ -252,8 +339,9 @@ class HelyOSClient():
         """
         print("connecting... ")
         try:
-            self.connection = connect_rabbitmq(self.rabbitmq_host,
-                                               self.rabbitmq_port, username, password, self.enable_ssl, self.ca_certificate)
+            self.connection = connect_rabbitmq(self.rabbitmq_host, self.rabbitmq_port, username, password,
+                                               self.enable_ssl, self.ca_certificate, profile=self.connection_profile)
+            self._watch_connection(self.connection)
             self.channel = self.connection.channel()
             self.rbmq_username = username
             self.rbmq_password = password 
@@ -306,17 +394,17 @@ class HelyOSClient():
                         'body': {'yard_uid': yard_uid,
                                 'status': status,
                                 'public_key': self.public_key.decode('utf-8'),
-                                'public_key_format': 'PEM',
+                                'public_key_format': public_key_format(self.signing_helper.algorithm),
                                 'registration_token': REGISTRATION_TOKEN,
                                 **agent_data},
                         }
         
-        message = json.dumps(checkin_msg, sort_keys=True)
+        message = envelope.dumps(checkin_msg, canonical=True)
         signature = None
         if signed:
             signature = self.signing_helper.return_signature(message).hex()
 
-        body = json.dumps({'message': message, 'signature': signature}, sort_keys=True)
+        body = envelope.encode_envelope(message, signature)
 
         self.guest_channel.basic_publish(exchange=AGENT_ANONYMOUS_EXCHANGE,
                                          routing_key=self.checking_routing_key,
@@ -335,10 +423,7 @@ class HelyOSClient():
                 channel.stop_consuming()
 
     def __checkin_callback(self, ch, properties, received_str):
-        payload = json.loads(received_str)
-        received_message_str = payload['message']
-        signature = payload['signature']
-        received_message = json.loads(received_message_str)
+        received_message, received_message_str, signature = envelope.decode_message(received_str)
         sender = None
         if hasattr(properties, 'user_id'):
             sender = properties.user_id
@@ -371,7 +456,9 @@ class HelyOSClient():
 
         if password:
             self.connection = connect_rabbitmq(
-                self.rabbitmq_host, self.rabbitmq_port, body['rbmq_username'], password, self.enable_ssl, self.ca_certificate)
+                self.rabbitmq_host, self.rabbitmq_port, body['rbmq_username'], password, self.enable_ssl, self.ca_certificate,
+                profile=self.connection_profile)
+            self._watch_connection(self.connection)
             self.channel = self.connection.channel()
             self.rbmq_username = body['rbmq_username']
             self.rbmq_password = password
@@ -387,32 +474,52 @@ class HelyOSClient():
             self.checkin_data = body
 
     @auth_required
-    def publish(self, routing_key, message, signed=False, reply_to=None, corr_id=None, exchange=AGENTS_UL_EXCHANGE):
+    def publish(self, routing_key, message, signed=False, reply_to=None, corr_id=None, exchange=AGENTS_UL_EXCHANGE,
+                payload_format=envelope.JSON):
         """ Publish message in RabbitMQ
-            :param message: Message to be transmitted
-            :type message: str
+            :param message: Message to be transmitted, serialized in `payload_format`
+            :type message: str, bytes
             :param routing_key: RabbitMQ routing_key
             :type routing_key: str
             :param signed: If this message should be signed, defaults to False
             :type signed: boolean
             :param exchange: RabbitMQ exchange, defaults to env.AGENTS_UL_EXCHANGE
             :type exchange: str
+            :param payload_format: Envelope format, 'json', 'msgpack' or 'cbor', signalled in the content_type property;
+                                   defaults to 'json'
+            :type payload_format: str
+
+            With the outbox enabled (`enable_outbox()`), messages that cannot be published are stored on disk
+            instead of being lost, and the call does not wait for the reconnection.
+
+            Publisher confirms are not used: pika's BlockingChannel waits for the confirmation of each message before
+            publishing the next one. Use :class:`AsyncHelyOSClient` with `publisher_confirms=True` for confirmed,
+            pipelined publishing.
         """
 
-        if self.is_reconecting:
+        if self.is_reconecting and self.io_thread is None and self.outbox is None:
             return
 
         signature = None
         if signed:
-            signature = self.signing_helper.return_signature(message).hex()
+            signature = self.signing_helper.return_signature(message)
         
 
         headers = pika.BasicProperties( user_id=self.rbmq_username, 
                                         timestamp=int(time.time()*1000),
                                         reply_to=reply_to,
-                                        correlation_id=corr_id)
+                                        correlation_id=corr_id,
+                                        content_type=envelope.content_type(payload_format))
         
-        body = json.dumps({'message': message, 'signature': signature}, sort_keys=True)
+        body = envelope.encode_envelope(message, signature, payload_format=payload_format,
+                                         compressor=self.compressor)
+
+        if self.outbox is not None:
+            return self._publish_through_outbox(exchange, routing_key, headers, body)
+
+        if self.io_thread is not None:
+            self.io_thread.enqueue(exchange, routing_key, headers, body)
+            return
 
         is_trying = True
         while is_trying:    
@@ -441,6 +548,7 @@ class HelyOSClient():
                 
 
     @auth_required
+    @io_thread_bound
     def set_assignment_queue(self, exchange=AGENTS_DL_EXCHANGE):
         self.assignment_queue = self.channel.queue_declare(queue='')
         self.channel.queue_bind(queue=self.assignment_queue.method.queue,
@@ -448,6 +556,7 @@ class HelyOSClient():
         return self.assignment_queue
 
     @auth_required
+    @io_thread_bound
     def set_instant_actions_queue(self, exchange=AGENTS_DL_EXCHANGE):
         self.instant_actions_queue = self.channel.queue_declare(queue='')
         self.channel.queue_bind(queue=self.instant_actions_queue.method.queue,
@@ -455,12 +564,14 @@ class HelyOSClient():
         return self.instant_actions_queue
 
     @auth_required
+    @io_thread_bound
     def consume_assignment_messages(self, assignment_callback):
         self.set_assignment_queue()
-        self.channel.basic_consume(queue=self.assignment_queue.method.queue, auto_ack=True,
-                                   on_message_callback=assignment_callback)
+        self._basic_consume(self.assignment_queue.method.queue, assignment_callback)
+        self._consumers['assignment'] = assignment_callback
 
     @auth_required
+    @io_thread_bound
     def consume_instant_actions_messages(self, instant_actions_callback):
         """ Receive instant actions messages.
             Instant actions are used by helyOS to reserve, release or cancel an assignment.
@@ -471,16 +582,218 @@ class HelyOSClient():
         """
 
         self.set_instant_actions_queue()
-        self.channel.basic_consume(queue=self.instant_actions_queue.method.queue, auto_ack=True,
-                                   on_message_callback=instant_actions_callback)
+        self._basic_consume(self.instant_actions_queue.method.queue, instant_actions_callback)
+        self._consumers['instant_actions'] = instant_actions_callback
+
+    def restore_consumers(self):
+        """ Declare the queues and register the assignment and instant-action consumers again on the current channel.
+
+            The queues and consumers do not survive a lost connection. The I/O thread calls this method after it
+            reconnects; without the I/O thread, call it after `reconnect()` and before `start_listening()`.
+        """
+        if 'assignment' in self._consumers:
+            self.consume_assignment_messages(self._consumers['assignment'])
+        if 'instant_actions' in self._consumers:
+            self.consume_instant_actions_messages(self._consumers['instant_actions'])
+
+    def _basic_consume(self, queue, callback):
+        if self.acknowledger is None:
+            return self.channel.basic_consume(queue=queue, auto_ack=True, on_message_callback=callback)
+        if self.acknowledger.prefetch_count:
+            self.channel.basic_qos(prefetch_count=self.acknowledger.prefetch_count)
+        return self.channel.basic_consume(queue=queue, auto_ack=False,
+                                          on_message_callback=self.acknowledger.wrap(callback))
+
+    def enable_manual_ack(self, prefetch_count=10, batch_size=1, max_delay=0.05, requeue=True):
+        """ Acknowledge assignments and instant actions after their callbacks, with a bounded prefetch (opt-in).
+
+            Call it before `consume_assignment_messages()` and `consume_instant_actions_messages()`. Deliveries are
+            acknowledged when their callback returns and rejected, then requeued once, when it raises; at most
+            `prefetch_count` unacknowledged deliveries per consumer are pushed by the broker. See :class:`Acknowledger`.
+
+            .. code-block:: python
+
+                helyos_client.enable_manual_ack(prefetch_count=20, batch_size=10)
+                agent_connector.consume_assignment_messages(my_assignment_callback)
+
+            :param prefetch_count: Maximum number of unacknowledged deliveries per consumer, 0 for no limit,
+                                   defaults to 10
+            :type prefetch_count: int
+            :param batch_size: Number of acknowledgements sent together with one cumulative ack, defaults to 1
+            :type batch_size: int
+            :param max_delay: Maximum delay in seconds of a batched acknowledgement, defaults to 0.05
+            :type max_delay: float
+            :param requeue: Requeue the deliveries whose callback failed, defaults to True
+            :type requeue: bool
+        """
+        self.acknowledger = Acknowledger(prefetch_count, batch_size, max_delay, requeue,
+                                         call_later=lambda delay, func: self.connection.call_later(delay, func),
+                                         threadsafe=lambda func: self.connection.add_callback_threadsafe(func))
+        return self.acknowledger
+
+    def disable_manual_ack(self):
+        """ Consume with automatic acknowledgements again; applies to the next `consume_*()` calls. """
+        self.acknowledger = None
+
+    def enable_compression(self, threshold=DEFAULT_THRESHOLD, algorithm=None, level=None):
+        """ Compress published messages of at least `threshold` bytes.
+
+            The compression is marked in the envelope and undone by the receiver before parsing; see
+            :class:`PayloadCompressor`. Compression ratio and CPU time are reported by `compressor.summary()`.
+
+            :param threshold: Minimum serialized message size in bytes, defaults to 16 KiB
+            :type threshold: int
+            :param algorithm: 'zlib' or 'zstd', defaults to 'zstd' if the zstandard package is installed, else 'zlib'
+            :type algorithm: str
+            :param level: Compression level, defaults to the algorithm default
+            :type level: int
+        """
+        self.compressor = PayloadCompressor(threshold, algorithm, level)
+        return self.compressor
+
+    def disable_compression(self):
+        self.compressor = None
+
+    def enable_outbox(self, directory, max_bytes=64 * 1024 * 1024, segment_bytes=1024 * 1024, replay_rate=200,
+                      is_droppable=is_sensor_message, fsync=False, retry_interval=3, hard_max_bytes=None):
+        """ Buffer the messages published during disconnections in a disk-backed outbox and replay them.
+
+            See :class:`Outbox`. While the outbox holds messages, new messages are appended to it to keep the
+            publication order. With the I/O thread, the I/O thread reconnects and replays the outbox. Otherwise, the
+            outbox is replayed by `publish()` and `replay_outbox()`, which try to reconnect at most every
+            `retry_interval` seconds instead of waiting for the broker.
+
+            .. code-block:: python
+
+                helyos_client.enable_outbox('/var/lib/my_agent/outbox', max_bytes=256 * 1024 * 1024)
+
+            :param directory: Outbox directory
+            :type directory: str
+            :param max_bytes: Size limit of the outbox on disk; sensor messages are dropped beyond it, defaults to 64 MiB
+            :type max_bytes: int
+            :param segment_bytes: Size of the segment files, defaults to 1 MiB
+            :type segment_bytes: int
+            :param replay_rate: Maximum number of replayed messages per second, defaults to 200
+            :type replay_rate: float
+            :param is_droppable: is_droppable(routing_key) tells if a message may be dropped when the outbox is full,
+                                 defaults to the sensor messages
+            :type is_droppable: func
+            :param fsync: Sync each stored message to disk, defaults to False
+            :type fsync: bool
+            :param retry_interval: Minimum seconds between two reconnection attempts without I/O thread, defaults to 3
+            :type retry_interval: float
+            :param hard_max_bytes: Size limit of the outbox for all messages; beyond it, `publish()` raises
+                                   HelyOSOutboxFullError, defaults to 4 times `max_bytes`
+            :type hard_max_bytes: int
+        """
+        self.outbox = Outbox(directory, max_bytes, segment_bytes, replay_rate, is_droppable, fsync, hard_max_bytes)
+        self.reconnection_interval = retry_interval
+        return self.outbox
+
+    def disable_outbox(self):
+        """ Close the outbox. Messages still stored are replayed when the outbox is enabled again. """
+        if self.outbox is not None:
+            self.outbox.close()
+            self.outbox = None
+
+    def _publish_through_outbox(self, exchange, routing_key, properties, body):
+        if self.io_thread is not None:
+            if self.outbox.pending or not self.connection.is_open:
+                self.outbox.put(exchange, routing_key, properties, body)
+            else:
+                self.io_thread.enqueue(exchange, routing_key, properties, body)
+            return
+
+        if not self.outbox.pending and not self.is_reconecting:
+            try:
+                self.channel.basic_publish(exchange, routing_key, properties=properties, body=body)
+                return
+            except (pika.exceptions.AMQPConnectionError, pika.exceptions.AMQPChannelError) as err:
+                logging.warning(f'Connection error when publishing, message stored in the outbox: {err}')
+
+        self.outbox.put(exchange, routing_key, properties, body)
+        self.replay_outbox()
+
+    def replay_outbox(self, max_messages=None):
+        """ Publish the messages stored in the outbox, within its replay rate, trying to reconnect if needed.
+
+            Only needed without I/O thread, when no message is published for a while after a disconnection.
+
+            :return: number of replayed messages
+            :rtype: int
+        """
+        if self.outbox is None or self.io_thread is not None or not self.outbox.pending:
+            return 0
+
+        if self.connection is None or not self.connection.is_open or self.is_reconecting:
+            now = time.monotonic()
+            if self.is_reconecting or now < self._next_reconnection:
+                return 0
+            self._next_reconnection = now + self.reconnection_interval
+            try:
+                self.reconnect()
+            except Exception as err:
+                logging.warning(f'Reconnection failed, messages kept in the outbox: {err}')
+                return 0
+
+        try:
+            return self.outbox.replay(
+                lambda exchange, routing_key, properties, body: self.channel.basic_publish(
+                    exchange, routing_key, properties=properties, body=body),
+                max_messages)
+        except (pika.exceptions.AMQPConnectionError, pika.exceptions.AMQPChannelError) as err:
+            logging.warning(f'Connection error when replaying the outbox: {err}')
+            return 0
+
+    @auth_required
+    def start_io_thread(self, max_batch=500, poll_interval=0.05, scheduler=None):
+        """ Hand the connection over to a dedicated I/O thread (opt-in).
+
+            pika's BlockingConnection is not thread-safe. After this call, `publish()` can be called from any thread:
+            messages are queued and published in batches by the I/O thread, which also processes heartbeats and
+            consumer deliveries. Consumer callbacks run on the I/O thread, and `start_listening()` just blocks the
+            caller until `stop_listening()` is called. Call it after the check-in.
+
+            .. code-block:: python
+
+                helyos_client.perform_checkin(yard_uid='yard_A', status='free')
+                helyos_client.get_checkin_result()
+                helyos_client.start_io_thread()       #  <===
+                agent_connector.consume_assignment_messages(my_assignment_callback)
+                threading.Thread(target=my_control_loop).start()  # publishes from another thread
+                agent_connector.start_listening()
+
+            :param max_batch: Maximum number of messages published between two broker polls, defaults to 500
+            :type max_batch: int
+            :param poll_interval: Maximum time in seconds waiting for broker events between drains, defaults to 0.05
+            :type poll_interval: float
+            :param scheduler: Priority scheduler of the queued messages, e.g. to keep sensor floods from delaying state
+                              messages, defaults to None (one FIFO queue)
+            :type scheduler: OutboundScheduler
+        """
+        if self.io_thread is None:
+            self.io_thread = AMQPIOThread(self, max_batch, poll_interval, scheduler)
+        self.io_thread.start()
+        return self.io_thread
+
+    def stop_io_thread(self):
+        """ Publish the queued messages, stop the I/O thread and return the connection to the caller's thread. """
+        if self.io_thread is not None:
+            self.io_thread.stop()
+            self.io_thread = None
 
     def start_listening(self):
+        if self.io_thread is not None:
+            return self.io_thread.wait_listening()
         self.channel.start_consuming()
 
     def stop_listening(self):
+        if self.io_thread is not None:
+            return self.io_thread.stop_listening()
         self.channel.stop_consuming()
 
     def close_connection(self):
         """ Close the AMQP connection with RabbitMQ server """
+        self.stop_io_thread()
         self.connection.close()
     
\ No newline at end of file
@@ -0,0 +1,152 @@
+import threading
+import time
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+ZLIB = 'zlib'
+ZSTD = 'zstd'
+COMPRESSION_ALGORITHMS = (ZLIB, ZSTD)
+DEFAULT_THRESHOLD = 16 * 1024
+
+
+class PayloadCompressor():
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, algorithm=None, level=None):
+        """ Payload compressor
+
+            Compresses serialized messages of at least `threshold` bytes before they are put into the envelope. The
+            algorithm is recorded in the envelope field `compression` and the receiver decompresses the message
+            before parsing it; the signature always covers the uncompressed message. Messages that do not shrink are
+            sent uncompressed.
+
+            Compression, decompression and CPU time are counted in `summary()`.
+
+            .. code-block:: python
+
+                helyos_client.enable_compression(threshold=32 * 1024)
+                ...
+                helyos_client.compressor.summary()
+
+            :param threshold: Minimum message size in bytes to be compressed, defaults to 16 KiB
+            :type threshold: int
+            :param algorithm: 'zlib' or 'zstd', defaults to 'zstd' if the zstandard package is installed, else 'zlib'
+            :type algorithm: str
+            :param level: Compression level, defaults to the algorithm default
+            :type level: int
+        """
+        if algorithm is None:
+            algorithm = ZLIB if zstandard is None else ZSTD
+        if algorithm not in COMPRESSION_ALGORITHMS:
+            raise ValueError(f'Compression algorithm not supported: {algorithm}')
+        if algorithm == ZSTD and zstandard is None:
+            raise ImportError("The compression algorithm 'zstd' requires the zstandard package.")
+
+        self.threshold = threshold
+        self.algorithm = algorithm
+        self.level = level
+
+        self.compressed = 0
+        self.skipped = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.compress_cpu_time = 0.0
+        self.decompressed = 0
+        self.decompress_cpu_time = 0.0
+
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _zstd_compressor(self):
+        # zstandard (de)compressor objects are not thread-safe
+        compressor = getattr(self._local, 'compressor', None)
+        if compressor is None:
+            compressor = zstandard.ZstdCompressor(level=3 if self.level is None else self.level)
+            self._local.compressor = compressor
+        return compressor
+
+    def _zstd_decompressor(self):
+        decompressor = getattr(self._local, 'decompressor', None)
+        if decompressor is None:
+            decompressor = zstandard.ZstdDecompressor()
+            self._local.decompressor = decompressor
+        return decompressor
+
+    def compress(self, data):
+        """ Compress data if it reaches the threshold.
+
+            :param data: Serialized message
+            :type data: bytes
+            :return: (algorithm, compressed data), or (None, data) if the data was not compressed
+            :rtype: tuple
+        """
+        if len(data) < self.threshold:
+            with self._lock:
+                self.skipped += 1
+            return None, data
+
+        started = time.thread_time()
+        if self.algorithm == ZSTD:
+            compressed = self._zstd_compressor().compress(data)
+        else:
+            compressed = zlib.compress(data, -1 if self.level is None else self.level)
+        cpu_time = time.thread_time() - started
+
+        with self._lock:
+            self.compress_cpu_time += cpu_time
+            if len(compressed) >= len(data):
+                self.skipped += 1
+                return None, data
+            self.compressed += 1
+            self.bytes_in += len(data)
+            self.bytes_out += len(compressed)
+        return self.algorithm, compressed
+
+    def decompress(self, algorithm, data):
+        """ Decompress a message compressed with `algorithm`. """
+        started = time.thread_time()
+        if algorithm == ZLIB:
+            decompressed = zlib.decompress(data)
+        elif algorithm == ZSTD:
+            if zstandard is None:
+                raise ImportError("The compression algorithm 'zstd' requires the zstandard package.")
+            decompressed = self._zstd_decompressor().decompress(data)
+        else:
+            raise ValueError(f'Compression algorithm not supported: {algorithm}')
+        cpu_time = time.thread_time() - started
+
+        with self._lock:
+            self.decompressed += 1
+            self.decompress_cpu_time += cpu_time
+        return decompressed
+
+    def summary(self):
+        """ Compressed and skipped messages, compression ratio (input/output bytes) and CPU time in ms. """
+        with self._lock:
+            return {'algorithm': self.algorithm,
+                    'compressed': self.compressed,
+                    'skipped': self.skipped,
+                    'bytes_in': self.bytes_in,
+                    'bytes_out': self.bytes_out,
+                    'ratio': self.bytes_in / self.bytes_out if self.bytes_out else None,
+                    'compress_cpu_ms': 1000 * self.compress_cpu_time,
+                    'decompressed': self.decompressed,
+                    'decompress_cpu_ms': 1000 * self.decompress_cpu_time}
+
+
+_default_compressor = PayloadCompressor(algorithm=ZLIB)
+
+
+def decompress(algorithm, data):
+    """ Decompress a received message. Counted in :func:`summary`. """
+    return _default_compressor.decompress(algorithm, data)
+
+
+def summary():
+    """ Decompression counters of the received messages. """
+    stats = _default_compressor.summary()
+    return {'decompressed': stats['decompressed'], 'decompress_cpu_ms': stats['decompress_cpu_ms']}
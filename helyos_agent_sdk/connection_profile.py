@@ -0,0 +1,103 @@
+import socket
+
+
+class ConnectionProfile():
+
+    def __init__(self, heartbeat=3600, blocked_connection_timeout=None, socket_timeout=10, tcp_nodelay=True,
+                 tcp_keepalive=False, keepalive_idle=60, keepalive_interval=10, keepalive_count=5,
+                 tcp_user_timeout=None, mqtt_keepalive=60):
+        """ Heartbeat, flow-control timeout and socket options of the broker connections
+
+            The defaults (DEFAULT_PROFILE) are those of the account connections of earlier versions: a one-hour
+            heartbeat and no blocked-connection timeout. pika's BlockingConnection only answers heartbeats inside its
+            own calls, so a blocking client that processes broker events only when it publishes, e.g. every few
+            minutes, would be disconnected with a short heartbeat. A dead link is then only noticed when the client
+            next writes to it.
+
+            The asyncio clients process broker events continuously and default to ASYNC_PROFILE: a 30 s heartbeat,
+            which detects a dead link within about a minute, and TCP keepalive probes. A blocking client that
+            processes events regularly (I/O thread, `start_listening()`, or `process_data_events()` in its loop)
+            should pass a similar profile; TCP keepalive probes and `tcp_user_timeout` detect dead links at the
+            socket level.
+
+            .. code-block:: python
+
+                helyos_client = HelyOSClient('myrabbitmq.com', 5672, uuid='3452345-52453-43525',
+                                             connection_profile=ConnectionProfile(heartbeat=15,
+                                                                                  blocked_connection_timeout=30,
+                                                                                  tcp_keepalive=True))
+                helyos_client.connect('my_username', 'secret_password')
+                helyos_client.start_io_thread()
+
+            :param heartbeat: AMQP heartbeat timeout in seconds, 0 to disable, defaults to 3600
+            :type heartbeat: int
+            :param blocked_connection_timeout: Seconds after which a connection blocked by the broker's flow control
+                                               is closed, defaults to None (never)
+            :type blocked_connection_timeout: float
+            :param socket_timeout: Socket connect timeout in seconds, defaults to 10
+            :type socket_timeout: float
+            :param tcp_nodelay: Disable Nagle's algorithm; always enabled by pika for AMQP, defaults to True
+            :type tcp_nodelay: bool
+            :param tcp_keepalive: Enable TCP keepalive probes, defaults to False
+            :type tcp_keepalive: bool
+            :param keepalive_idle: Idle seconds before the first keepalive probe, defaults to 60
+            :type keepalive_idle: int
+            :param keepalive_interval: Seconds between keepalive probes, defaults to 10
+            :type keepalive_interval: int
+            :param keepalive_count: Unanswered probes before the connection is dropped, defaults to 5
+            :type keepalive_count: int
+            :param tcp_user_timeout: Milliseconds that sent data may stay unacknowledged before the connection is
+                                     dropped (Linux), defaults to None
+            :type tcp_user_timeout: int
+            :param mqtt_keepalive: MQTT keep-alive interval in seconds, defaults to 60
+            :type mqtt_keepalive: int
+        """
+        self.heartbeat = heartbeat
+        self.blocked_connection_timeout = blocked_connection_timeout
+        self.socket_timeout = socket_timeout
+        self.tcp_nodelay = tcp_nodelay
+        self.tcp_keepalive = tcp_keepalive
+        self.keepalive_idle = keepalive_idle
+        self.keepalive_interval = keepalive_interval
+        self.keepalive_count = keepalive_count
+        self.tcp_user_timeout = tcp_user_timeout
+        self.mqtt_keepalive = mqtt_keepalive
+
+    def tcp_options(self):
+        """ TCP options in the format of pika's `tcp_options` connection parameter. """
+        options = {}
+        if self.tcp_keepalive:
+            options.update({'TCP_KEEPIDLE': self.keepalive_idle,
+                            'TCP_KEEPINTVL': self.keepalive_interval,
+                            'TCP_KEEPCNT': self.keepalive_count})
+        if self.tcp_user_timeout is not None:
+            options['TCP_USER_TIMEOUT'] = self.tcp_user_timeout
+        return options or None
+
+    def pika_parameters(self):
+        """ Keyword arguments of pika.ConnectionParameters. """
+        return {'heartbeat': self.heartbeat,
+                'blocked_connection_timeout': self.blocked_connection_timeout,
+                'socket_timeout': self.socket_timeout,
+                'tcp_options': self.tcp_options()}
+
+    def apply_to_socket(self, sock):
+        """ Set the socket options on a connected socket (used for MQTT, whose client does not set them). """
+        if sock is None:
+            return
+        if self.tcp_nodelay:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if self.tcp_keepalive:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        for name, value in (self.tcp_options() or {}).items():
+            option = getattr(socket, name, None)
+            if option is not None:
+                sock.setsockopt(socket.IPPROTO_TCP, option, value)
+
+
+# account connections of the blocking clients
+DEFAULT_PROFILE = ConnectionProfile()
+# account connections of the asyncio clients, whose broker events are processed by the event loop
+ASYNC_PROFILE = ConnectionProfile(heartbeat=30, tcp_keepalive=True, keepalive_idle=30)
+# short-lived anonymous connections of the check-in
+TEMPORARY_PROFILE = ConnectionProfile(heartbeat=60, blocked_connection_timeout=60)
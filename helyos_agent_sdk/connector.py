@@ -1,105 +1,138 @@
+import inspect
 import logging
-import json
+import time
+from . import envelope
+from .model_codecs import codec, to_dict
+from .sensor_delta import SensorDeltaEncoder
+from .dispatcher import CallbackDispatcher, ordering_key
+from .cancellation import CancelLane, assignment_id
 from .exceptions import *
 from .client import HelyOSClient
 from .models import (ASSIGNMENT_STATUS, AGENT_STATE, AGENT_MESSAGE_TYPE, Pose, ASSIGNMENT_MESSAGE_TYPE, INSTANT_ACTIONS_TYPE, WorkProcessResourcesRequest,
                      AssignmentCommandMessage, AssignmentMetadata, AssignmentCancelMessage, AgentCurrentResources, AgentStateBody,
                      AgentStateMessage, AssignmentCurrentStatus)
 
+_decode_assignment_command = codec(AssignmentCommandMessage).from_dict
+_decode_assignment_cancel = codec(AssignmentCancelMessage).from_dict
+_decode_resources_request = codec(WorkProcessResourcesRequest).from_dict
 
 
-def parse_assignment_message(self, ch, properties, received_str):
+def _dispatch(self, message, callback, *args):
+    """ Run a callback, or hand it to the connector's dispatcher. """
+    if self.dispatcher is None:
+        return callback(*args)
+    return self.dispatcher.submit(ordering_key(message), callback, *args)
+
+
+def _run_in_lane(self, received_at, callback, *args):
+    """ Run a cancel callback at once, without waiting behind the dispatched callbacks. """
+    if inspect.iscoroutinefunction(callback):
+        async def run():
+            self.cancel_lane.record_handler(received_at)
+            return await callback(*args)
+        return run()
+    self.cancel_lane.record_handler(received_at)
+    return callback(*args)
+
+
+def _received_payload(received_str, text_payload):
+    """ Payload handed to the other_* callbacks: MQTT payloads are decoded to str unless the envelope is binary. """
+    if not text_payload or isinstance(received_str, str) or envelope.detect_format(received_str) != envelope.JSON:
+        return received_str
+    try:
+        return bytes(received_str).decode('utf-8')
+    except UnicodeDecodeError:
+        return received_str
+
+
+def parse_assignment_message(self, ch, properties, received_str, text_payload=False):
     """ Parse the assignment message and call the callback function.
     :param ch: RabbitMQ channel
     :type ch: Channel
     :param properties: RabbitMQ properties
     :type properties: BasicProperties
     :param received_str: Received message
-    :type received_str: string
+    :type received_str: string, bytes, memoryview
+    :param text_payload: Hand JSON payloads to the other callback as str (MQTT), defaults to False
+    :type text_payload: bool
     
     """
-    sender = None
+    sender = None; action_type = None
     if hasattr(properties, 'user_id'):
         sender = properties.user_id
 
     try:
-        message_signature = json.loads(received_str).get('signature', None)
-        message_str = json.loads(received_str)['message']
-        received_message = json.loads(message_str)
+        received_message, message_str, message_signature = envelope.decode_message(received_str)
         action_type = received_message.get('type', None)
 
         if action_type == ASSIGNMENT_MESSAGE_TYPE.EXECUTION:
-            assignment_metadata = received_message.get('metadata',{}) 
-            command_message = {'type': received_message['type'],
-                               'uuid': received_message['uuid'],
-                               'metadata': AssignmentMetadata(**assignment_metadata),
-                               'body': received_message['body'],
-                               '_version': received_message['_version']}
-
-            inst_assignm_exec = AssignmentCommandMessage(**command_message)
-            return self.assignment_callback(ch, sender, inst_assignm_exec, message_str, message_signature)
+            inst_assignm_exec = _decode_assignment_command(received_message)
+            self.cancel_lane.token(assignment_id(inst_assignm_exec))
+            return _dispatch(self, inst_assignm_exec, self.assignment_callback,
+                             ch, sender, inst_assignm_exec, message_str, message_signature)
 
-        return self.other_assignment_callback(ch,  sender, received_str)
+        return self.other_assignment_callback(ch,  sender, _received_payload(received_str, text_payload))
     except Exception as Argument:
         if action_type == ASSIGNMENT_MESSAGE_TYPE.EXECUTION:
             logging.exception('Error occurred while receiving assignment.')    
+            if getattr(self.helyos_client, 'acknowledger', None) is not None:
+                raise  # rejected and requeued by the acknowledger
             return None
         else:
-            return self.other_assignment_callback(ch, sender, received_str)
+            return self.other_assignment_callback(ch, sender, _received_payload(received_str, text_payload))
 
 
 
-def parse_instant_actions(self, ch, properties, received_str):
+def parse_instant_actions(self, ch, properties, received_str, text_payload=False):
     """ Parse the instant action messages and call the callback function.
     :param ch: RabbitMQ channel
     :type ch: Channel
     :param properties: RabbitMQ properties
     :type properties: BasicProperties
     :param received_str: Received message
-    :type received_str: string
+    :type received_str: string, bytes, memoryview
+    :param text_payload: Hand JSON payloads to the other callback as str (MQTT), defaults to False
+    :type text_payload: bool
     """
+    received_at = time.monotonic()
     sender = None; action_type = None
     if hasattr(properties, 'user_id'):
         sender = properties.user_id
 
     try:
-        message_signature = json.loads(received_str).get('signature', None)
-        message_str = json.loads(received_str).get('message', None)
+        received_message, message_str, message_signature = envelope.decode_message(received_str)
         if message_str is None:
-             return self.other_instant_actions_callback(ch, sender, received_str)
+             return self.other_instant_actions_callback(ch, sender, _received_payload(received_str, text_payload))
         
-        received_message = json.loads(message_str)
         action_type = received_message.get('type', None)
 
         if action_type == INSTANT_ACTIONS_TYPE.CANCEL:
-            assignment_metadata = received_message.get('metadata', {}) 
-            command_message = {'type': received_message['type'],
-                               'uuid': received_message['uuid'],
-                               'metadata': AssignmentMetadata(**assignment_metadata),
-                               'body': received_message['body'],
-                               '_version': received_message['_version']}
-            inst_assignm_cancel = AssignmentCancelMessage(**command_message)
+            inst_assignm_cancel = _decode_assignment_cancel(received_message)
+            self.cancel_lane.cancel(inst_assignm_cancel, getattr(properties, 'timestamp', None))
             print('call cancel callback')
-            return self.cancel_callback(ch, sender, inst_assignm_cancel, message_str, message_signature)
+            return _run_in_lane(self, received_at, self.cancel_callback,
+                                ch, sender, inst_assignm_cancel, message_str, message_signature)
 
         if action_type == INSTANT_ACTIONS_TYPE.RESERVE:
-            inst_wp_clearance = WorkProcessResourcesRequest(
-                **received_message['body'])
-            return self.reserve_callback(ch, sender, inst_wp_clearance, message_str, message_signature)
+            inst_wp_clearance = _decode_resources_request(received_message['body'])
+            return _dispatch(self, inst_wp_clearance, self.reserve_callback,
+                             ch, sender, inst_wp_clearance, message_str, message_signature)
 
         if action_type == INSTANT_ACTIONS_TYPE.RELEASE:
-            inst_wp_clearance = WorkProcessResourcesRequest(
-                **received_message['body'])
-            return self.release_callback(ch, sender, inst_wp_clearance, message_str, message_signature)
+            inst_wp_clearance = _decode_resources_request(received_message['body'])
+            return _dispatch(self, inst_wp_clearance, self.release_callback,
+                             ch, sender, inst_wp_clearance, message_str, message_signature)
 
-        return self.other_instant_actions_callback(ch, sender, received_str )
+        return self.other_instant_actions_callback(ch, sender, _received_payload(received_str, text_payload))
     
     except Exception as Argument:
         if action_type in [INSTANT_ACTIONS_TYPE.RELEASE, INSTANT_ACTIONS_TYPE.RESERVE,  INSTANT_ACTIONS_TYPE.CANCEL]:
             logging.exception('Error occurred while receiving instan action.')
+            if getattr(self.helyos_client, 'acknowledger', None) is not None:
+                raise  # rejected and requeued by the acknowledger
             return None
         print(action_type, Argument)
-        return self.other_instant_actions_callback(ch, sender, received_str)
+        return self.other_instant_actions_callback(ch, sender, _received_payload(received_str, text_payload))
     
 
 class AgentConnector():
@@ -107,6 +140,8 @@ class AgentConnector():
     agent_pose: Pose = Pose(x=0, y=0, z=0, orientations=[0])
     agent_resources = None
     current_assignment = None
+    # callbacks run on the thread consuming the messages, unless dispatched
+    _callbacks_block_consumer = True
 
     @property
     def agent_idle_status(self):
@@ -116,7 +151,7 @@ class AgentConnector():
 
         return AGENT_STATE.FREE
 
-    def __init__(self, helyos_client, pose=None, encrypted=False):
+    def __init__(self, helyos_client, pose=None, encrypted=False, payload_formats=None):
         """ Agent Connector class
 
             Usage:
@@ -134,10 +169,19 @@ class AgentConnector():
             :type pose: Pose
             :param encrypted: Set if the published messages should be encrypted, defaults to False.
             :type encrypted: bool
+            :param payload_formats: Payload format per agent message type, e.g. {AGENT_MESSAGE_TYPE.SENSORS: 'msgpack'}.
+                                    Message types not listed are published as JSON. Binary formats ('msgpack', 'cbor')
+                                    are only understood by consumers using this SDK's envelope codec.
+            :type payload_formats: dict
 
         """
         self.helyos_client = helyos_client
         self.encrypted = encrypted
+        self.payload_formats = {getattr(message_type, 'value', message_type): payload_format
+                                for message_type, payload_format in (payload_formats or {}).items()}
+        self.sensor_delta = None
+        self.dispatcher = None
+        self.cancel_lane = CancelLane()
         if pose:
             self.agent_pose = pose
 
@@ -171,7 +215,8 @@ class AgentConnector():
             :type release_callback: func
             :param cancel_callback: cancel_callback
             :type cancel_callback: func(ch, sender, message: AssignmentCancelMessage)
-            :param other_callback: Non-helyOS related instant action
+            :param other_callback: Non-helyOS related instant action; the message is the received str, or bytes for
+                                   AMQP bodies and binary envelopes
             :type other_callback: func(ch: Channel, sender:string, message: string)
 
         """
@@ -189,7 +234,7 @@ class AgentConnector():
             return parse_instant_actions(self, ch, properties, received_str=message)
 
         def mqtt_callback(ch, userdata, message):
-            return parse_instant_actions(self, ch, {'user_id': None}, received_str=message.payload.decode())
+            return parse_instant_actions(self, ch, {'user_id': None}, received_str=message.payload, text_payload=True)
 
         if self.helyos_client._protocol == 'AMQP':
             self.__instant_actions_callback = amqp_callback
@@ -205,7 +250,8 @@ class AgentConnector():
 
             :param reserve_callback: assignment_callback(ch, method, properties, received_str)
             :type reserve_callback: func
-            :param other_callback: Non-helyOS related instant action
+            :param other_callback: Non-helyOS related instant action; the message is the received str, or bytes for
+                                   AMQP bodies and binary envelopes
             :type other_callback: func(ch, method, properties, received_str)
         """
 
@@ -218,7 +264,7 @@ class AgentConnector():
             return parse_assignment_message(self, ch, properties, received_str=message)
 
         def mqtt_callback(ch, userdata, message):
-            return parse_assignment_message(self, ch, {'user_id': None}, received_str=message.payload.decode())
+            return parse_assignment_message(self, ch, {'user_id': None}, received_str=message.payload, text_payload=True)
 
         if self.helyos_client._protocol == 'AMQP':
             self.__assignment_callback = amqp_callback
@@ -235,6 +281,15 @@ class AgentConnector():
     def stop_listening(self):
         self.helyos_client.stop_listening()
 
+    def _publish_message(self, routing_key, message, signed):
+        payload_format = self.payload_formats.get(message['type'], envelope.JSON)
+        return self.helyos_client.publish(
+            routing_key=routing_key,
+            message=envelope.encode(message, payload_format, canonical=signed),
+            signed=signed,
+            payload_format=payload_format
+        )
+
     def publish_general_updates(self, body={}, signed=False):
         """
             Updates agent properties of agent: name, code, factsheet, x, y etc.
@@ -248,14 +303,13 @@ class AgentConnector():
             :type signed: boolean
 
         """
-        self.helyos_client.publish(
-            routing_key=self.helyos_client.update_routing_key,
-            message=json.dumps(
-                {'type': AGENT_MESSAGE_TYPE.UPDATE.value,
-                 'uuid': self.helyos_client.uuid,
-                 'body': body,
-                 }, sort_keys=True),
-            signed=signed
+        return self._publish_message(
+            self.helyos_client.update_routing_key,
+            {'type': AGENT_MESSAGE_TYPE.UPDATE.value,
+             'uuid': self.helyos_client.uuid,
+             'body': body,
+             },
+            signed
         )
 
     def publish_state(self, status: AGENT_STATE, resources: AgentCurrentResources = None, assignment_status: AssignmentCurrentStatus = None, signed=False):
@@ -285,13 +339,9 @@ class AgentConnector():
         agent_state_body = AgentStateBody(status, resources, assignment_status)
         message = AgentStateMessage(
             uuid=self.helyos_client.uuid, body=agent_state_body)
-        message_dict = json.loads(message.to_json())
+        message_dict = to_dict(message)
 
-        self.helyos_client.publish(
-            routing_key=self.helyos_client.status_routing_key,
-            message=json.dumps(message_dict, sort_keys=True),
-            signed=signed
-        )
+        return self._publish_message(self.helyos_client.status_routing_key, message_dict, signed)
 
     def publish_sensors(self, x, y, z, orientations, sensors={}, signed=False):
         """ Publishes agent position and sensors. The sensor data format is freely defined by the developer.
@@ -299,6 +349,7 @@ class AgentConnector():
             The published information is placed in a low-priority queue and may expire under high load conditions. 
             For high-priority updates, use the method `publish_general_updates()`.    
             RabbitMQ clients can access this information using the routing key 'agent.{uuid}.visualization'.        
+            With `enable_sensor_delta()`, only the changed sensors are sent between keyframes.
 
             :param x: Agent x position
             :type x: float
@@ -314,18 +365,106 @@ class AgentConnector():
         """
 
         self.agent_pose = Pose(x, y, z, orientations)
-        self.helyos_client.publish(
-            routing_key=self.helyos_client.sensors_routing_key,
-            message=json.dumps(
-                {'type': AGENT_MESSAGE_TYPE.SENSORS.value,
-                 'uuid': self.helyos_client.uuid,
-                 'body': {'pose': {'x': x, 'y': y, 'z': z, 'orientations': orientations},
-                          'sensors': sensors
-                          }
-                 }, sort_keys=True),
-            signed=signed
+        body = {'pose': {'x': x, 'y': y, 'z': z, 'orientations': orientations},
+                'sensors': sensors
+                }
+        if self.sensor_delta is not None:
+            body = self.sensor_delta.encode(body['pose'], sensors)
+            if body is None:
+                return None
+
+        return self._publish_message(
+            self.helyos_client.sensors_routing_key,
+            {'type': AGENT_MESSAGE_TYPE.SENSORS.value,
+             'uuid': self.helyos_client.uuid,
+             'body': body
+             },
+            signed
         )
 
+    def enable_sensor_delta(self, keyframe_interval=5.0, position_deadband=0, orientation_deadband=0, sensor_deadbands=None):
+        """ Publish sensor messages as keyframes and deltas.
+
+            After this call, `publish_sensors()` sends a full keyframe every `keyframe_interval` seconds and, in
+            between, only the sensor keys changed or removed since the previously published message, so that each
+            delta depends on the one before it. Calls whose changes stay within the dead-bands publish nothing and
+            return None. See :class:`SensorDeltaEncoder` for the message format; consumers
+            rebuild the full sensors with :class:`SensorDeltaDecoder`.
+
+            .. code-block:: python
+
+                agent_connector.enable_sensor_delta(keyframe_interval=5, position_deadband=5,
+                                                    orientation_deadband=1.7, sensor_deadbands={'temperature': 0.5})
+
+            :param keyframe_interval: Seconds between keyframes, defaults to 5
+            :type keyframe_interval: float
+            :param position_deadband: Position change in the pose units that is not published, defaults to 0
+            :type position_deadband: float
+            :param orientation_deadband: Orientation change in the pose units that is not published, defaults to 0
+            :type orientation_deadband: float
+            :param sensor_deadbands: Dead-band per sensor key for numeric values, defaults to None
+            :type sensor_deadbands: dict
+            :return: the encoder, whose `summary()` counts keyframes, deltas and suppressed messages
+            :rtype: SensorDeltaEncoder
+        """
+        self.sensor_delta = SensorDeltaEncoder(keyframe_interval, position_deadband, orientation_deadband, sensor_deadbands)
+        return self.sensor_delta
+
+    def disable_sensor_delta(self):
+        self.sensor_delta = None
+
+    def cancel_token(self, assignment):
+        """ Return the :class:`CancelToken` of an assignment, set as soon as helyOS cancels it.
+
+            The cancel message is consumed on the thread that runs the callbacks: the token can only be set while
+            the assignment callback runs if the callbacks run on the worker pool of :meth:`enable_dispatcher`, which
+            must be enabled first. (:class:`AsyncAgentConnector` runs coroutine callbacks as tasks and needs no
+            dispatcher.)
+
+            :param assignment: Assignment message received by the assignment callback, or assignment id
+            :type assignment: AssignmentCommandMessage
+            :raises RuntimeError: if the dispatcher is not enabled
+        """
+        if self.dispatcher is None and self._callbacks_block_consumer:
+            raise RuntimeError('Cancel tokens need the callback dispatcher: call agent_connector.enable_dispatcher() '
+                               'before consuming assignments, otherwise the cancel message is only received after the '
+                               'assignment callback returns.')
+        if isinstance(assignment, (AssignmentCommandMessage, AssignmentCancelMessage)):
+            assignment = assignment_id(assignment)
+        return self.cancel_lane.token(assignment)
+
+    def enable_dispatcher(self, max_workers=4, max_in_flight=100):
+        """ Run the assignment and reserve callbacks on a worker pool (opt-in).
+
+            Callbacks of the same work process, including its reserve and release callbacks, run in order; see
+            :class:`CallbackDispatcher`. Cancel callbacks are not queued behind them: they run at once on the
+            consuming thread (see :class:`CancelLane`), and should return quickly. The dispatcher is required by
+            :meth:`cancel_token`. With AMQP, publish through the I/O thread, since the callbacks publish from worker
+            threads.
+
+            .. code-block:: python
+
+                helyos_client.start_io_thread()
+                helyos_client.enable_manual_ack(prefetch_count=50)
+                agent_connector.enable_dispatcher(max_workers=8, max_in_flight=100)
+                agent_connector.consume_assignment_messages(my_assignment_callback)
+
+            :param max_workers: Number of worker threads, defaults to 4
+            :type max_workers: int
+            :param max_in_flight: Maximum number of queued and running callbacks, defaults to 100
+            :type max_in_flight: int
+            :return: the dispatcher, whose `summary()` reports queueing and execution times
+            :rtype: CallbackDispatcher
+        """
+        self.dispatcher = CallbackDispatcher(max_workers, max_in_flight)
+        return self.dispatcher
+
+    def disable_dispatcher(self):
+        """ Run the callbacks on the consuming thread again, after the dispatched ones complete. """
+        if self.dispatcher is not None:
+            dispatcher, self.dispatcher = self.dispatcher, None
+            dispatcher.shutdown()
+
     def request_mission(self, mission_name, data, agent_uuids=[],  signed=False):
         """ Request a mission to helyOS. The mission data is freely defined by the application.
             As example, this method could be triggered in the scenario where the agent needs an extra assignments to complete
@@ -342,19 +481,17 @@ class AgentConnector():
             :type signed: boolean
 
         """
-        self.helyos_client.publish(
-            routing_key=self.helyos_client.mission_routing_key,
-            message=json.dumps(
-                {'type': AGENT_MESSAGE_TYPE.MISSION.value,
-                 'uuid': self.helyos_client.uuid,
-                 'body': {'work_process_type_name': mission_name,
-                          'data': data,
-                          'agent_uuids': agent_uuids,
-                          'yard_uid': self.helyos_client.yard_uid,
-                          }
-                 }, sort_keys=True),
-            signed=signed
-
+        return self._publish_message(
+            self.helyos_client.mission_routing_key,
+            {'type': AGENT_MESSAGE_TYPE.MISSION.value,
+             'uuid': self.helyos_client.uuid,
+             'body': {'work_process_type_name': mission_name,
+                      'data': data,
+                      'agent_uuids': agent_uuids,
+                      'yard_uid': self.helyos_client.yard_uid,
+                      }
+             },
+            signed
         )
 
 
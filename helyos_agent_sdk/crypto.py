@@ -1,77 +1,232 @@
-from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.asymmetric import rsa, ec, ed25519
 from cryptography.hazmat.primitives import serialization
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.asymmetric import padding
-from cryptography.hazmat.backends.openssl.rsa import _RSAPrivateKey
+from collections import OrderedDict
+import hashlib
+import threading
 import json
 
+# ---- SIGNATURE ALGORITHMS ------ #
 
-def generate_private_public_keys():
-    key = rsa.generate_private_key(
-        public_exponent=65537,
-        key_size=2048,
-        backend=default_backend()
-    )
-    priv = key.private_bytes(encoding=serialization.Encoding.PEM,
-                             format=serialization.PrivateFormat.TraditionalOpenSSL, encryption_algorithm=serialization.NoEncryption())
+RSA = 'RSA'                # RSA-2048, PSS padding, SHA-256
+ED25519 = 'Ed25519'
+ECDSA_P256 = 'ECDSA-P256'  # NIST P-256, SHA-256
+SIGNATURE_ALGORITHMS = (RSA, ED25519, ECDSA_P256)
+
+# Padding and hash objects are immutable and built once.
+# Padding: PSS is the recommended choice for any new protocols or applications, PKCS1v15 should only be used to support legacy protocols.
+_SHA256 = hashes.SHA256()
+_PSS_PADDING = padding.PSS(mgf=padding.MGF1(_SHA256), salt_length=padding.PSS.MAX_LENGTH)
+_ECDSA_SHA256 = ec.ECDSA(_SHA256)
+
+
+def generate_private_public_keys(algorithm=RSA):
+    """ Generate a key pair in PEM format.
+
+        :param algorithm: One of crypto.RSA, crypto.ED25519 or crypto.ECDSA_P256, defaults to RSA
+        :type algorithm: str
+        :return: private and public keys
+        :rtype: (bytes, bytes)
+    """
+    if algorithm == RSA:
+        key = rsa.generate_private_key(
+            public_exponent=65537,
+            key_size=2048,
+            backend=default_backend()
+        )
+    elif algorithm == ED25519:
+        key = ed25519.Ed25519PrivateKey.generate()
+    elif algorithm == ECDSA_P256:
+        key = ec.generate_private_key(ec.SECP256R1(), backend=default_backend())
+    else:
+        raise ValueError(f'Signature algorithm not supported: {algorithm}. Use one of {SIGNATURE_ALGORITHMS}')
+
+    priv = private_key_to_pem(key)
     pub_key = key.public_key()
     pub = pub_key.public_bytes(encoding=serialization.Encoding.PEM,
                                format=serialization.PublicFormat.SubjectPublicKeyInfo)
     return priv, pub
 
 
+def private_key_to_pem(key):
+    # RSA keys keep the traditional format for compatibility with keys generated by older versions
+    private_format = serialization.PrivateFormat.TraditionalOpenSSL if isinstance(key, rsa.RSAPrivateKey) \
+        else serialization.PrivateFormat.PKCS8
+    return key.private_bytes(encoding=serialization.Encoding.PEM,
+                             format=private_format, encryption_algorithm=serialization.NoEncryption())
+
+
+def key_algorithm(key):
+    """ Return the signature algorithm name of a private or public key object. """
+    if isinstance(key, (rsa.RSAPrivateKey, rsa.RSAPublicKey)):
+        return RSA
+    if isinstance(key, (ed25519.Ed25519PrivateKey, ed25519.Ed25519PublicKey)):
+        return ED25519
+    if isinstance(key, (ec.EllipticCurvePrivateKey, ec.EllipticCurvePublicKey)) and isinstance(key.curve, ec.SECP256R1):
+        return ECDSA_P256
+    raise TypeError(f'Key type not supported: {type(key)}')
+
+
+def public_key_format(algorithm):
+    """ Value of `public_key_format` announced in the check-in: 'PEM' for RSA, 'PEM/<algorithm>' otherwise. """
+    if algorithm == RSA:
+        return 'PEM'
+    return f'PEM/{algorithm}'
+
+
+def _message_bytes(message):
+    # binary envelopes sign the encoded message bytes, JSON envelopes the message string
+    if isinstance(message, (bytes, bytearray, memoryview)):
+        return bytes(message)
+    return message.encode('utf-8')
+
+
+def _sign(private_key, data):
+    if isinstance(private_key, ed25519.Ed25519PrivateKey):
+        return private_key.sign(data)
+    if isinstance(private_key, ec.EllipticCurvePrivateKey):
+        return private_key.sign(data, _ECDSA_SHA256)
+    return private_key.sign(data, _PSS_PADDING, _SHA256)
+
+
+def _verify(public_key, signature, data):
+    if isinstance(public_key, ed25519.Ed25519PublicKey):
+        return public_key.verify(signature, data)
+    if isinstance(public_key, ec.EllipticCurvePublicKey):
+        return public_key.verify(signature, data, _ECDSA_SHA256)
+    return public_key.verify(signature, data, _PSS_PADDING, _SHA256)
+
+
+class SignatureVerifier:
+    def __init__(self, max_keys=128) -> None:
+        """ SignatureVerifier class
+
+            Verifies message signatures keeping the parsed public keys in an LRU cache, keyed by the SHA-256
+            fingerprint of the PEM bytes, so that the same helyOS or agent key is parsed only once.
+            Instances are thread-safe.
+
+            .. code-block:: python
+
+                verifier = SignatureVerifier()
+                verifier.verify(message_str, signature, helyos_client.helyos_public_key)
+
+            :param max_keys: Maximum number of parsed keys kept in memory, defaults to 128
+            :type max_keys: int
+
+        """
+        self.max_keys = max_keys
+        self.hits = 0
+        self.misses = 0
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load_public_key(self, public_key):
+        """ Return the parsed public key, from the cache if it was already loaded.
+
+            :param public_key: The public key in PEM format
+            :type public_key: bytes, str, list
+        """
+        if type(public_key) is bytes:
+            pem = public_key
+        elif type(public_key) is str:
+            pem = public_key.encode('utf-8')
+        elif type(public_key) is list:
+            pem = bytes(public_key)
+        else:
+            raise TypeError(f'Public key type not supported, type: {type(public_key)}, contents: {public_key}')
+
+        fingerprint = hashlib.sha256(pem).digest()
+        with self._lock:
+            pubkey = self._keys.get(fingerprint)
+            if pubkey is not None:
+                self._keys.move_to_end(fingerprint)
+                self.hits += 1
+                return pubkey
+
+        pubkey = serialization.load_pem_public_key(pem, backend=default_backend())
+        with self._lock:
+            self.misses += 1
+            self._keys[fingerprint] = pubkey
+            while len(self._keys) > self.max_keys:
+                self._keys.popitem(last=False)
+        return pubkey
+
+    def verify(self, message_string, signature, public_key):
+        """ Verify the signature of a message with the public key provided. Same behaviour as :func:`verify_signature`.
+
+            :param message_string: The message
+            :type message_string: str, bytes
+            :param signature: The signature of the message in hex or bytes format
+            :type signature: bytes, str
+            :param public_key: The public key for verifying the signature of the message
+            :type public_key: bytes, str, list
+        """
+        try:
+            pubkey = self.load_public_key(public_key)
+        except Exception as e:
+            raise Exception(
+                f'Error loading public key for signature verification: {e}')
+        try:
+            # verify signature using hex string signature
+            if type(signature) is str:
+                byte_signature = bytes.fromhex(signature)
+            else:
+                byte_signature = signature
+
+            _verify(pubkey, byte_signature, _message_bytes(message_string))
+            return True
+
+        except Exception as e:
+            raise Exception(f'Error verifying signature: {e}. Signature: {signature}, message: {message_string}')
+
+    def verify_many(self, messages, public_key=None):
+        """ Verify several signatures without raising.
+
+            :param messages: (message_string, signature) pairs verified with `public_key`, or
+                             (message_string, signature, public_key) triples
+            :type messages: iterable
+            :param public_key: The public key shared by the pairs, defaults to None
+            :type public_key: bytes, str, list
+            :return: one boolean per message
+            :rtype: list
+        """
+        results = []
+        for item in messages:
+            message_string, signature = item[0], item[1]
+            key = item[2] if len(item) > 2 else public_key
+            try:
+                results.append(self.verify(message_string, signature, key))
+            except Exception:
+                results.append(False)
+        return results
+
+    def clear(self):
+        with self._lock:
+            self._keys.clear()
+
+
+_default_verifier = SignatureVerifier()
+
+
 def verify_signature(message_string, signature, public_key):
     """ Verify the signature of a message with the public key provided
 
-        Implements the function that verifies the signature of a message
+        Implements the function that verifies the signature of a message. The algorithm (RSA, Ed25519 or ECDSA P-256)
+        is taken from the public key.
 
         :param message_string: The message
-        :type message_string: str
+        :type message_string: str, bytes
         :param signature: The signature of the message in hex or bytes format
         :type signature: bytes, str
         :param public_key: The public key for verifying the signature of the message
         :type public_key: bytes, str, list
 
-    """
-    try:
-        # Load the public key from PEM format
-        if type(public_key) is bytes:
-            pubkey = serialization.load_pem_public_key(
-                public_key, backend=default_backend())
-        elif type(public_key) is str:
-            pubkey = serialization.load_pem_public_key(
-                public_key.encode('utf-8'), backend=default_backend())
-        elif type(public_key) is list:
-                pubkey_bytes = bytes(public_key)
-                pubkey = serialization.load_pem_public_key(
-                pubkey_bytes, backend=default_backend())
-        else:
-            raise TypeError(f'Public key type not supported, type: {type(public_key)}, contents: {public_key}')
-    except Exception as e:
-        raise Exception(
-            f'Error loading public key for signature verification: {e}')
-    try:
-        # Verify the signature
-        # Padding: PSS is the recommended choice for any new protocols or applications, PKCS1v15 should only be used to support legacy protocols.
-        # verify signature using hex string signature
-        
-        if type(signature) is str:
-            byte_signature = bytes.fromhex(signature)
-        else:
-            byte_signature = signature
-
-        pubkey.verify(
-            byte_signature,
-            message_string.encode('utf-8'),
-            padding.PSS(mgf=padding.MGF1(hashes.SHA256()),
-                        salt_length=padding.PSS.MAX_LENGTH),
-            hashes.SHA256()
-        )
-        return True
+        Parsed keys are cached by a module-level :class:`SignatureVerifier`.
 
-    except Exception as e:
-        raise Exception(f'Error verifying signature: {e}. Signature: {signature}, message: {message_string}')
+    """
+    return _default_verifier.verify(message_string, signature, public_key)
 
 
 class Signing:
@@ -79,9 +234,11 @@ class Signing:
         """ Signing class
 
             Implements several functions to facilitate the handling of private keys and the signing of messages.
+            RSA (PSS, SHA-256), Ed25519 and ECDSA P-256 (SHA-256) keys are supported; the algorithm is taken from
+            the key and exposed as `algorithm`.
 
             :param private_key: The private key for signing the messages
-            :type private_key: bytes, str, _RSAPrivateKey
+            :type private_key: bytes, str, RSAPrivateKey, Ed25519PrivateKey, EllipticCurvePrivateKey
 
         """
 
@@ -109,16 +266,13 @@ class Signing:
             except Exception as e:
                 raise Exception(f'Error loading private key: {e}')
 
-        if type(private_key) is _RSAPrivateKey:
+        if isinstance(private_key, (rsa.RSAPrivateKey, ed25519.Ed25519PrivateKey, ec.EllipticCurvePrivateKey)):
             self.private_key = private_key
-            private_key_pem = private_key.private_bytes(
-                encoding=serialization.Encoding.PEM,
-                format=serialization.PrivateFormat.TraditionalOpenSSL,
-                encryption_algorithm=serialization.NoEncryption()
-            )
-            self.private_key_string = private_key_pem.decode('utf-8')
+            self.private_key_string = private_key_to_pem(private_key).decode('utf-8')
 
+        self.algorithm = None
         if private_key is not None:
+            self.algorithm = key_algorithm(self.private_key)
             self.own_public_key = self.private_key.public_key()
             self.own_public_key_pem = self.own_public_key.public_bytes(encoding=serialization.Encoding.PEM,
                                                                        format=serialization.PublicFormat.SubjectPublicKeyInfo)
@@ -130,21 +284,14 @@ class Signing:
             Implements the function that verifies the signature of a message signed with the own private key
 
             :param message_string: The message
-            :type message_string: str
+            :type message_string: str, bytes
             :param signature: The signature of the message
             :type signature: bytes, str
 
         """
         try:
             # Verify the signature
-            # Padding: PSS is the recommended choice for any new protocols or applications, PKCS1v15 should only be used to support legacy protocols.
-            self.own_public_key.verify(
-                signature,
-                message_string.encode('utf-8'),
-                padding.PSS(mgf=padding.MGF1(hashes.SHA256()),
-                            salt_length=padding.PSS.MAX_LENGTH),
-                hashes.SHA256()
-            )
+            _verify(self.own_public_key, signature, _message_bytes(message_string))
             return True
 
         except Exception as e:
@@ -154,16 +301,11 @@ class Signing:
     def return_signature(self, message_string):
         """ Signs the message string provided and returns signature in bytes format
             :param message_string: The message str
-            :type message_string: str
+            :type message_string: str, bytes
 
         """
         try:
-            signature = self.private_key.sign(
-                message_string.encode('utf-8'),
-                padding.PSS(
-                    mgf=padding.MGF1(hashes.SHA256()), salt_length=padding.PSS.MAX_LENGTH),
-                hashes.SHA256()
-            )
+            signature = _sign(self.private_key, _message_bytes(message_string))
         except Exception as e:
             raise Exception(f'Error signing message: {e}')
 
@@ -1,7 +1,65 @@
+import asyncio
 import uuid
-import json
+import threading
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from . import envelope
+from .query_cache import QueryCache
+from .metrics import LatencyHistogram
+from .exceptions import *
 import time
 
+
+class BulkMutationResult():
+    """ Aggregated result of :meth:`DatabaseConnector.bulk_mutation`. """
+
+    def __init__(self, mutation, items):
+        self.mutation = mutation
+        self.items = items
+        self.chunks = []
+        self.responses = []
+        self.failures = []
+        self.elapsed = None
+
+    @property
+    def ok(self):
+        return not self.failures
+
+    def failed_items(self):
+        """ Items of the failed chunks, e.g. to retry them. """
+        return [item for index, error in self.failures for item in self.chunks[index]]
+
+    def summary(self):
+        """ Items, chunks, failed chunks and items, elapsed time and throughput (items/s). """
+        failed_items = sum(len(self.chunks[index]) for index, _ in self.failures)
+        return {'mutation': self.mutation,
+                'items': len(self.items),
+                'chunks': len(self.chunks),
+                'failed_chunks': len(self.failures),
+                'failed_items': failed_items,
+                'elapsed': self.elapsed,
+                'throughput': (len(self.items) - failed_items) / self.elapsed if self.elapsed else None}
+
+
+def chunked(items, chunk_size, max_bytes=None):
+    """ Split items into lists of at most `chunk_size` items and about `max_bytes` serialized JSON bytes. """
+    chunk, chunk_bytes = [], 0
+    for item in items:
+        item_bytes = len(envelope.dumps(item)) + 1 if max_bytes else 0
+        if chunk and (len(chunk) >= chunk_size or (max_bytes and chunk_bytes + item_bytes > max_bytes)):
+            yield chunk
+            chunk, chunk_bytes = [], 0
+        chunk.append(item)
+        chunk_bytes += item_bytes
+    if chunk:
+        yield chunk
+
+
+def query_type(request):
+    """ Name of the query or mutation of a request, e.g. 'allAgents'. """
+    return request.get('query', None) or request.get('mutation', None) or 'unknown'
+
+
 class DatabaseConnector():
     """
     This module defines the DatabaseConnector class.
@@ -9,20 +67,34 @@ class DatabaseConnector():
     The class is responsible for handling remote procedure calls (RPCs) using the AMQP protocol.
     It connects to a Helyos client and makes requests to helyOS database.
 
+    Requests are multiplexed: each request gets its own correlation id and future, so that many requests can be
+    outstanding at once, sent from several threads or from asyncio. Replies are matched to their request by
+    correlation id; replies arriving after the timeout of their request are dropped. With the client I/O thread
+    (`HelyOSClient.start_io_thread()`) the replies are received by the I/O thread; otherwise the waiting callers
+    take turns processing the connection events.
+
     Attributes:
     connection (obj): The pika RabbitMQ connection object .
     helyos_client (obj): The Helyos client object.
     routing_key (str): The routing key for the summary requests.
-    username (str): The username for the RabbitMQ.
     channel (obj): The channel object of the connection.
     callback_queue (str): The callback queue for receiving responses.
-    response (str): The response received from the RPC call.
-    corr_id (str): The unique correlation id for the RPC call.
+    timeout (float): Default timeout of the requests in seconds, None to wait forever.
+    response (str): The last response received.
+    corr_id (str): The correlation id of the last request.
 
     Methods:
-    init(connection, helyos_client): Initializes the DatabaseConnector object and sets up the necessary attributes.
+    init(connection, helyos_client, timeout): Initializes the DatabaseConnector object and sets up the necessary attributes.
     on_response(ch, method, props, body): Callback function for handling the response received from the RPC call.
-    call(request): Makes a remote procedure call with the given request and returns the response.
+    call(request, timeout): Makes a remote procedure call with the given request and returns the response.
+    call_many(requests, timeout, return_exceptions): Pipelines several requests and returns their responses.
+    call_async(request, timeout): Coroutine version of call().
+    iter_query(query, conditions, page_size, timeout): Iterates over the result of a query as it is decoded.
+    bulk_mutation(mutation, items, ...): Sends a large mutation in pipelined chunks.
+    create_map_objects(objects, ...), delete_map_objects_by_ids(ids, ...): Chunked map-object mutations.
+    send(request): Sends a request and returns the future of its raw response, to be passed to wait().
+    latency_stats(): Latency histogram and timeouts per query type.
+    enable_cache(max_entries, default_ttl, ttls): Caches query results, see QueryCache.
 
     requests can be one of the following: "allAgents", "allYards", "executingMissions", "missionAssignments" or "allMapObjects".
 
@@ -32,16 +104,43 @@ class DatabaseConnector():
     helyos_client.connect_rabbitmq('my_username', 'secret_password')
     db_rpc = DatabaseConnector(helyos_client)
     agents_summary = db_rpc.call({'query': 'allAgents', 'conditions': {"yard_id": 1}})
+    yards, map_objects = db_rpc.call_many([{'query': 'allYards'}, {'query': 'allMapObjects'}], timeout=10)
 
     """
 
-    def __init__(self, helyos_client):
+    def __init__(self, helyos_client, timeout=60):
         if helyos_client._protocol == 'MQTT':
             raise Exception('Remote procedure call should use AMQP protocoll.')
-        self.connection = helyos_client.connection
-        self.routing_key = helyos_client.database_routing_key
         self.helyos_client = helyos_client
+        self.routing_key = helyos_client.database_routing_key
+        self.timeout = timeout
+        self.poll_interval = 0.05
+
+        self.response = None
+        self.corr_id = None
+        self.cache = None
+
+        self._pending = {}
+        self._histograms = {}
+        self._timeouts = {}
+        self._lock = threading.Lock()
+        self._io_lock = threading.RLock()
+
+        self._open_reply_queue()
 
+    @property
+    def _io_thread(self):
+        io_thread = getattr(self.helyos_client, 'io_thread', None)
+        return io_thread if io_thread is not None and io_thread.is_alive else None
+
+    def _open_reply_queue(self):
+        if self._io_thread is not None:
+            return self._io_thread.call(self.__open_reply_queue)
+        with self._io_lock:
+            self.__open_reply_queue()
+
+    def __open_reply_queue(self):
+        self.connection = self.helyos_client.connection
         self.channel = self.connection.channel()
         result = self.channel.queue_declare(queue='', exclusive=True)
         self.callback_queue = result.method.queue
@@ -51,14 +150,122 @@ class DatabaseConnector():
             on_message_callback=self.on_response,
             auto_ack=True)
 
-        self.response = None
-        self.corr_id = None
+    def _ensure_connection(self):
+        if self._io_thread is None:
+            with self._io_lock:
+                # processes pending broker events without waiting, so that a closed connection is noticed
+                if not self.helyos_client.check_connection():
+                    self.helyos_client.reconnect()
+                    time.sleep(3)
+        # the I/O thread reconnects by itself
+
+        if self.helyos_client.connection is not self.connection:
+            with self._io_lock:
+                if self.helyos_client.connection is not self.connection:
+                    # the reply queue was exclusive to the lost connection
+                    self._fail_pending(HelyOSAccountConnectionError('Connection lost before helyOS answered the request.'))
+                    self._open_reply_queue()
+
+    def _fail_pending(self, error):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for future, _, _ in pending.values():
+            if not future.done():
+                future.set_exception(error)
 
     def on_response(self, ch, method, props, body):
-        if self.corr_id == props.correlation_id:
-            self.response = body
+        with self._lock:
+            pending = self._pending.pop(props.correlation_id, None)
+            if pending is None:
+                return  # reply of a request that timed out
+            future, request_type, started = pending
+            self._histograms.setdefault(request_type, LatencyHistogram()).record(time.perf_counter() - started)
+
+        self.response = body
+        if not future.cancelled():
+            future.set_result(body)
+
+    def _send(self, request):
+        corr_id = str(uuid.uuid4())
+        future = Future()
+        future.corr_id = corr_id
+        future.query_type = query_type(request)
+        with self._lock:
+            self._pending[corr_id] = (future, future.query_type, time.perf_counter())
+        self.corr_id = corr_id
+
+        try:
+            with self._io_lock:
+                self.helyos_client.publish(routing_key=self.routing_key,
+                                           message=envelope.dumps({'body': request}),
+                                           signed=False,
+                                           reply_to=self.callback_queue,
+                                           corr_id=corr_id,
+                )
+        except Exception:
+            with self._lock:
+                self._pending.pop(corr_id, None)
+            raise
+        return future
+
+    def send(self, request):
+        """ Send a request without waiting for the response.
+
+            :param request: Query or mutation, see :meth:`call`
+            :type request: dict
+            :return: future of the raw response, to be passed to :meth:`wait`
+            :rtype: concurrent.futures.Future
+        """
+        self._ensure_connection()
+        return self._send(request)
+
+    def _expire(self, future):
+        with self._lock:
+            if self._pending.pop(future.corr_id, None) is not None:
+                self._timeouts[future.query_type] = self._timeouts.get(future.query_type, 0) + 1
+
+    def _wait_raw(self, future, deadline):
+        while not future.done():
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                self._expire(future)
+                raise HelyOSTimeoutError(f'No response from helyOS to {future.query_type} request.')
+
+            poll_time = self.poll_interval if remaining is None else min(self.poll_interval, remaining)
+            if self._io_thread is not None:
+                try:
+                    return future.result(poll_time)
+                except FutureTimeoutError:
+                    continue
+
+            # without I/O thread, one waiting caller at a time processes the connection events for everybody
+            if self._io_lock.acquire(blocking=False):
+                try:
+                    if not future.done():
+                        self.connection.process_data_events(time_limit=poll_time)
+                finally:
+                    self._io_lock.release()
+            else:
+                try:
+                    return future.result(poll_time)
+                except FutureTimeoutError:
+                    continue
+
+        return future.result()
+
+    def _deadline(self, timeout):
+        timeout = self.timeout if timeout is None else timeout
+        return None if timeout is None else time.monotonic() + timeout
 
-    def call(self, request):
+    def wait(self, future, timeout=None):
+        """ Wait for the response of a request sent with :meth:`send` and return it.
+
+            :param timeout: Seconds to wait, defaults to the connector timeout
+            :type timeout: float
+        """
+        return envelope.decode_message(self._wait_raw(future, self._deadline(timeout)))[0]
+
+    def call(self, request, timeout=None):
         """
         :param request: a dictionary containing the query or mutation and condition or data.
                         The query can be one of the following: "allAgents", "allYards", "executingMissions", "missionAssignments","allMapObjects",
@@ -67,6 +274,8 @@ class DatabaseConnector():
                         The data is a list of dictionaries containing the data to be inserted.
 
         :type request: dict
+        :param timeout: Seconds to wait for the response, defaults to the connector timeout. Raises HelyOSTimeoutError.
+        :type timeout: float
         :return: the requested information based on the provided query and conditions.
         :rtype: an
 
@@ -77,20 +286,217 @@ class DatabaseConnector():
             >>> db_rpc.call({'mutation': 'deleteMapObjectByIds', 'conditions': {'ids': [1, 2, 3]}})
 
         """
+        if self.cache is not None:
+            return self.cache.call(request, lambda: self.wait(self.send(request), timeout),
+                                   self.timeout if timeout is None else timeout)
+        return self.wait(self.send(request), timeout)
 
-        if not self.helyos_client.is_connection_open:
-            self.helyos_client.reconnect()
-            time.sleep(3)
-            self.__init__(self.helyos_client)
+    def call_many(self, requests, timeout=None, return_exceptions=False):
+        """ Send several requests back to back and wait for all responses.
 
-        self.response = None
-        self.corr_id = str(uuid.uuid4())
-        self.helyos_client.publish(routing_key=self.routing_key,
-                                   message=json.dumps({'body': request}),
-                                   signed=False,
-                                   reply_to=self.callback_queue,
-                                   corr_id=self.corr_id,
-        )
-
-        self.connection.process_data_events(time_limit=None)
-        return json.loads(json.loads(self.response)['message'])
+            :param requests: Queries or mutations, see :meth:`call`
+            :type requests: list
+            :param timeout: Seconds to wait for all responses, defaults to the connector timeout
+            :type timeout: float
+            :param return_exceptions: Return errors (e.g. HelyOSTimeoutError) in place of the failed responses
+                                      instead of raising the first one, defaults to False
+            :type return_exceptions: bool
+            :return: the responses, in the order of the requests
+            :rtype: list
+
+            The requests are always sent to helyOS, but mutations invalidate the cached results.
+        """
+        self._ensure_connection()
+        futures = [self._send(request) for request in requests]
+        deadline = self._deadline(timeout)
+        responses = []
+        try:
+            for future in futures:
+                try:
+                    responses.append(envelope.decode_message(self._wait_raw(future, deadline))[0])
+                except Exception as err:
+                    if not return_exceptions:
+                        for other in futures:
+                            if not other.done():
+                                self._expire(other)
+                        raise
+                    responses.append(err)
+        finally:
+            if self.cache is not None:
+                for request in requests:
+                    self.cache.invalidate(request)
+        return responses
+
+    def iter_query(self, query, conditions=None, page_size=None, timeout=None):
+        """ Send a query and iterate over the objects of its result while they are decoded.
+
+            helyOS answers with the whole result in one message, but the objects are decoded one at a time instead of
+            all at once, and the raw response is released once decoded: only the objects of the current page are
+            held by the connector. The request is sent immediately, so several queries can be pipelined; the
+            iteration waits for the response. The query cache is bypassed.
+
+            .. code-block:: python
+
+                for page in db_rpc.iter_query('allMapObjects', {'yard_id': 1}, page_size=500):
+                    process(page)
+
+            :param query: Query name, e.g. 'allMapObjects'
+            :type query: str
+            :param conditions: Query conditions, defaults to None
+            :type conditions: dict
+            :param page_size: Yield lists of up to `page_size` objects instead of single objects, defaults to None
+            :type page_size: int
+            :param timeout: Seconds to wait for the response, defaults to the connector timeout
+            :type timeout: float
+            :return: iterator over the result objects, or over pages of objects
+            :rtype: iterator
+        """
+        request = {'query': query}
+        if conditions is not None:
+            request['conditions'] = conditions
+        future = self.send(request)
+        return self._iter_result(future, self._deadline(timeout), page_size)
+
+    def _iter_result(self, future, deadline, page_size):
+        body = self._wait_raw(future, deadline)
+        del future
+        # drop the other reference to the raw response
+        if self.response is body:
+            self.response = None
+        items = envelope.iter_message(body)
+        del body
+
+        if not page_size:
+            yield from items
+            return
+        page = []
+        for item in items:
+            page.append(item)
+            if len(page) >= page_size:
+                yield page
+                page = []
+        if page:
+            yield page
+
+    def bulk_mutation(self, mutation, items, chunk_size=500, max_bytes=512 * 1024, max_in_flight=4, timeout=None):
+        """ Send a mutation over many items in chunks.
+
+            The items are split into chunks of at most `chunk_size` items and about `max_bytes` of JSON, and the
+            chunk requests are pipelined with at most `max_in_flight` requests waiting for their response. A failed
+            chunk does not stop the others: check `ok`, `failures` and `failed_items()` of the result.
+
+            .. code-block:: python
+
+                result = db_rpc.bulk_mutation('createMapObjects', map_objects)
+                if not result.ok:
+                    retry = result.failed_items()
+
+            :param mutation: 'createMapObjects' (items are the `data` objects) or 'deleteMapObjectByIds' (items are
+                             the ids)
+            :type mutation: str
+            :param items: Map objects or ids
+            :type items: list
+            :param chunk_size: Maximum number of items per request, defaults to 500
+            :type chunk_size: int
+            :param max_bytes: Approximate maximum JSON size of the items of a request, None for no limit,
+                              defaults to 512 KiB
+            :type max_bytes: int
+            :param max_in_flight: Maximum number of chunk requests waiting for their response, defaults to 4
+            :type max_in_flight: int
+            :param timeout: Seconds to wait for the response of each chunk, defaults to the connector timeout
+            :type timeout: float
+            :return: the responses and failures per chunk
+            :rtype: BulkMutationResult
+        """
+        if mutation == 'deleteMapObjectByIds':
+            build_request = lambda chunk: {'mutation': mutation, 'conditions': {'ids': chunk}}
+        else:
+            build_request = lambda chunk: {'mutation': mutation, 'data': chunk}
+
+        result = BulkMutationResult(mutation, items)
+        started = time.perf_counter()
+        in_flight = deque()
+
+        def collect():
+            index, request, future = in_flight.popleft()
+            try:
+                result.responses[index] = envelope.decode_message(self._wait_raw(future, self._deadline(timeout)))[0]
+            except Exception as err:
+                result.failures.append((index, err))
+            if self.cache is not None:
+                self.cache.invalidate(request)
+
+        self._ensure_connection()
+        for index, chunk in enumerate(chunked(items, chunk_size, max_bytes)):
+            if len(in_flight) >= max_in_flight:
+                collect()
+            result.chunks.append(chunk)
+            result.responses.append(None)
+            request = build_request(chunk)
+            try:
+                in_flight.append((index, request, self._send(request)))
+            except Exception as err:
+                result.failures.append((index, err))
+        while in_flight:
+            collect()
+
+        result.failures.sort(key=lambda failure: failure[0])
+        result.elapsed = time.perf_counter() - started
+        return result
+
+    def create_map_objects(self, map_objects, **kwargs):
+        """ Create map objects with a chunked 'createMapObjects' mutation, see :meth:`bulk_mutation`. """
+        return self.bulk_mutation('createMapObjects', map_objects, **kwargs)
+
+    def delete_map_objects_by_ids(self, ids, **kwargs):
+        """ Delete map objects with a chunked 'deleteMapObjectByIds' mutation, see :meth:`bulk_mutation`. """
+        return self.bulk_mutation('deleteMapObjectByIds', ids, **kwargs)
+
+    async def call_async(self, request, timeout=None):
+        """ Coroutine version of :meth:`call`.
+
+            With the client I/O thread, the response is awaited on the event loop; otherwise the wait runs in the
+            default executor.
+        """
+        if self.cache is not None:
+            return await asyncio.get_running_loop().run_in_executor(None, self.call, request, timeout)
+
+        future = self.send(request)
+        if self._io_thread is None:
+            return await asyncio.get_running_loop().run_in_executor(None, self.wait, future, timeout)
+
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            body = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout)
+        except asyncio.TimeoutError:
+            self._expire(future)
+            raise HelyOSTimeoutError(f'No response from helyOS to {future.query_type} request.')
+        return envelope.decode_message(body)[0]
+
+    def enable_cache(self, max_entries=256, default_ttl=1.0, ttls=None):
+        """ Cache query results, coalesce identical concurrent queries and invalidate results on mutations.
+
+            See :class:`QueryCache`; hit and miss counters are reported by `cache.summary()`.
+
+            :param max_entries: Maximum number of cached results, defaults to 256
+            :type max_entries: int
+            :param default_ttl: Time-to-live in seconds of the queries not listed in `ttls`, defaults to 1
+            :type default_ttl: float
+            :param ttls: Time-to-live in seconds per query name, e.g. {'allYards': 60}; 0 disables the cache for a
+                         query, defaults to None
+            :type ttls: dict
+        """
+        self.cache = QueryCache(max_entries, default_ttl, ttls)
+        return self.cache
+
+    def disable_cache(self):
+        self.cache = None
+
+    def latency_stats(self):
+        """ Latency histogram (ms) and number of timeouts per query type, and the number of outstanding requests. """
+        with self._lock:
+            stats = {request_type: {**histogram.summary(), 'timeouts': self._timeouts.get(request_type, 0)}
+                     for request_type, histogram in self._histograms.items()}
+            for request_type, timeouts in self._timeouts.items():
+                stats.setdefault(request_type, {**LatencyHistogram().summary(), 'timeouts': timeouts})
+            return {'in_flight': len(self._pending), 'queries': stats}
@@ -0,0 +1,194 @@
+import asyncio
+import inspect
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from .metrics import LatencyHistogram
+from .exceptions import HelyOSDispatcherFullError
+
+
+def ordering_key(message):
+    """ Ordering key of a parsed helyOS message: its work process id, else its assignment id, else None.
+
+        Assignments, reservations and releases of the same work process share a key. Cancellations are not
+        dispatched (see :class:`CancelLane`).
+    """
+    work_process_id = getattr(message, 'work_process_id', None)
+    if work_process_id is not None:
+        return work_process_id
+    metadata = getattr(message, 'metadata', None)
+    if isinstance(metadata, dict):
+        return metadata.get('work_process_id', None) or metadata.get('id', None)
+    if metadata is not None:
+        return getattr(metadata, 'work_process_id', None) or getattr(metadata, 'id', None)
+    return None
+
+
+class _DispatcherStats():
+
+    def _init_stats(self):
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.in_flight = 0
+        self.queue_wait = LatencyHistogram()
+        self.execution = LatencyHistogram()
+        self._stats_lock = threading.Lock()
+
+    def _record(self, queued_at, started, failed):
+        with self._stats_lock:
+            self.in_flight -= 1
+            self.completed += 1
+            self.failed += failed
+            self.queue_wait.record(started - queued_at)
+            self.execution.record(time.monotonic() - started)
+
+    def summary(self):
+        """ Submitted, completed, failed and rejected callbacks, callbacks in flight, queueing and execution times. """
+        with self._stats_lock:
+            return {'submitted': self.submitted,
+                    'completed': self.completed,
+                    'failed': self.failed,
+                    'rejected': self.rejected,
+                    'in_flight': self.in_flight,
+                    'queue_wait': self.queue_wait.summary(),
+                    'execution': self.execution.summary()}
+
+
+class CallbackDispatcher(_DispatcherStats):
+
+    def __init__(self, max_workers=4, max_in_flight=100):
+        """ Thread pool running the callbacks of an :class:`AgentConnector`
+
+            Without dispatcher, the assignment and instant-action callbacks run on the thread consuming the
+            connection, so that a long-running handler holds back heartbeats and further deliveries. With a
+            dispatcher (see :meth:`AgentConnector.enable_dispatcher`), parsed messages are handed to a pool of
+            `max_workers` threads. Callbacks with the same ordering key (see :func:`ordering_key`) run one after the
+            other in the order of reception; callbacks with different keys run concurrently.
+
+            At most `max_in_flight` callbacks are queued or running; beyond that, the consuming thread waits. With
+            manual acknowledgements (:meth:`HelyOSClient.enable_manual_ack`), deliveries are acknowledged when their
+            callback is done, and a `prefetch_count` below `max_in_flight` keeps the consuming thread from waiting.
+
+            Callbacks run on worker threads: an AMQP client must publish through its I/O thread
+            (:meth:`HelyOSClient.start_io_thread`).
+
+            :param max_workers: Number of worker threads, defaults to 4
+            :type max_workers: int
+            :param max_in_flight: Maximum number of queued and running callbacks, defaults to 100
+            :type max_in_flight: int
+        """
+        self.max_workers = max_workers
+        self.max_in_flight = max_in_flight
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix='helyos-callback')
+
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._queues = {}  # key -> callbacks waiting for the running callback of the same key
+        self._lock = threading.Lock()
+        self._init_stats()
+
+    def submit(self, key, func, *args):
+        """ Run func(*args) after the callbacks of the same key and return a concurrent Future of its result. """
+        self._slots.acquire()
+        future = Future()
+        task = (future, func, args, time.monotonic())
+        with self._stats_lock:
+            self.submitted += 1
+            self.in_flight += 1
+        if key is not None:
+            with self._lock:
+                queue = self._queues.get(key, None)
+                if queue is not None:
+                    queue.append(task)
+                    return future
+                self._queues[key] = deque()
+        self.executor.submit(self._run, key, task)
+        return future
+
+    def _run(self, key, task):
+        while task is not None:
+            future, func, args, queued_at = task
+            started = time.monotonic()
+            failed = False
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(func(*args))
+                except Exception as err:
+                    logging.exception('Error occurred in dispatched callback.')
+                    future.set_exception(err)
+                    failed = True
+            self._record(queued_at, started, failed)
+            self._slots.release()
+
+            task = None
+            if key is not None:
+                with self._lock:
+                    queue = self._queues[key]
+                    if queue:
+                        task = queue.popleft()
+                    else:
+                        del self._queues[key]
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait)
+
+
+class AsyncCallbackDispatcher(_DispatcherStats):
+
+    def __init__(self, max_in_flight=100, max_queued=1000):
+        """ Asyncio variant of :class:`CallbackDispatcher` for :class:`AsyncAgentConnector`
+
+            Callbacks run as tasks on the event loop, at most `max_in_flight` at a time; callbacks with the same
+            ordering key run one after the other in the order of reception. Plain functions run on the event loop
+            too: blocking handlers should be coroutines delegating to `loop.run_in_executor()`.
+
+            The consuming callbacks run on the event loop and cannot wait for a free slot: beyond `max_queued` queued
+            and running callbacks, `submit()` raises :class:`HelyOSDispatcherFullError` and the message is dropped,
+            or rejected and requeued once with manual acknowledgements. A `prefetch_count` below `max_queued`
+            (:meth:`AsyncHelyOSClient.enable_manual_ack`) keeps the backlog on the broker instead.
+
+            :param max_in_flight: Maximum number of running callbacks, defaults to 100
+            :type max_in_flight: int
+            :param max_queued: Maximum number of queued and running callbacks, None for no limit, defaults to 1000
+            :type max_queued: int
+        """
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self._slots = None
+        self._tails = {}  # key -> last task of the key
+        self._init_stats()
+
+    def submit(self, key, func, *args):
+        """ Schedule func(*args) after the callbacks of the same key and return its task. """
+        if self.max_queued is not None and self.in_flight >= self.max_queued:
+            self.rejected += 1
+            raise HelyOSDispatcherFullError(f'{self.in_flight} callbacks are already queued or running.')
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+        self.submitted += 1
+        self.in_flight += 1
+        task = asyncio.ensure_future(self._run(self._tails.get(key, None), func, args, time.monotonic()))
+        if key is not None:
+            self._tails[key] = task
+            task.add_done_callback(lambda done: self._tails.pop(key) if self._tails.get(key, None) is done else None)
+        return task
+
+    async def _run(self, previous, func, args, queued_at):
+        started = None
+        failed = True
+        try:
+            if previous is not None:
+                # wait for the previous callback of the key, whatever its outcome
+                await asyncio.wait([previous])
+            async with self._slots:
+                started = time.monotonic()
+                result = func(*args)
+                if inspect.isawaitable(result):
+                    result = await result
+                failed = False
+                return result
+        finally:
+            self._record(queued_at, started or time.monotonic(), failed)
@@ -0,0 +1,303 @@
+""" Message envelope codec
+
+helyOS messages are transported in an envelope: a JSON object with the `message` as a JSON string, its `signature`
+and, for MQTT, the `headers`. This module encodes and decodes envelopes in a single pass, accepting bytes and
+memoryviews as received from the broker. The JSON backend is the standard library. Set the environment variable
+HELYOS_JSON_BACKEND=orjson to use `orjson` (extra 'fast') instead. It is faster, but its output is not identical:
+separators are compact, NaN and Infinity are encoded as null, and dataclasses, datetimes and numpy values are
+serialized instead of raising TypeError.
+
+Sorted-key (canonical) encoding of the message is only applied when it is signed.
+
+Envelopes can also be encoded in the binary formats MessagePack (`msgpack` package) or CBOR (`cbor2` package). In a
+binary envelope, the `message` is encoded in the same format as bytes and the `signature` is carried as raw bytes
+instead of hex. Decoders detect the format from the first byte of the payload: a JSON envelope starts with `{`, a
+MessagePack envelope with a map marker (0x80-0x8f, 0xde, 0xdf) and a CBOR envelope with a map marker (0xa0-0xbf) or
+the self-describe tag (0xd9).
+
+Large messages can be compressed (see :class:`helyos_agent_sdk.compression.PayloadCompressor`). The envelope field
+`compression` then names the algorithm and the `message` holds the compressed data, base64 encoded in JSON envelopes.
+"""
+import os
+import re
+import json
+import base64
+from . import compression
+
+try:
+    if os.environ.get('HELYOS_JSON_BACKEND', 'json') != 'orjson':
+        raise ImportError
+    import orjson
+    JSON_BACKEND = 'orjson'
+except ImportError:
+    orjson = None
+    JSON_BACKEND = 'json'
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+
+JSON = 'json'
+MSGPACK = 'msgpack'
+CBOR = 'cbor'
+PAYLOAD_FORMATS = (JSON, MSGPACK, CBOR)
+CONTENT_TYPES = {JSON: 'application/json',
+                 MSGPACK: 'application/msgpack',
+                 CBOR: 'application/cbor'}
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_NON_STR_KEYS
+    _CANONICAL_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SORT_KEYS
+
+    def dumps(obj, canonical=False):
+        """ Serialize obj to a JSON string. Keys are sorted if `canonical` is True. """
+        try:
+            return orjson.dumps(obj, option=_CANONICAL_OPTIONS if canonical else _OPTIONS).decode('utf-8')
+        except TypeError:
+            # objects orjson does not handle, e.g. integers larger than 64 bits
+            return json.dumps(obj, sort_keys=canonical)
+
+    def dumpb(obj, canonical=False):
+        """ Serialize obj to JSON bytes. Keys are sorted if `canonical` is True. """
+        try:
+            return orjson.dumps(obj, option=_CANONICAL_OPTIONS if canonical else _OPTIONS)
+        except TypeError:
+            return json.dumps(obj, sort_keys=canonical).encode('utf-8')
+
+    def loads(data):
+        """ Deserialize JSON from str, bytes, bytearray or memoryview. """
+        return orjson.loads(data)
+
+else:
+    def dumps(obj, canonical=False):
+        """ Serialize obj to a JSON string. Keys are sorted if `canonical` is True. """
+        return json.dumps(obj, sort_keys=canonical)
+
+    def dumpb(obj, canonical=False):
+        """ Serialize obj to JSON bytes. Keys are sorted if `canonical` is True. """
+        return json.dumps(obj, sort_keys=canonical).encode('utf-8')
+
+    def loads(data):
+        """ Deserialize JSON from str, bytes, bytearray or memoryview. """
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        return json.loads(data)
+
+
+def content_type(payload_format):
+    """ AMQP content type of a binary payload format; None for JSON, which is sent without content type. """
+    if payload_format == JSON:
+        return None
+    return CONTENT_TYPES[payload_format]
+
+
+def _binary_codec(payload_format):
+    if payload_format == MSGPACK:
+        if msgpack is None:
+            raise ImportError("The payload format 'msgpack' requires the msgpack package.")
+        return msgpack
+    if payload_format == CBOR:
+        if cbor2 is None:
+            raise ImportError("The payload format 'cbor' requires the cbor2 package.")
+        return cbor2
+    raise ValueError(f'Payload format not supported: {payload_format}')
+
+
+def encode(obj, payload_format=JSON, canonical=False):
+    """ Serialize a message in the given payload format.
+
+        :param obj: The message
+        :type obj: dict
+        :param payload_format: 'json', 'msgpack' or 'cbor', defaults to 'json'
+        :type payload_format: str
+        :param canonical: Sort the keys (JSON) or use the canonical encoding (CBOR), defaults to False
+        :type canonical: bool
+        :return: JSON string, or bytes for the binary formats
+        :rtype: str, bytes
+    """
+    if payload_format == JSON:
+        return dumps(obj, canonical)
+    if payload_format == CBOR:
+        return _binary_codec(CBOR).dumps(obj, canonical=canonical)
+    return _binary_codec(payload_format).packb(obj)
+
+
+def decode(data, payload_format=None):
+    """ Deserialize a message. The format is detected if `payload_format` is None. """
+    if payload_format is None:
+        payload_format = detect_format(data)
+    if payload_format == JSON:
+        return loads(data)
+    if payload_format == CBOR:
+        return _binary_codec(CBOR).loads(bytes(data))
+    return _binary_codec(payload_format).unpackb(data)
+
+
+def detect_format(body):
+    """ Detect the payload format of a received envelope from its first byte.
+
+        :param body: The received body
+        :type body: bytes, bytearray, memoryview, str
+        :return: 'json', 'msgpack' or 'cbor'
+        :rtype: str
+    """
+    if isinstance(body, str) or not len(body):
+        return JSON
+    first = body[0]
+    if 0x80 <= first <= 0x8f or first in (0xde, 0xdf):
+        return MSGPACK
+    if 0xa0 <= first <= 0xbf or first == 0xd9:
+        return CBOR
+    return JSON
+
+
+def encode_envelope(message, signature=None, headers=None, payload_format=JSON, compressor=None):
+    """ Build the envelope published to helyOS.
+
+        :param message: The serialized message, as returned by :func:`encode`
+        :type message: str, bytes
+        :param signature: The message signature, defaults to None. Raw bytes are hex encoded in JSON envelopes.
+        :type signature: bytes, str, list
+        :param headers: Message headers, used by MQTT clients, defaults to None (not included)
+        :type headers: dict
+        :param payload_format: 'json', 'msgpack' or 'cbor', defaults to 'json'
+        :type payload_format: str
+        :param compressor: Compresses the message if it is large enough, defaults to None (no compression)
+        :type compressor: PayloadCompressor
+        :return: the encoded envelope
+        :rtype: bytes
+    """
+    if payload_format == JSON and isinstance(signature, (bytes, bytearray)):
+        signature = signature.hex()
+    envelope = {'message': message, 'signature': signature}
+    if compressor is not None:
+        algorithm, data = compressor.compress(message.encode('utf-8') if isinstance(message, str) else message)
+        if algorithm is not None:
+            envelope['message'] = base64.b64encode(data).decode('ascii') if payload_format == JSON else data
+            envelope['compression'] = algorithm
+    if headers is not None:
+        envelope['headers'] = headers
+    if payload_format == JSON:
+        return dumpb(envelope)
+    return encode(envelope, payload_format)
+
+
+def decode_envelope(body):
+    """ Decode the envelope once, detecting its format.
+
+        :param body: The received body
+        :type body: bytes, bytearray, memoryview, str
+        :return: the envelope dictionary, with the `message` still serialized
+        :rtype: dict
+    """
+    return decode(body)
+
+
+def decode_message(body):
+    """ Decode the envelope and the message it contains, detecting their format.
+
+        :param body: The received body
+        :type body: bytes, bytearray, memoryview, str
+        :return: (message dictionary, serialized message, signature). The serialized message is a JSON string, or bytes
+            in binary envelopes, and is the data covered by the signature; compressed messages are decompressed. The
+            message items are None if the envelope has no message.
+        :rtype: tuple
+    """
+    payload_format = detect_format(body)
+    envelope = decode(body, payload_format)
+    message = envelope.get('message', None)
+    signature = envelope.get('signature', None)
+    if message is None:
+        return None, None, signature
+
+    algorithm = envelope.get('compression', None)
+    if algorithm is not None:
+        message = compression.decompress(algorithm, base64.b64decode(message) if isinstance(message, str) else message)
+        if payload_format == JSON:
+            message = message.decode('utf-8')
+    if isinstance(message, str):
+        return loads(message), message, signature
+    return decode(message, payload_format), message, signature
+
+
+_json_decoder = json.JSONDecoder()
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+def _iter_json_array(text):
+    index = _WHITESPACE.match(text, 0).end()
+    if text[index:index + 1] != '[':
+        yield loads(text)
+        return
+    index = _WHITESPACE.match(text, index + 1).end()
+    if text[index:index + 1] == ']':
+        return
+    while True:
+        item, index = _json_decoder.raw_decode(text, index)
+        yield item
+        index = _WHITESPACE.match(text, index).end()
+        separator = text[index:index + 1]
+        if separator == ']':
+            return
+        if separator != ',':
+            raise ValueError(f'Expecting , or ] at position {index}')
+        index = _WHITESPACE.match(text, index + 1).end()
+
+
+def _iter_msgpack_array(data):
+    unpacker = _binary_codec(MSGPACK).Unpacker(raw=False, max_buffer_size=max(len(data), 1))
+    unpacker.feed(data)
+    if 0x90 <= data[0] <= 0x9f or data[0] in (0xdc, 0xdd):
+        for _ in range(unpacker.read_array_header()):
+            yield unpacker.unpack()
+    else:
+        yield unpacker.unpack()
+
+
+def iter_message(body):
+    """ Decode the message of an envelope incrementally.
+
+        If the message is an array, its items are decoded and yielded one at a time, so that the whole array is never
+        held as Python objects; otherwise the message is yielded as a single item. Only JSON and MessagePack
+        messages are decoded incrementally.
+
+        :param body: The received body
+        :type body: bytes, bytearray, memoryview, str
+        :return: iterator over the message items
+        :rtype: iterator
+    """
+    payload_format = detect_format(body)
+    envelope = decode(body, payload_format)
+    message = envelope.get('message', None)
+    algorithm = envelope.get('compression', None)
+    # only the serialized message is kept while iterating
+    del envelope, body
+    if message is None:
+        return
+
+    if algorithm is not None:
+        message = compression.decompress(algorithm, base64.b64decode(message) if isinstance(message, str) else message)
+        if payload_format == JSON:
+            message = message.decode('utf-8')
+    if isinstance(message, (bytes, bytearray, memoryview)) and payload_format == JSON:
+        message = bytes(message).decode('utf-8')
+
+    if payload_format == JSON:
+        yield from _iter_json_array(message)
+    elif payload_format == MSGPACK and len(message):
+        yield from _iter_msgpack_array(message)
+    else:
+        decoded = decode(message, payload_format)
+        if isinstance(decoded, list):
+            decoded.reverse()
+            while decoded:
+                yield decoded.pop()
+        else:
+            yield decoded
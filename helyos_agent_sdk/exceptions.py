@@ -18,3 +18,33 @@ class HelyOSClientAutheticationError(Exception):
 class HelyOSCheckinError(Exception):
     """ Raised on check in errors. """
     pass
+
+
+class HelyOSPublishError(Exception):
+    """ Raised when the broker rejects (nacks) a published message or the channel closes before confirming it. """
+    pass
+
+
+class HelyOSOutboxFullError(HelyOSPublishError):
+    """ Raised when a message that may not be dropped would grow the outbox beyond its hard size limit. """
+    pass
+
+
+class HelyOSUnsupportedError(Exception):
+    """ Raised when a feature of the blocking :class:`HelyOSClient` is called on a client that does not support it. """
+    pass
+
+
+class HelyOSTimeoutError(Exception):
+    """ Raised when helyOS, or the AMQP I/O thread, does not answer a request in time. """
+    pass
+
+
+class HelyOSDispatcherFullError(Exception):
+    """ Raised when a callback is submitted to an :class:`AsyncCallbackDispatcher` that has `max_queued` callbacks. """
+    pass
+
+
+class HelyOSCancelledError(Exception):
+    """ Raised by :meth:`CancelToken.raise_if_cancelled` when helyOS has cancelled the assignment. """
+    pass
@@ -0,0 +1,383 @@
+import asyncio
+import functools
+import logging
+import time
+from .exceptions import *
+from .models import AGENT_STATE
+from .crypto import RSA
+from .async_client import AsyncHelyOSClient, connect_rabbitmq_async, open_channel_async
+from .connection_profile import ASYNC_PROFILE
+from .async_connector import AsyncAgentConnector
+
+ANONYMOUS = 'anonymous'
+
+
+class FleetAgentClient(AsyncHelyOSClient):
+
+    def __init__(self, fleet, uuid, agent_privkey=None, agent_pubkey=None, signature_algorithm=RSA, keystore=None,
+                 publisher_confirms=False, max_in_flight=1000):
+        """ Asyncio client of one agent of an :class:`AgentFleet`
+
+            Instead of opening its own connections, the client opens a channel on a connection shared by the fleet,
+            both for the anonymous check-in and for the agent account. Created by :meth:`AgentFleet.add_agent`.
+        """
+        super().__init__(fleet.rabbitmq_host, fleet.rabbitmq_port, uuid, fleet.enable_ssl, fleet.ca_certificate,
+                         fleet.helyos_public_key, agent_privkey, agent_pubkey, signature_algorithm, keystore,
+                         publisher_confirms, max_in_flight, fleet.connection_profile)
+        self.fleet = fleet
+
+    async def connect(self, username, password):
+        """ Open the channel of the agent on a connection of the fleet.
+
+            The agent publishes with `user_id=username`. If the fleet is connected with a shared account, the channel
+            is opened on the shared connections; otherwise, on connections opened with these credentials.
+        """
+        try:
+            self.connection, self.channel = await self.fleet._open_channel(username, password)
+            if self.publisher is not None:
+                await self.publisher.bind(self.channel)
+            self.rbmq_username = username
+            self.rbmq_password = password
+
+        except Exception as inst:
+            raise HelyOSAccountConnectionError(
+                f'Not able to connect as {username} to rabbitMQ. {inst}')
+
+    async def _open_guest_channel(self):
+        return (await self.fleet._open_channel(ANONYMOUS, ANONYMOUS, temporary=True))[1]
+
+    def _close_guest_channel(self):
+        if self.guest_channel is not None and self.guest_channel is not self.channel and self.guest_channel.is_open:
+            self.guest_channel.close()
+
+    async def publish(self, routing_key, message, *args, **kwargs):
+        confirmation = await super().publish(routing_key, message, *args, **kwargs)
+        self.fleet.published += 1
+        return confirmation
+
+    def _counted(self, callback):
+        @functools.wraps(callback)
+        def wrap(*args):
+            self.fleet.received += 1
+            return callback(*args)
+
+        return wrap
+
+    async def consume_assignment_messages(self, assignment_callback):
+        await super().consume_assignment_messages(self._counted(assignment_callback))
+        # restore_consumers() counts the deliveries again through this method
+        self._consumers['assignment'] = assignment_callback
+
+    async def consume_instant_actions_messages(self, instant_actions_callback):
+        await super().consume_instant_actions_messages(self._counted(instant_actions_callback))
+        self._consumers['instant_actions'] = instant_actions_callback
+
+    async def close_connection(self):
+        """ Close the channel of the agent. The connection is shared and is closed by :meth:`AgentFleet.close`. """
+        self.stop_listening()
+        if self.channel is not None and self.channel.is_open:
+            self.channel.close()
+
+
+class AgentFleet():
+
+    def __init__(self, rabbitmq_host, rabbitmq_port=5672, enable_ssl=False, ca_certificate=None,
+                 helyos_public_key=None, connections=1, checkin_concurrency=100, publisher_confirms=False,
+                 max_in_flight=1000, connection_profile=None):
+        """ Fleet of asyncio agents multiplexed over shared RabbitMQ connections
+
+            Runs many agent identities (uuid, keys and :class:`AsyncAgentConnector` state) in one process and one
+            event loop. Each agent has its own channel, but the channels are opened on at most `connections` AMQP
+            connections per account instead of one connection per agent. Check-ins run concurrently, and
+            assignments and instant actions are delivered on the agent's channel to the callbacks of its connector.
+
+            .. code-block:: python
+
+                fleet = AgentFleet('myrabbitmq.com', 5672, connections=2)
+                for uuid in agent_uuids:
+                    fleet.add_agent(uuid, signature_algorithm=ED25519)
+                await fleet.checkin(yard_uid='yard_A')
+                await fleet.consume_assignment_messages(assignment_callback)
+                await fleet[agent_uuids[0]].publish_state(AGENT_STATE.FREE)
+                await fleet.start_listening()
+
+            The fleet callbacks receive the connector of the agent as first argument, followed by the arguments of
+            the :class:`AgentConnector` callbacks.
+
+            RabbitMQ checks that the `user_id` of a published message is the user of the connection. When helyOS
+            creates an account per agent at check-in, the agents are connected on connections opened with their own
+            credentials, unless the fleet was connected with :meth:`connect` using an account with the RabbitMQ tag
+            `impersonator`, in which case all agents share the connections of that account. The number of channels
+            per connection is limited by the broker (`channel_max`, 2047 by default in RabbitMQ).
+
+            Key generation for hundreds of agents is faster with `signature_algorithm=ED25519` or a keystore.
+
+            :param rabbitmq_host: RabbitMQ host name (e.g rabbitmq.mydomain.com)
+            :type rabbitmq_host: str
+            :param rabbitmq_port: RabbitMQ port, defaults to 5672
+            :type rabbitmq_port: int
+            :param enable_ssl: Enable rabbitmq SSL connection, default False.
+            :type enable_ssl: bool, optional
+            :param ca_certificate: Certificate authority of the RabbitMQ server, defaults to None
+            :type ca_certificate: string (PEM format), optional
+            :param helyos_public_key: helyOS public key to verify the helyOS message signature.
+            :type helyos_public_key:  string (PEM format), optional
+            :param connections: Maximum number of connections per account, defaults to 1
+            :type connections: int
+            :param checkin_concurrency: Maximum number of check-ins waiting for a response at once, defaults to 100
+            :type checkin_concurrency: int
+            :param publisher_confirms: Enable pipelined publisher confirms on the agent channels, defaults to False
+            :type publisher_confirms: bool
+            :param max_in_flight: Maximum number of unconfirmed messages per agent in confirm mode, defaults to 1000
+            :type max_in_flight: int
+            :param connection_profile: Heartbeat, blocked-connection timeout and socket options of the account
+                                       connections, defaults to ASYNC_PROFILE. The temporary check-in connections
+                                       use TEMPORARY_PROFILE.
+            :type connection_profile: ConnectionProfile
+        """
+        self.rabbitmq_host = rabbitmq_host
+        self.rabbitmq_port = rabbitmq_port
+        self.enable_ssl = enable_ssl
+        self.ca_certificate = ca_certificate
+        self.helyos_public_key = helyos_public_key
+        self.connections = connections
+        self.checkin_concurrency = checkin_concurrency
+        self.publisher_confirms = publisher_confirms
+        self.max_in_flight = max_in_flight
+        self.connection_profile = connection_profile or ASYNC_PROFILE
+
+        self.agents = {}
+        self.username = None
+        self.password = None
+
+        self.published = 0
+        self.received = 0
+        self.checked_in = 0
+        self.checkin_failed = 0
+        self.checkin_duration = None
+        self.started_at = time.monotonic()
+
+        self._pools = {}
+        self._pool_locks = {}
+        self._next_connection = 0
+        self._listening = None
+        self._closing = False
+
+    def __getitem__(self, uuid):
+        return self.agents[uuid]
+
+    def __iter__(self):
+        return iter(self.agents.values())
+
+    def __len__(self):
+        return len(self.agents)
+
+    def add_agent(self, uuid, agent_privkey=None, agent_pubkey=None, signature_algorithm=RSA, keystore=None, pose=None,
+                  payload_formats=None):
+        """ Add an agent identity to the fleet.
+
+            The keys, `signature_algorithm` and `keystore` are used as in :class:`HelyOSClient`; `pose` and
+            `payload_formats` as in :class:`AgentConnector`.
+
+            :return: the connector of the agent
+            :rtype: AsyncAgentConnector
+        """
+        if uuid in self.agents:
+            raise ValueError(f'Agent already in the fleet: {uuid}')
+        helyos_client = FleetAgentClient(self, uuid, agent_privkey, agent_pubkey, signature_algorithm, keystore,
+                                         self.publisher_confirms, self.max_in_flight)
+        agent_connector = AsyncAgentConnector(helyos_client, pose, payload_formats=payload_formats)
+        self.agents[uuid] = agent_connector
+        return agent_connector
+
+    async def connect(self, username, password):
+        """ Connect all agents with a shared account.
+
+            The agents publish with their own username if they received an account at check-in, which requires the
+            `impersonator` tag for this account; otherwise they publish as `username`.
+
+            :param username:  username previously registered in RabbitMQ server
+            :type username: str
+            :param password: password previously registered in RabbitMQ server'
+            :type password: str
+        """
+        self.username = username
+        self.password = password
+        results = await self._gather([agent.helyos_client.connect(agent.helyos_client.rbmq_username or username,
+                                                                  agent.helyos_client.rbmq_password or password)
+                                      for agent in self])
+        self._raise_first_error(results)
+
+    async def _open_channel(self, username, password, temporary=False):
+        """ Open a channel on a connection of the account, opening the connection if the pool is not full. """
+        if not temporary and self.username is not None:
+            connection_username, connection_password = self.username, self.password
+        else:
+            connection_username, connection_password = username, password
+
+        lock = self._pool_locks.get(connection_username)
+        if lock is None:
+            lock = self._pool_locks[connection_username] = asyncio.Lock()
+        async with lock:
+            pool = self._pools.setdefault(connection_username, [])
+            pool[:] = [connection for connection in pool if connection.is_open]
+            if len(pool) < self.connections:
+                connection = await connect_rabbitmq_async(self.rabbitmq_host, self.rabbitmq_port, connection_username,
+                                                          connection_password, self.enable_ssl, self.ca_certificate,
+                                                          temporary=temporary,
+                                                          on_close_callback=self._on_connection_closed,
+                                                          profile=None if temporary else self.connection_profile)
+                pool.append(connection)
+            else:
+                self._next_connection += 1
+                connection = pool[self._next_connection % len(pool)]
+
+        return connection, await open_channel_async(connection)
+
+    def _on_connection_closed(self, connection, reason):
+        for agent in self:
+            if agent.helyos_client.connection is connection:
+                agent.helyos_client._on_connection_closed(connection, reason)
+        if self._listening is not None and not self._listening.done() and not self._closing:
+            if any(connection in pool for username, pool in self._pools.items() if username != ANONYMOUS):
+                self._listening.set_exception(HelyOSAccountConnectionError(f'Connection closed: {reason}'))
+
+    async def _gather(self, coroutines):
+        semaphore = asyncio.Semaphore(self.checkin_concurrency)
+
+        async def limited(coroutine):
+            async with semaphore:
+                return await coroutine
+
+        return await asyncio.gather(*[limited(coroutine) for coroutine in coroutines], return_exceptions=True)
+
+    async def _checkin_agent(self, agent, yard_uid, status, agent_data, signed, timeout):
+        helyos_client = agent.helyos_client
+        await helyos_client.perform_checkin(yard_uid, status, agent_data, signed)
+        return await helyos_client.get_checkin_result(timeout)
+
+    async def checkin(self, yard_uid, status=AGENT_STATE.FREE, agent_data={}, signed=False, timeout=None):
+        """ Check in all agents concurrently.
+
+            The anonymous check-ins share the anonymous connections of the fleet, which are closed afterwards. Agents
+            that fail to check in stay in the fleet without connection.
+
+            :param yard_uid: Yard UID
+            :type yard_uid: str
+            :param status: Agent status, defaults to AGENT_STATE.FREE
+            :type status: str
+            :param agent_data: Check-in data of all agents, or a function returning the check-in data of an agent
+                               connector, defaults to {}
+            :type agent_data: dict, callable
+            :param signed: If the check-in messages should be signed, defaults to False
+            :type signed: bool
+            :param timeout: Seconds to wait for each response, defaults to the client `checkin_timeout`
+            :type timeout: float
+            :return: check-in data or exception per agent uuid
+            :rtype: dict
+        """
+        started = time.monotonic()
+        agents = list(self)
+        try:
+            results = await self._gather([
+                self._checkin_agent(agent, yard_uid, status, agent_data(agent) if callable(agent_data) else agent_data,
+                                    signed, timeout)
+                for agent in agents])
+        finally:
+            for connection in self._pools.pop(ANONYMOUS, []):
+                if connection.is_open:
+                    connection.close()
+        self.checkin_duration = time.monotonic() - started
+
+        checkin_results = {}
+        for agent, result in zip(agents, results):
+            if isinstance(result, Exception):
+                self.checkin_failed += 1
+                logging.error(f'Check in of agent {agent.helyos_client.uuid} failed: {result}')
+            else:
+                self.checked_in += 1
+            checkin_results[agent.helyos_client.uuid] = result
+        return checkin_results
+
+    def _connected_agents(self):
+        return [agent for agent in self if agent.helyos_client.connection is not None]
+
+    async def consume_assignment_messages(self, assignment_callback=None, other_callback=None):
+        """ Register the assignment callbacks of all connected agents.
+
+            Same callbacks as :meth:`AgentConnector.consume_assignment_messages`, called with the agent connector as
+            first argument. The callbacks may be coroutine functions.
+        """
+        results = await self._gather([
+            agent.consume_assignment_messages(assignment_callback and functools.partial(assignment_callback, agent),
+                                              other_callback and functools.partial(other_callback, agent))
+            for agent in self._connected_agents()])
+        self._raise_first_error(results)
+
+    async def consume_instant_action_messages(self, reserve_callback=None, release_callback=None, cancel_callback=None,
+                                              other_callback=None):
+        """ Register the instant action callbacks of all connected agents.
+
+            Same callbacks as :meth:`AgentConnector.consume_instant_action_messages`, called with the agent connector
+            as first argument. The callbacks may be coroutine functions.
+        """
+        results = await self._gather([
+            agent.consume_instant_action_messages(reserve_callback and functools.partial(reserve_callback, agent),
+                                                  release_callback and functools.partial(release_callback, agent),
+                                                  cancel_callback and functools.partial(cancel_callback, agent),
+                                                  other_callback and functools.partial(other_callback, agent))
+            for agent in self._connected_agents()])
+        self._raise_first_error(results)
+
+    def _raise_first_error(self, results):
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+
+    async def start_listening(self):
+        """ Wait until `stop_listening()` is called or a shared connection is lost. """
+        self._listening = asyncio.get_running_loop().create_future()
+        await self._listening
+
+    def stop_listening(self):
+        if self._listening is not None and not self._listening.done():
+            self._listening.set_result(None)
+
+    async def close(self):
+        """ Close the channels of the agents and all connections of the fleet. """
+        self._closing = True
+        self.stop_listening()
+        for agent in self:
+            await agent.helyos_client.close_connection()
+        loop = asyncio.get_running_loop()
+        closing = []
+        for pool in self._pools.values():
+            for connection in pool:
+                if connection.is_open:
+                    closed = loop.create_future()
+                    connection.add_on_close_callback(lambda *args, closed=closed: closed.done() or closed.set_result(None))
+                    connection.close()
+                    closing.append(closed)
+        await asyncio.gather(*closing)
+        self._pools.clear()
+        self._closing = False
+
+    def summary(self):
+        """ Agents, connections and channels, check-in results and aggregate throughput (msg/s) of the fleet. """
+        elapsed = max(time.monotonic() - self.started_at, 1e-9)
+        summary = {'agents': len(self.agents),
+                   'connected': len(self._connected_agents()),
+                   'connections': sum(len(pool) for pool in self._pools.values()),
+                   'checked_in': self.checked_in,
+                   'checkin_failed': self.checkin_failed,
+                   'checkin_duration': self.checkin_duration,
+                   'published': self.published,
+                   'received': self.received,
+                   'publish_throughput': self.published / elapsed,
+                   'receive_throughput': self.received / elapsed}
+        if self.publisher_confirms:
+            stats = [agent.helyos_client.publisher_stats() for agent in self]
+            summary['acked'] = sum(stat['acked'] for stat in stats)
+            summary['nacked'] = sum(stat['nacked'] for stat in stats)
+            summary['in_flight'] = sum(stat['in_flight'] for stat in stats)
+        return summary
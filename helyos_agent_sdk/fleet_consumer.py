@@ -0,0 +1,191 @@
+import logging
+from .client import AGENTS_DL_EXCHANGE
+from .async_client import _call_async
+from .connector import parse_assignment_message, parse_instant_actions
+
+ASSIGNMENT = 'assignment'
+INSTANT_ACTIONS = 'instantActions'
+ROUTED_MESSAGE_TYPES = (ASSIGNMENT, INSTANT_ACTIONS)
+
+
+class FleetConsumer():
+
+    def __init__(self, helyos_client, exchange=AGENTS_DL_EXCHANGE, unrouted_callback=None):
+        """ Wildcard consumer of assignments and instant actions for many agents
+
+            Used by gateway processes that front many agents with a single helyOS client. Instead of one queue per
+            agent and message type, one exclusive queue is bound to `agent.*.assignment` and `agent.*.instantActions`
+            (AMQP), or the client subscribes once to `agent/+/assignment` and `agent/+/instantActions` (MQTT). Each
+            delivery is routed to the handler of its agent through a uuid index.
+
+            .. code-block:: python
+
+                fleet_consumer = FleetConsumer(helyos_client)
+                fleet_consumer.add_connector(agent_connector_1)
+                fleet_consumer.add_agent('3452345-52453-43525', assignment_callback=my_assignment_handler)
+                fleet_consumer.start()
+                helyos_client.start_listening()
+
+            The queue receives the messages of all agents the account is allowed to read. Deliveries for agents
+            without handler are counted as unrouted and passed to `unrouted_callback`, if given. Handlers can be
+            added and removed while consuming. If manual acknowledgements are enabled on the client
+            (`enable_manual_ack()`) before `start()`, the deliveries of the wildcard queue are acknowledged by its
+            acknowledger like those of the agent queues, and the prefetch applies to the wildcard queue.
+
+            :param helyos_client: Connected HelyOS client (AMQP or MQTT)
+            :type helyos_client: HelyOSClient
+            :param exchange: RabbitMQ exchange, defaults to env.AGENTS_DL_EXCHANGE
+            :type exchange: str
+            :param unrouted_callback: Delivery callback for messages of unknown agents, defaults to None
+            :type unrouted_callback: func
+        """
+        self.helyos_client = helyos_client
+        self.exchange = exchange
+        self.unrouted_callback = unrouted_callback
+        self.queue = None
+
+        self.routed = 0
+        self.unrouted = 0
+
+        self._routes = {message_type: {} for message_type in ROUTED_MESSAGE_TYPES}
+
+    @property
+    def _separator(self):
+        return '/' if self.helyos_client._protocol == 'MQTT' else '.'
+
+    def binding_keys(self):
+        """ Wildcard routing keys (AMQP) or topics (MQTT) of the consumer. """
+        separator = self._separator
+        wildcard = '+' if separator == '/' else '*'
+        return [separator.join(('agent', wildcard, message_type)) for message_type in ROUTED_MESSAGE_TYPES]
+
+    def add_agent(self, uuid, assignment_callback=None, instant_actions_callback=None):
+        """ Route the deliveries of an agent to delivery callbacks.
+
+            The callbacks have the same signature as those given to `HelyOSClient.consume_assignment_messages()`:
+            (ch, method, properties, body) for AMQP, (client, userdata, message) for MQTT.
+        """
+        if assignment_callback is not None:
+            self._routes[ASSIGNMENT][uuid] = assignment_callback
+        if instant_actions_callback is not None:
+            self._routes[INSTANT_ACTIONS][uuid] = instant_actions_callback
+
+    def add_connector(self, agent_connector, uuid=None):
+        """ Route the deliveries of an agent to the callbacks of its :class:`AgentConnector`.
+
+            The callbacks are set as in `consume_assignment_messages()` and `consume_instant_action_messages()` of the
+            connector. Coroutine callbacks of an :class:`AsyncAgentConnector` are scheduled on the event loop.
+
+            :param agent_connector: Connector of the agent
+            :type agent_connector: AgentConnector
+            :param uuid: Agent uuid, defaults to the uuid of the connector's client
+            :type uuid: str
+        """
+        uuid = uuid or agent_connector.helyos_client.uuid
+        schedule = getattr(agent_connector, '_schedule', lambda result: result)
+
+        if self.helyos_client._protocol == 'MQTT':
+            def assignment_callback(client, userdata, message):
+                return schedule(parse_assignment_message(agent_connector, client, {'user_id': None}, message.payload,
+                                                         text_payload=True))
+
+            def instant_actions_callback(client, userdata, message):
+                return schedule(parse_instant_actions(agent_connector, client, {'user_id': None}, message.payload,
+                                                      text_payload=True))
+        else:
+            def assignment_callback(ch, method, properties, body):
+                return schedule(parse_assignment_message(agent_connector, ch, properties, body))
+
+            def instant_actions_callback(ch, method, properties, body):
+                return schedule(parse_instant_actions(agent_connector, ch, properties, body))
+
+        self.add_agent(uuid, assignment_callback, instant_actions_callback)
+
+    def remove_agent(self, uuid):
+        for routes in self._routes.values():
+            routes.pop(uuid, None)
+
+    @property
+    def agents(self):
+        """ uuids of the agents with at least one handler """
+        return set(self._routes[ASSIGNMENT]) | set(self._routes[INSTANT_ACTIONS])
+
+    def _route(self, routing_key, *delivery):
+        # 'agent.{uuid}.{message_type}' or 'agent/{uuid}/{message_type}'; the uuid may contain the separator
+        separator = self._separator
+        prefix, _, key = routing_key.partition(separator)
+        uuid, _, message_type = key.rpartition(separator)
+        routes = self._routes.get(message_type, None) if prefix == 'agent' and uuid else None
+        handler = routes.get(uuid, None) if routes is not None else None
+        if handler is None:
+            self.unrouted += 1
+            if self.unrouted_callback is not None:
+                return self.unrouted_callback(*delivery)
+            return None
+        self.routed += 1
+        return handler(*delivery)
+
+    def _route_amqp(self, ch, method, properties, body):
+        return self._route(method.routing_key, ch, method, properties, body)
+
+    def _on_amqp_delivery(self, ch, method, properties, body):
+        try:
+            return self._route_amqp(ch, method, properties, body)
+        except Exception:
+            logging.exception(f'Error occurred while routing {method.routing_key}.')
+
+    def _amqp_delivery_callback(self):
+        # with manual acknowledgements, the acknowledger logs and rejects the deliveries whose handler failed
+        return self._on_amqp_delivery if self.helyos_client.acknowledger is None else self._route_amqp
+
+    def _on_mqtt_delivery(self, client, userdata, message):
+        try:
+            return self._route(message.topic, client, userdata, message)
+        except Exception:
+            logging.exception(f'Error occurred while routing {message.topic}.')
+
+    def _subscribe_mqtt(self):
+        for topic in self.binding_keys():
+            self.helyos_client.channel.subscribe(topic)
+            self.helyos_client.channel.message_callback_add(topic, self._on_mqtt_delivery)
+
+    def _start_amqp(self):
+        channel = self.helyos_client.channel
+        # exclusive: a wildcard queue left behind would keep collecting the messages of all agents
+        self.queue = channel.queue_declare(queue='', exclusive=True).method.queue
+        for routing_key in self.binding_keys():
+            channel.queue_bind(queue=self.queue, exchange=self.exchange, routing_key=routing_key)
+        self.helyos_client._basic_consume(self.queue, self._amqp_delivery_callback())
+
+    def start(self):
+        """ Declare and bind the wildcard queue, or subscribe to the wildcard topics, and start routing. """
+        if self.helyos_client._protocol == 'MQTT':
+            return self._subscribe_mqtt()
+        if getattr(self.helyos_client, 'io_thread', None) is not None:
+            return self.helyos_client.io_thread.call(self._start_amqp)
+        return self._start_amqp()
+
+    def summary(self):
+        """ Registered agents and routed/unrouted deliveries. """
+        return {'agents': len(self.agents),
+                'routed': self.routed,
+                'unrouted': self.unrouted}
+
+
+class AsyncFleetConsumer(FleetConsumer):
+    """ Asyncio variant of :class:`FleetConsumer` for :class:`AsyncHelyOSClient` and :class:`AsyncHelyOSMQTTClient`.
+        `start()` is a coroutine.
+    """
+
+    async def start(self):
+        """ Declare and bind the wildcard queue, or subscribe to the wildcard topics, and start routing. """
+        if self.helyos_client._protocol == 'MQTT':
+            return self._subscribe_mqtt()
+
+        channel = self.helyos_client.channel
+        # exclusive: a wildcard queue left behind would keep collecting the messages of all agents
+        declared = await _call_async(channel.queue_declare, queue='', exclusive=True)
+        self.queue = declared.method.queue
+        for routing_key in self.binding_keys():
+            await _call_async(channel.queue_bind, queue=self.queue, exchange=self.exchange, routing_key=routing_key)
+        await self.helyos_client._basic_consume(self.queue, self._amqp_delivery_callback())
@@ -0,0 +1,268 @@
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+import pika
+from .exceptions import HelyOSOutboxFullError, HelyOSTimeoutError
+
+
+class AMQPIOThread():
+
+    def __init__(self, helyos_client, max_batch=500, poll_interval=0.05, scheduler=None, max_attempts=3,
+                 stop_timeout=5.0, call_timeout=30.0):
+        """ Dedicated I/O thread that owns the BlockingConnection of a :class:`HelyOSClient`.
+
+            pika's BlockingConnection is not thread-safe. In this mode, only the I/O thread touches the connection:
+            `enqueue()` appends outbound messages to a deque from any thread, and the I/O thread publishes them in
+            batches of up to `max_batch` messages between heartbeats and consumer deliveries. Other channel operations
+            are run on the I/O thread with `call()`. Consumer callbacks are executed on the I/O thread. After a lost
+            connection, the I/O thread reconnects and registers the consumers again on the new channel.
+
+            Usually created by :meth:`HelyOSClient.start_io_thread`.
+
+            :param helyos_client: Connected HelyOS client
+            :type helyos_client: HelyOSClient
+            :param max_batch: Maximum number of messages published per drain, defaults to 500
+            :type max_batch: int
+            :param poll_interval: Maximum time in seconds spent waiting for broker events between drains, defaults to 0.05
+            :type poll_interval: float
+            :param scheduler: Priority scheduler replacing the outbound deque, defaults to None
+            :type scheduler: OutboundScheduler
+            :param max_attempts: Attempts to publish a message that fails with an error other than a connection error,
+                                 after which the message is dropped, defaults to 3
+            :type max_attempts: int
+            :param stop_timeout: Seconds after `stop()` within which the queued messages must be published; the rest is
+                                 stored in the outbox if enabled, dropped otherwise, defaults to 5
+            :type stop_timeout: float
+            :param call_timeout: Seconds `call()` waits for the I/O thread to run a function, defaults to 30
+            :type call_timeout: float
+        """
+        self.helyos_client = helyos_client
+        self.max_batch = max_batch
+        self.poll_interval = poll_interval
+        self.scheduler = scheduler
+        self.outbound = deque() if scheduler is None else scheduler
+        self.max_attempts = max_attempts
+        self.stop_timeout = stop_timeout
+        self.call_timeout = call_timeout
+
+        self.sent = 0
+        self.batches = 0
+        self.dropped = 0
+
+        self._publish_failures = 0
+        self._stop_deadline = None
+
+        self._class_channels = {}
+        self._wakeup_pending = False
+        self._running = False
+        self._thread = None
+        self._listening = threading.Event()
+
+    @property
+    def is_alive(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def is_current_thread(self):
+        return threading.current_thread() is self._thread
+
+    def start(self):
+        if self.is_alive:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='helyos-amqp-io', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """ Stop the thread after publishing the messages still in the queue.
+
+            Messages that are not published within `stop_timeout` seconds, or before the connection is lost, are
+            stored in the outbox if enabled and dropped otherwise.
+        """
+        self._stop_deadline = time.monotonic() + self.stop_timeout
+        self._running = False
+        self._wake()
+        if self._thread is not None and not self.is_current_thread():
+            self._thread.join(timeout)
+        self._listening.set()
+
+    def enqueue(self, exchange, routing_key, properties, body):
+        """ Queue a message to be published by the I/O thread. Safe to call from any thread. """
+        # append before reading the flag: a drain that already cleared the flag will either see this message or be
+        # rescheduled by this call
+        if self.scheduler is None:
+            self.outbound.append((exchange, routing_key, properties, body))
+        else:
+            # the I/O thread must not wait for itself to drain a full queue
+            self.scheduler.put((exchange, routing_key, properties, body), routing_key,
+                               block=not self.is_current_thread())
+        if not self._wakeup_pending:
+            self._wakeup_pending = True
+            self._wake()
+
+    def call(self, func, *args, **kwargs):
+        """ Run func on the I/O thread and return its result.
+
+            Raises HelyOSTimeoutError if the I/O thread does not run func within `call_timeout` seconds, e.g. because
+            it stopped in the meantime.
+        """
+        if not self.is_alive or self.is_current_thread():
+            return func(*args, **kwargs)
+
+        future = Future()
+
+        def run():
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(func(*args, **kwargs))
+            except Exception as err:
+                future.set_exception(err)
+
+        self.helyos_client.connection.add_callback_threadsafe(run)
+        try:
+            return future.result(self.call_timeout)
+        except FutureTimeoutError:
+            if future.cancel():
+                raise HelyOSTimeoutError(f'The AMQP I/O thread did not run {func.__name__} within '
+                                         f'{self.call_timeout} s.')
+            # started in the meantime
+            return future.result()
+
+    def wait_listening(self):
+        """ Block the caller until `stop_listening()` is called or the thread stops. """
+        self._listening.clear()
+        self._listening.wait()
+
+    def stop_listening(self):
+        self._listening.set()
+
+    def _wake(self):
+        try:
+            self.helyos_client.connection.add_callback_threadsafe(self._drain)
+        except Exception:
+            # connection is closed, the queue is drained after reconnecting
+            pass
+
+    def _channel_of(self, traffic_class):
+        """ Channel of a traffic class of the scheduler, opened on first use and after reconnections. """
+        if traffic_class is None or not self.scheduler.separate_channels:
+            return self.helyos_client.channel
+        channel = self._class_channels.get(traffic_class.name, None)
+        if channel is None or not channel.is_open or channel.connection is not self.helyos_client.connection:
+            channel = self.helyos_client.connection.channel()
+            self._class_channels[traffic_class.name] = channel
+        return channel
+
+    def _pop(self):
+        """ Return (traffic class, item, enqueue time) of the next message to publish, or None. """
+        if self.scheduler is not None:
+            return self.scheduler.pop()
+        try:
+            return None, self.outbound.popleft(), None
+        except IndexError:
+            return None
+
+    def _push_front(self, traffic_class, item, queued_at):
+        if traffic_class is None:
+            self.outbound.appendleft(item)
+        else:
+            self.scheduler.push_front(traffic_class, item, queued_at)
+
+    def _abandon_outbound(self):
+        """ Store the messages still queued after `stop()` in the outbox, or drop them. """
+        outbox = self.helyos_client.outbox
+        dropped = 0
+        next_item = self._pop()
+        while next_item is not None:
+            exchange, routing_key, properties, body = next_item[1]
+            try:
+                if outbox is None or not outbox.put(exchange, routing_key, properties, body):
+                    dropped += 1
+            except HelyOSOutboxFullError:
+                dropped += 1
+            next_item = self._pop()
+        if dropped:
+            self.dropped += dropped
+            logging.error(f'AMQP I/O thread stopped with {dropped} unpublished messages, which were dropped.')
+
+    def _drain(self):
+        self._wakeup_pending = False
+        count = 0
+        try:
+            while count < self.max_batch:
+                next_item = self._pop()
+                if next_item is None:
+                    break
+                traffic_class, item, queued_at = next_item
+                exchange, routing_key, properties, body = item
+                try:
+                    self._channel_of(traffic_class).basic_publish(exchange, routing_key, body, properties=properties)
+                except (pika.exceptions.AMQPConnectionError, pika.exceptions.AMQPChannelError):
+                    self._push_front(traffic_class, item, queued_at)
+                    raise
+                except Exception:
+                    # e.g. a body that cannot be sent: do not retry it forever, it would hold back the whole queue
+                    self._publish_failures += 1
+                    if self._publish_failures < self.max_attempts:
+                        self._push_front(traffic_class, item, queued_at)
+                        raise
+                    self._publish_failures = 0
+                    self.dropped += 1
+                    logging.exception(f'Dropping the message to {routing_key} after {self.max_attempts} '
+                                      'failed attempts.')
+                    continue
+                self._publish_failures = 0
+                count += 1
+        finally:
+            if count:
+                self.sent += count
+                self.batches += 1
+
+    def _replay_outbox(self):
+        outbox = self.helyos_client.outbox
+        if outbox is None or self.outbound or not outbox.pending:
+            return
+        channel = self.helyos_client.channel
+        replayed = outbox.replay(lambda exchange, routing_key, properties, body: channel.basic_publish(
+            exchange, routing_key, body, properties=properties), self.max_batch)
+        self.sent += replayed
+
+    def _run(self):
+        while self._running or self.outbound:
+            if not self._running and time.monotonic() > self._stop_deadline:
+                self._abandon_outbound()
+                break
+            try:
+                self.helyos_client.connection.process_data_events(time_limit=self.poll_interval)
+                self._drain()
+                self._replay_outbox()
+
+            except (pika.exceptions.AMQPConnectionError, pika.exceptions.AMQPChannelError) as err:
+                if not self._running:
+                    self._abandon_outbound()
+                    break
+                logging.warning(f'AMQP I/O thread lost the connection: {err}. Reconnecting...')
+                try:
+                    self.helyos_client.reconnect()
+                    # the queues and consumers of the lost connection are gone
+                    self.helyos_client.restore_consumers()
+                except Exception as reconnection_error:
+                    logging.warning(f'AMQP I/O thread could not reconnect: {reconnection_error}')
+                    time.sleep(3)  # Wait for a few seconds before reconnecting
+
+            except Exception:
+                logging.exception('Error occurred in the AMQP I/O thread.')
+
+        self._listening.set()
+
+    def summary(self):
+        """ Queue depth and published messages and batches, and the per-class statistics of the scheduler. """
+        summary = {'queued': len(self.outbound),
+                   'sent': self.sent,
+                   'batches': self.batches,
+                   'dropped': self.dropped}
+        if self.scheduler is not None:
+            summary['scheduler'] = self.scheduler.summary()
+        return summary
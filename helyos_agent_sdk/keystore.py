@@ -0,0 +1,175 @@
+import os
+import re
+import tempfile
+import threading
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.backends import default_backend
+from .crypto import Signing, generate_private_public_keys, RSA
+
+KEYSTORE_DIR = os.environ.get(
+    'HELYOS_AGENT_KEYSTORE', os.path.join(os.path.expanduser('~'), '.helyos_agent_sdk', 'keys'))
+
+
+class AgentKeystore():
+
+    def __init__(self, directory=KEYSTORE_DIR):
+        """ File-backed keystore of agent private keys
+
+            Keeps one private key per agent uuid and algorithm, so that an agent keeps the same identity key across
+            restarts and the key is generated only once. Files are written atomically and are readable only by the
+            owner (directory 0700, files 0600). The default directory can be set with the environment variable
+            HELYOS_AGENT_KEYSTORE.
+
+            .. code-block:: python
+
+                helyos_client = HelyOSClient('myrabbitmq.com', 5672, uuid='3452345-52453-43525', keystore=AgentKeystore())
+
+            :param directory: Keystore directory, defaults to env.HELYOS_AGENT_KEYSTORE or ~/.helyos_agent_sdk/keys
+            :type directory: str
+        """
+        self.directory = directory
+
+    def path(self, uuid, algorithm=RSA):
+        safe_uuid = re.sub(r'[^A-Za-z0-9_.-]', '_', str(uuid))
+        return os.path.join(self.directory, f'{safe_uuid}.{algorithm}.pem')
+
+    def _read(self, uuid, algorithm):
+        try:
+            with open(self.path(uuid, algorithm), 'rb') as key_file:
+                priv = key_file.read()
+        except FileNotFoundError:
+            return None
+
+        key = serialization.load_pem_private_key(priv, password=None, backend=default_backend())
+        pub = key.public_key().public_bytes(encoding=serialization.Encoding.PEM,
+                                            format=serialization.PublicFormat.SubjectPublicKeyInfo)
+        return key, priv, pub
+
+    def load(self, uuid, algorithm=RSA):
+        """ Return the stored (private_key, public_key) pair in PEM format, or None. """
+        keys = self._read(uuid, algorithm)
+        if keys is None:
+            return None
+        return keys[1:]
+
+    def save(self, uuid, private_key, algorithm=RSA, overwrite=False):
+        """ Atomically store a private key in PEM format.
+
+            :return: False if a key already exists for this uuid and `overwrite` is False
+            :rtype: bool
+        """
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        # makedirs applies the umask to the mode and leaves an existing directory unchanged
+        os.chmod(self.directory, 0o700)
+        path = self.path(uuid, algorithm)
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')  # created with mode 0600
+        try:
+            with os.fdopen(fd, 'wb') as temp_file:
+                temp_file.write(private_key)
+                temp_file.flush()
+                os.fsync(temp_file.fileno())
+            if overwrite:
+                os.replace(temp_path, path)
+                return True
+            try:
+                # link does not replace an existing key created concurrently by another process
+                os.link(temp_path, path)
+                return True
+            except FileExistsError:
+                return False
+            except OSError:
+                if os.path.exists(path):
+                    return False
+                os.replace(temp_path, path)
+                return True
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def _load_or_create(self, uuid, algorithm):
+        keys = self._read(uuid, algorithm)
+        if keys is not None:
+            return keys
+
+        priv, pub = generate_private_public_keys(algorithm)
+        if not self.save(uuid, priv, algorithm):
+            # another process stored its key first
+            return self._read(uuid, algorithm)
+        return None, priv, pub
+
+    def load_or_create(self, uuid, algorithm=RSA):
+        """ Return the stored key pair of the agent in PEM format, generating and storing it on first use. """
+        return self._load_or_create(uuid, algorithm)[1:]
+
+
+class AgentKeysMixin():
+    """ Lazy agent keys shared by the HelyOS clients.
+
+        Keys passed by the application are used as they are. Otherwise, the key pair is loaded from the keystore or
+        generated on first access to `private_key`, `public_key` or `signing_helper`, instead of at initialization.
+        The check-in sends the public key to helyOS, so an agent without keys gets them at check-in; clients that
+        connect with existing credentials and do not sign their messages never generate them. The first access is
+        serialized, so that concurrent threads get the same key pair.
+    """
+
+    def _init_agent_keys(self, agent_privkey, agent_pubkey, signature_algorithm=RSA, keystore=None):
+        if isinstance(keystore, str):
+            keystore = AgentKeystore(keystore)
+        self.keystore = keystore
+        self.signature_algorithm = signature_algorithm
+        self._signing_helper = None
+        self._agent_keys_lock = threading.RLock()
+        if agent_pubkey is None or agent_privkey is None:
+            self._private_key, self._public_key = None, None
+        else:
+            self._private_key, self._public_key = agent_privkey, agent_pubkey
+
+    def _load_agent_keys(self):
+        if self._private_key is not None:
+            return
+        with self._agent_keys_lock:
+            if self._private_key is None:
+                self._create_agent_keys()
+
+    def _create_agent_keys(self):
+        if self.keystore is not None and self.uuid is not None:
+            key, private_key, public_key = self.keystore._load_or_create(self.uuid, self.signature_algorithm)
+            if key is not None:
+                # reuse the parsed key instead of parsing the PEM again
+                self._signing_helper = Signing(key)
+        else:
+            private_key, public_key = generate_private_public_keys(self.signature_algorithm)
+        # the private key is set last: readers that see it without taking the lock must see the public key too
+        self._public_key = public_key
+        self._private_key = private_key
+
+    @property
+    def private_key(self):
+        self._load_agent_keys()
+        return self._private_key
+
+    @private_key.setter
+    def private_key(self, value):
+        self._private_key = value
+        self._signing_helper = None
+
+    @property
+    def public_key(self):
+        self._load_agent_keys()
+        return self._public_key
+
+    @public_key.setter
+    def public_key(self, value):
+        self._public_key = value
+
+    @property
+    def signing_helper(self):
+        if self._signing_helper is None:
+            with self._agent_keys_lock:
+                if self._signing_helper is None:
+                    self._signing_helper = Signing(self.private_key)
+        return self._signing_helper
+
+    @signing_helper.setter
+    def signing_helper(self, value):
+        self._signing_helper = value
@@ -0,0 +1,40 @@
+class LatencyHistogram():
+    """ Latency histogram with fixed buckets in milliseconds. Percentiles are the upper bound of their bucket. """
+
+    BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        milliseconds = 1000 * seconds
+        index = 0
+        while index < len(self.BUCKETS_MS) and milliseconds > self.BUCKETS_MS[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total += milliseconds
+        self.max = max(self.max, milliseconds)
+
+    def percentile(self, fraction):
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        cumulative = 0
+        for index, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return self.BUCKETS_MS[index] if index < len(self.BUCKETS_MS) else self.max
+        return self.max
+
+    def summary(self):
+        labels = [f'<={bound}' for bound in self.BUCKETS_MS] + [f'>{self.BUCKETS_MS[-1]}']
+        return {'count': self.count,
+                'avg_ms': self.total / self.count if self.count else None,
+                'p50_ms': self.percentile(0.5),
+                'p99_ms': self.percentile(0.99),
+                'max_ms': self.max if self.count else None,
+                'buckets_ms': dict(zip(labels, self.counts))}
@@ -0,0 +1,155 @@
+""" Precompiled model codecs
+
+Encoders and decoders for the dataclasses of :mod:`helyos_agent_sdk.models`, generated once when this module is
+imported. The encoders produce the same dictionaries as dataclasses_json's `to_dict(encode_json=True)` (enums as
+values, datetimes as timestamps, nested dataclasses as dictionaries) without inspecting the class on every call.
+The decoders build a model from a dictionary, decoding nested dataclass fields; missing fields take their default
+values, unknown keys are ignored and missing required fields raise TypeError, as the model constructor does.
+
+.. code-block:: python
+
+    message_dict = to_dict(AgentStateMessage(uuid=uuid, body=state_body))
+    assignment = codec(AssignmentCommandMessage).from_dict(received_message)
+"""
+import dataclasses
+from datetime import datetime
+from decimal import Decimal
+from enum import Enum
+from uuid import UUID
+from . import envelope
+from . import models
+
+_SCALARS = frozenset((str, int, float, bool, type(None)))
+
+_codecs = {}
+_encoders = {}
+
+
+def _value(value):
+    """ Encode a value of a field that is not a model. """
+    value_type = type(value)
+    if value_type in _SCALARS:
+        return value
+    if value_type is dict:
+        return {key: _value(item) for key, item in value.items()}
+    if value_type is list or value_type is tuple:
+        return [_value(item) for item in value]
+    encoder = _encoders.get(value_type, None)
+    if encoder is not None:
+        return encoder(value)
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, (Decimal, UUID)):
+        return str(value)
+    if isinstance(value, dict):
+        return {key: _value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return [_value(item) for item in value]
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return codec(value_type).to_dict(value)
+    return value
+
+
+class ModelCodec():
+
+    def __init__(self, cls):
+        """ Encoder and decoder of one dataclass, compiled from its fields.
+
+            Usually obtained with :func:`codec`.
+
+            :param cls: The dataclass
+            :type cls: type
+        """
+        self.cls = cls
+        self.fields = dataclasses.fields(cls)
+        _codecs[cls] = self
+        self.to_dict = self._compile_encoder()
+        _encoders[cls] = self.to_dict
+        self.from_dict = self._compile_decoder()
+
+    def _nested_codec(self, field):
+        field_type = field.type
+        if isinstance(field_type, type) and dataclasses.is_dataclass(field_type):
+            return codec(field_type)
+        return None
+
+    def _compile_encoder(self):
+        namespace = {'_value': _value}
+        items = []
+        for index, field in enumerate(self.fields):
+            nested = self._nested_codec(field)
+            if nested is None:
+                items.append(f'{field.name!r}: _value(obj.{field.name})')
+            else:
+                namespace[f'_cls{index}'] = nested.cls
+                namespace[f'_enc{index}'] = nested.to_dict
+                items.append(f'{field.name!r}: (_enc{index}(obj.{field.name}) if type(obj.{field.name}) is _cls{index} '
+                             f'else _value(obj.{field.name}))')
+        source = 'def to_dict(obj):\n    return {' + ', '.join(items) + '}\n'
+        exec(source, namespace)
+        return namespace['to_dict']
+
+    def _compile_decoder(self):
+        names = frozenset(field.name for field in self.fields if field.init)
+        namespace = {'_cls': self.cls, '_names': names, '_MISSING': dataclasses.MISSING}
+        lines = ['def from_dict(data):',
+                 '    if not data.keys() <= _names:',
+                 '        data = {key: value for key, value in data.items() if key in _names}']
+        nested_lines = []
+        for index, field in enumerate(self.fields):
+            nested = self._nested_codec(field)
+            if nested is None or not field.init:
+                continue
+            namespace[f'_dec{index}'] = nested.from_dict
+            nested_lines.append(f'    value = data.get({field.name!r}, _MISSING)')
+            if field.default_factory is not dataclasses.MISSING:
+                namespace[f'_factory{index}'] = field.default_factory
+                nested_lines.append(f'    if value is _MISSING: value = _factory{index}()')
+            elif field.default is not dataclasses.MISSING:
+                namespace[f'_default{index}'] = field.default
+                nested_lines.append(f'    if value is _MISSING: value = _default{index}')
+            nested_lines.append(f'    if type(value) is dict: data[{field.name!r}] = _dec{index}(value)')
+        if nested_lines:
+            # do not modify the caller's dictionary
+            lines += ['    else:', '        data = dict(data)'] + nested_lines
+        lines.append('    return _cls(**data)')
+        exec('\n'.join(lines) + '\n', namespace)
+        return namespace['from_dict']
+
+    def to_bytes(self, obj, payload_format=envelope.JSON, canonical=False):
+        """ Serialize a model in the given payload format. Returns a str for JSON, as :func:`envelope.encode`. """
+        return envelope.encode(self.to_dict(obj), payload_format, canonical)
+
+    def from_bytes(self, data, payload_format=None):
+        """ Deserialize a model; the payload format is detected if not given. """
+        return self.from_dict(envelope.decode(data, payload_format))
+
+
+def codec(cls):
+    """ Return the codec of a dataclass, compiling it on first use. """
+    model_codec = _codecs.get(cls, None)
+    if model_codec is None:
+        model_codec = ModelCodec(cls)
+    return model_codec
+
+
+def to_dict(obj):
+    """ Encode a model instance to a dictionary ready to be serialized. """
+    encoder = _encoders.get(type(obj), None)
+    if encoder is None:
+        encoder = codec(type(obj)).to_dict
+    return encoder(obj)
+
+
+def from_dict(cls, data):
+    """ Build a model instance from a dictionary. """
+    return codec(cls).from_dict(data)
+
+
+for _model in (models.AgentCurrentResources, models.AssignmentCurrentStatus, models.AgentStateBody,
+               models.AssignmentMetadata, models.WorkProcessResourcesRequest, models.Pose, models.AgentCheckinData,
+               models.AgentStateMessage, models.MissionRequestMessage, models.CheckinResponseMessage,
+               models.AssignmentCommandMessage, models.AssignmentCancelMessage, models.WorkProcessClearanceMessage):
+    codec(_model)
@@ -1,13 +1,16 @@
 from functools import wraps
 import os
-import json
+from . import envelope
+from .compression import PayloadCompressor, DEFAULT_THRESHOLD
 import ssl
 
 from helyos_agent_sdk.models import CheckinResponseMessage
 from .exceptions import *
 import paho.mqtt.client as mqtt
 import time
-from .crypto import Signing, generate_private_public_keys
+from .crypto import public_key_format, RSA
+from .keystore import AgentKeysMixin
+from .connection_profile import DEFAULT_PROFILE, TEMPORARY_PROFILE
 
 AGENTS_UL_EXCHANGE = os.environ.get(
     'AGENTS_UL_EXCHANGE', 'xchange_helyos.agents.ul')
@@ -21,24 +24,10 @@ AGENTS_MQTT_EXCHANGE = os.environ.get(
     'AGENTS_MQTT_EXCHANGE', 'xchange_helyos.agents.mqtt')
 
 
-def connect_mqtt(rabbitmq_host, rabbitmq_port, username, passwd, enable_ssl=False, ca_certificate=None, temporary=False):
-    global mqtt_msg
-    LOGMSG = ['success, connection accepted',
-              'connection refused, bad protocol',
-              'refused, client-id error',
-              'refused, service unavailable',
-              'refused, bad username or password',
-              'refused, not authorized'
-              ]
+def create_mqtt_client(username, passwd, enable_ssl=False, ca_certificate=None, temporary=False):
+    """ Build a not yet connected paho client, shared by the blocking and the asyncio clients. """
     mqtt_client = mqtt.Client()
     mqtt_client.username_pw_set(username, passwd)
-    mqtt_msg = 'not connected'
-
-    def on_connect(client, userdata, flags, rc):
-        global mqtt_msg
-        mqtt_msg = LOGMSG[rc]
-
-    mqtt_client.on_connect = on_connect
 
     if enable_ssl:
         context = ssl.create_default_context(cadata=ca_certificate)
@@ -56,7 +45,38 @@ def connect_mqtt(rabbitmq_host, rabbitmq_port, username, passwd, enable_ssl=Fals
     else:
         mqtt_client._connect_timeout = 600
 
-    mqtt_client.connect(rabbitmq_host, rabbitmq_port)
+    return mqtt_client
+
+
+def connect_mqtt(rabbitmq_host, rabbitmq_port, username, passwd, enable_ssl=False, ca_certificate=None, temporary=False,
+                 profile=None):
+    """ Connect a paho client.
+
+        :param profile: Keep-alive and socket options, defaults to DEFAULT_PROFILE, or TEMPORARY_PROFILE for temporary
+                        connections
+        :type profile: ConnectionProfile
+    """
+    global mqtt_msg
+    LOGMSG = ['success, connection accepted',
+              'connection refused, bad protocol',
+              'refused, client-id error',
+              'refused, service unavailable',
+              'refused, bad username or password',
+              'refused, not authorized'
+              ]
+    mqtt_client = create_mqtt_client(username, passwd, enable_ssl, ca_certificate, temporary)
+    mqtt_msg = 'not connected'
+
+    def on_connect(client, userdata, flags, rc):
+        global mqtt_msg
+        mqtt_msg = LOGMSG[rc]
+
+    mqtt_client.on_connect = on_connect
+
+    if profile is None:
+        profile = TEMPORARY_PROFILE if temporary else DEFAULT_PROFILE
+    mqtt_client.connect(rabbitmq_host, rabbitmq_port, keepalive=profile.mqtt_keepalive)
+    profile.apply_to_socket(mqtt_client.socket())
     started = time.time()
     while time.time() - started < 3.0:
         mqtt_client.loop()
@@ -66,10 +86,11 @@ def connect_mqtt(rabbitmq_host, rabbitmq_port, username, passwd, enable_ssl=Fals
     raise Exception(mqtt_msg)
 
 
-class HelyOSMQTTClient():
+class HelyOSMQTTClient(AgentKeysMixin):
 
     def __init__(self, rabbitmq_host, rabbitmq_port=1883, uuid=None, enable_ssl=False, ca_certificate=None, 
-                 helyos_public_key=None, agent_privkey=None, agent_pubkey=None ):
+                 helyos_public_key=None, agent_privkey=None, agent_pubkey=None, signature_algorithm=RSA,
+                 keystore=None, connection_profile=None):
         """ HelyOS MQTT client class
 
             The client implements several functions to facilitate the
@@ -92,6 +113,17 @@ class HelyOSMQTTClient():
             :type agent_privkey:  string (PEM format), optional
             :param agent_pubkey: Agent RSA public key is saved in helyOS core, defaults to None
             :type agent_pubkey:  string (PEM format), optional
+            :param signature_algorithm: Algorithm of the keys generated when no keys are provided: crypto.RSA,
+                                        crypto.ED25519 or crypto.ECDSA_P256, defaults to RSA. It is announced to helyOS
+                                        in the check-in `public_key_format`.
+            :type signature_algorithm: str, optional
+            :param keystore: Keystore (or keystore directory) where the agent keys are loaded from or stored in,
+                             keyed by uuid, when no keys are provided. Without keystore, the keys are generated
+                             in memory. In both cases, keys are only loaded or generated when first used.
+            :type keystore: AgentKeystore, str, optional
+            :param connection_profile: Keep-alive and socket options of the account connection, defaults to
+                                       DEFAULT_PROFILE (see :class:`ConnectionProfile`)
+            :type connection_profile: ConnectionProfile, optional
 
 
         """
@@ -112,13 +144,10 @@ class HelyOSMQTTClient():
         self.is_reconecting = False
         self.rbmq_username = None
         self.rbmq_password = None
+        self.compressor = None
+        self.connection_profile = connection_profile
 
-        if agent_pubkey is None or agent_privkey is None:
-            self.private_key, self.public_key = generate_private_public_keys()
-        else:
-            self.private_key, self.public_key = agent_privkey, agent_pubkey
-
-        self.signing_helper = Signing(self.private_key)
+        self._init_agent_keys(agent_privkey, agent_pubkey, signature_algorithm, keystore)
 
         self.rabbitmq_host = rabbitmq_host
         self.rabbitmq_port = rabbitmq_port
@@ -126,7 +155,18 @@ class HelyOSMQTTClient():
     @property
     def is_connection_open(self):
         """ Check if the connection is open """
-        return self.connection.is_connected()
+        return self.connection is not None and self.connection.is_connected()
+
+    @property
+    def connection_state(self):
+        """ 'open', 'reconnecting' or 'closed', without doing any I/O. """
+        if self.is_reconecting:
+            return 'reconnecting'
+        return 'open' if self.is_connection_open else 'closed'
+
+    def check_connection(self):
+        """ The network loop tracks the connection state: same as `is_connection_open`. """
+        return self.is_connection_open
 
 
     @property
@@ -253,7 +293,8 @@ class HelyOSMQTTClient():
 
         try:
             self.connection = connect_mqtt(self.rabbitmq_host, self.rabbitmq_port,
-                                           username, password, self.enable_ssl, self.ca_certificate)
+                                           username, password, self.enable_ssl, self.ca_certificate,
+                                           profile=self.connection_profile)
             self.channel = self.connection
             self.rbmq_username = username
             self.rbmq_password = password
@@ -308,37 +349,34 @@ class HelyOSMQTTClient():
                        'body': {'yard_uid': yard_uid,
                                 'status': status,
                                 'public_key': self.public_key.decode('utf-8'),
-                                'public_key_format': 'PEM',
+                                'public_key_format': public_key_format(self.signing_helper.algorithm),
                                 'registration_token': REGISTRATION_TOKEN,
                                 **agent_data},
                        }
         
-        message = json.dumps(checkin_msg, sort_keys=True)
+        message = envelope.dumps(checkin_msg, canonical=True)
         signature = None
         if signed:
             signature = list(self.signing_helper.return_signature(message))
 
-        body = json.dumps({'message': message, 'signature': signature, 'headers': {'timestamp': int(time.time()*1000),
-                                                                                    'replyTo': self.checkin_response_queue,
-                                                                                    'reply_to': self.checkin_response_queue,
-                                                                                    'user_id': username }}, sort_keys=True)
+        body = envelope.encode_envelope(message, signature, headers={'timestamp': int(time.time()*1000),
+                                                                     'replyTo': self.checkin_response_queue,
+                                                                     'reply_to': self.checkin_response_queue,
+                                                                     'user_id': username})
 
         self.guest_channel.publish(
             self.checking_routing_key, payload=body)
 
     def __checkin_callback_wrapper(self, client, userdata, message):
         try:
-            self.__checkin_callback(client, userdata, str(message.payload.decode()))
+            self.__checkin_callback(client, userdata, message.payload)
             # self.channel.loop_stop()   COMMENT: After the loop stop, I am not able to publish
         except Exception as inst:
             print('error check-in callback', inst)
             client.loop_stop()
 
     def __checkin_callback(self, client, userdata, received_str):
-        payload = json.loads(received_str)
-        received_message_str = payload['message']
-        signature = payload['signature']
-        received_message = json.loads(received_message_str)
+        received_message, received_message_str, signature = envelope.decode_message(received_str)
         sender = None
 
         msg_type = received_message['type']
@@ -370,7 +408,8 @@ class HelyOSMQTTClient():
 
         if password:
             self.connection = connect_mqtt(self.rabbitmq_host, self.rabbitmq_port,
-                                           body['rbmq_username'], password, self.enable_ssl, self.ca_certificate)
+                                           body['rbmq_username'], password, self.enable_ssl, self.ca_certificate,
+                                           profile=self.connection_profile)
             self.channel = self.connection
             self.rbmq_username = body['rbmq_username']
             self.rbmq_password = password
@@ -386,16 +425,20 @@ class HelyOSMQTTClient():
             self.checkin_data = body
 
     @auth_required
-    def publish(self, routing_key, message, signed=False, reply_to=None, corr_id=None, exchange=AGENTS_MQTT_EXCHANGE):
+    def publish(self, routing_key, message, signed=False, reply_to=None, corr_id=None, exchange=AGENTS_MQTT_EXCHANGE,
+                payload_format=envelope.JSON):
         """ Publish message in RabbitMQ-MQTT
-            :param message: Message to be transmitted
-            :type message: str
+            :param message: Message to be transmitted, serialized in `payload_format`
+            :type message: str, bytes
             :param routing_key: MQTT topic name
             :type routing_key: str
             :param encrypted: If this message should be encrypted, defaults to False
             :type encrypted: str
             :param exchange: RabbitMQ exchange, cannot be changed, fixed to env.AGENTS_MQTT_EXCHANGE
             :type exchange: str
+            :param payload_format: Envelope format, 'json', 'msgpack' or 'cbor', detected by the receiver from the
+                                   payload; defaults to 'json'
+            :type payload_format: str
         """
 
         if self.is_reconecting:
@@ -403,7 +446,7 @@ class HelyOSMQTTClient():
 
         signature = None
         if signed:
-            signature = self.signing_helper.return_signature(message).hex()
+            signature = self.signing_helper.return_signature(message)
 
 
         headers = { 'user_id': self.rbmq_username,
@@ -411,8 +454,7 @@ class HelyOSMQTTClient():
                     'reply_to':reply_to,
                     'correlation_id': corr_id}    
         
-        body = json.dumps({'message': message, 'signature': signature,
-                        'headers':  headers}, sort_keys=True)
+        body = envelope.encode_envelope(message, signature, headers, payload_format, self.compressor)
         
         is_trying = True
         while is_trying:    
@@ -473,6 +515,25 @@ class HelyOSMQTTClient():
         self.channel.subscribe(mqtt_topic)
         self.channel.message_callback_add(mqtt_topic, instant_actions_callback)
 
+    def enable_compression(self, threshold=DEFAULT_THRESHOLD, algorithm=None, level=None):
+        """ Compress published messages of at least `threshold` bytes.
+
+            The compression is marked in the envelope and undone by the receiver before parsing; see
+            :class:`PayloadCompressor`. Compression ratio and CPU time are reported by `compressor.summary()`.
+
+            :param threshold: Minimum serialized message size in bytes, defaults to 16 KiB
+            :type threshold: int
+            :param algorithm: 'zlib' or 'zstd', defaults to 'zstd' if the zstandard package is installed, else 'zlib'
+            :type algorithm: str
+            :param level: Compression level, defaults to the algorithm default
+            :type level: int
+        """
+        self.compressor = PayloadCompressor(threshold, algorithm, level)
+        return self.compressor
+
+    def disable_compression(self):
+        self.compressor = None
+
     def start_listening(self):
         self.channel.loop_start()
 
@@ -0,0 +1,352 @@
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import deque
+import pika
+from . import envelope
+from .exceptions import HelyOSOutboxFullError
+
+# seq, meta length, body length, crc32 of meta and body
+_RECORD_HEADER = struct.Struct('>QIII')
+_CURSOR = struct.Struct('>QQ')
+_SEGMENT_SUFFIX = '.log'
+_PROPERTIES = ('user_id', 'timestamp', 'reply_to', 'correlation_id', 'content_type')
+
+CRITICAL = 'critical'
+DROPPABLE = 'droppable'
+
+
+def is_sensor_message(routing_key):
+    """ Default classification of droppable messages: the sensor (visualization) messages. """
+    return routing_key.endswith('visualization')
+
+
+class SegmentLog():
+
+    def __init__(self, directory, segment_bytes):
+        """ Append-only log split into segment files, with a persistent read cursor.
+
+            Records are length-prefixed and checksummed. A torn record at the end of the log (e.g. after a crash) is
+            truncated when the log is opened, and fully read segments are deleted. Used by :class:`Outbox`.
+        """
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+
+        self.last_seq = 0
+        self._segments = deque()  # [segment number, size]; the read cursor is always in the first segment
+        self._read_offset = 0
+        self._writer = None
+        self._reader = None
+        self._next = None
+        self._unsaved_reads = 0
+
+        numbers = sorted(int(name[:-len(_SEGMENT_SUFFIX)]) for name in os.listdir(directory)
+                         if name.endswith(_SEGMENT_SUFFIX))
+        for number in numbers:
+            self._segments.append([number, os.path.getsize(self._path(number))])
+        if self._segments:
+            self._recover_tail()
+        self._load_cursor()
+
+    def _path(self, number):
+        return os.path.join(self.directory, f'{number:016d}{_SEGMENT_SUFFIX}')
+
+    @property
+    def size(self):
+        """ Bytes on disk """
+        return sum(size for _, size in self._segments)
+
+    @property
+    def is_empty(self):
+        """ True if all records were read """
+        return not self._segments or (len(self._segments) == 1 and self._read_offset >= self._segments[0][1])
+
+    def _recover_tail(self):
+        number, size = self._segments[-1]
+        with open(self._path(number), 'rb') as segment:
+            data = segment.read()
+        offset = 0
+        while offset + _RECORD_HEADER.size <= len(data):
+            seq, meta_length, body_length, crc = _RECORD_HEADER.unpack_from(data, offset)
+            end = offset + _RECORD_HEADER.size + meta_length + body_length
+            if end > len(data) or zlib.crc32(data[offset + _RECORD_HEADER.size:end]) != crc:
+                break
+            self.last_seq = seq
+            offset = end
+        if offset != size:
+            logging.warning(f'Outbox: truncating a torn record at the end of {self._path(number)}')
+            with open(self._path(number), 'r+b') as segment:
+                segment.truncate(offset)
+            self._segments[-1][1] = offset
+
+    def _load_cursor(self):
+        try:
+            with open(os.path.join(self.directory, 'cursor'), 'rb') as cursor:
+                number, offset = _CURSOR.unpack(cursor.read(_CURSOR.size))
+        except (FileNotFoundError, struct.error):
+            return
+        # segments before the cursor were read but not deleted yet
+        while self._segments and self._segments[0][0] < number:
+            os.remove(self._path(self._segments.popleft()[0]))
+        if self._segments and self._segments[0][0] == number:
+            self._read_offset = min(offset, self._segments[0][1])
+
+    def save_cursor(self):
+        if not self._segments:
+            return
+        path = os.path.join(self.directory, 'cursor')
+        with open(path + '.tmp', 'wb') as cursor:
+            cursor.write(_CURSOR.pack(self._segments[0][0], self._read_offset))
+        os.replace(path + '.tmp', path)
+        self._unsaved_reads = 0
+
+    def _roll(self):
+        if self._writer is not None:
+            self._writer.close()
+        number = self._segments[-1][0] + 1 if self._segments else 1
+        self._segments.append([number, 0])
+        self._writer = open(self._path(number), 'ab')
+
+    def append(self, seq, meta, body, fsync=False):
+        """ Append a record and return its size in bytes. """
+        record = meta + body
+        data = _RECORD_HEADER.pack(seq, len(meta), len(body), zlib.crc32(record)) + record
+        if not self._segments or (self._segments[-1][1] and self._segments[-1][1] + len(data) > self.segment_bytes):
+            self._roll()
+        elif self._writer is None:
+            self._writer = open(self._path(self._segments[-1][0]), 'ab')
+        self._writer.write(data)
+        self._writer.flush()
+        if fsync:
+            os.fsync(self._writer.fileno())
+        self._segments[-1][1] += len(data)
+        self.last_seq = seq
+        return len(data)
+
+    def _read(self, number, offset):
+        if self._reader is None or self._reader[0] != number:
+            if self._reader is not None:
+                self._reader[1].close()
+            self._reader = (number, open(self._path(number), 'rb'))
+        reader = self._reader[1]
+        reader.seek(offset)
+        header = reader.read(_RECORD_HEADER.size)
+        if len(header) < _RECORD_HEADER.size:
+            return None
+        seq, meta_length, body_length, crc = _RECORD_HEADER.unpack(header)
+        record = reader.read(meta_length + body_length)
+        if len(record) != meta_length + body_length or zlib.crc32(record) != crc:
+            return None
+        return seq, record[:meta_length], record[meta_length:], offset + _RECORD_HEADER.size + len(record)
+
+    def peek(self):
+        """ Return the next unread record as (seq, meta, body, end offset), or None. """
+        if self._next is not None:
+            return self._next
+        while self._segments:
+            number, size = self._segments[0]
+            if self._read_offset < size:
+                self._next = self._read(number, self._read_offset)
+                if self._next is not None:
+                    return self._next
+                logging.warning(f'Outbox: skipping the corrupted end of {self._path(number)}')
+                self._read_offset = size
+            if len(self._segments) == 1:
+                return None
+            self._remove_first()
+        return None
+
+    def advance(self):
+        """ Mark the record returned by `peek()` as read. """
+        self._read_offset = self._next[3]
+        self._next = None
+        self._unsaved_reads += 1
+        if self._unsaved_reads >= 100:
+            self.save_cursor()
+
+    def _remove_first(self):
+        number = self._segments.popleft()[0]
+        if self._reader is not None and self._reader[0] == number:
+            self._reader[1].close()
+            self._reader = None
+        os.remove(self._path(number))
+        self._read_offset = 0
+        self._next = None
+        self.save_cursor()
+
+    def drop_oldest_segment(self):
+        """ Delete the oldest segment, read or not, and return the number of bytes freed. """
+        if not self._segments:
+            return 0
+        if len(self._segments) == 1:
+            self._roll()
+        freed = self._segments[0][1]
+        self._remove_first()
+        return freed
+
+    def close(self):
+        self.save_cursor()
+        if self._writer is not None:
+            self._writer.close()
+        if self._reader is not None:
+            self._reader[1].close()
+        self._writer = None
+        self._reader = None
+
+
+class Outbox():
+
+    def __init__(self, directory, max_bytes=64 * 1024 * 1024, segment_bytes=1024 * 1024, replay_rate=200,
+                 is_droppable=is_sensor_message, fsync=False, hard_max_bytes=None):
+        """ Disk-backed outbox of an AMQP client
+
+            Buffers the messages published while the broker is unreachable in append-only segment logs on local disk,
+            and replays them in publication order once the connection is back, at most `replay_rate` messages per
+            second. While messages are waiting in the outbox, newly published messages are appended to it too, so
+            that the order is kept. Messages survive a restart of the process; after a crash, the last replayed
+            messages may be published twice.
+
+            Droppable messages (by default the sensor messages) and the other messages (states, updates, mission
+            requests...) are kept in separate logs. When the outbox reaches `max_bytes`, the oldest droppable
+            segments are deleted and then new droppable messages are rejected; the other messages are kept beyond
+            `max_bytes`, up to `hard_max_bytes`. Beyond that limit, `put()` raises :class:`HelyOSOutboxFullError`
+            instead of filling the disk, and the application must decide what to do with the message.
+
+            Usually created by :meth:`HelyOSClient.enable_outbox`.
+
+            :param directory: Outbox directory
+            :type directory: str
+            :param max_bytes: Size limit of the outbox on disk, defaults to 64 MiB
+            :type max_bytes: int
+            :param segment_bytes: Size of the segment files, defaults to 1 MiB
+            :type segment_bytes: int
+            :param replay_rate: Maximum number of replayed messages per second, None for no limit, defaults to 200
+            :type replay_rate: float
+            :param is_droppable: is_droppable(routing_key) tells if a message may be dropped when the outbox is full,
+                                 defaults to sensor messages
+            :type is_droppable: func
+            :param fsync: Sync each message to disk, defaults to False
+            :type fsync: bool
+            :param hard_max_bytes: Size limit that no message may exceed, defaults to 4 times `max_bytes`
+            :type hard_max_bytes: int
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.replay_rate = replay_rate
+        self.is_droppable = is_droppable
+        self.fsync = fsync
+        self.hard_max_bytes = 4 * max_bytes if hard_max_bytes is None else hard_max_bytes
+
+        self.stored = 0
+        self.replayed = 0
+        self.dropped = 0
+        self.dropped_segments = 0
+        self.rejected = 0
+
+        self._logs = {kind: SegmentLog(os.path.join(directory, kind), segment_bytes) for kind in (CRITICAL, DROPPABLE)}
+        self._seq = max(log.last_seq for log in self._logs.values())
+        self._size = sum(log.size for log in self._logs.values())
+        self._tokens = 0.0
+        self._refilled_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self):
+        """ True if messages are waiting to be replayed """
+        return not all(log.is_empty for log in self._logs.values())
+
+    def put(self, exchange, routing_key, properties, body):
+        """ Store a message. Never blocks on the network.
+
+            :return: False if the message was dropped because the outbox is full
+            :rtype: bool
+            :raises HelyOSOutboxFullError: if a message that may not be dropped would exceed `hard_max_bytes`
+        """
+        kind = DROPPABLE if self.is_droppable(routing_key) else CRITICAL
+        properties = {name: getattr(properties, name, None) for name in _PROPERTIES} if properties else {}
+        meta = envelope.dumpb({'exchange': exchange, 'routing_key': routing_key, 'properties': properties})
+        body = body.encode('utf-8') if isinstance(body, str) else bytes(body)
+        record_size = _RECORD_HEADER.size + len(meta) + len(body)
+
+        with self._lock:
+            droppable_log = self._logs[DROPPABLE]
+            while self._size + record_size > self.max_bytes and droppable_log.size:
+                self._size -= droppable_log.drop_oldest_segment()
+                self.dropped_segments += 1
+            if kind == DROPPABLE and self._size + record_size > self.max_bytes:
+                self.dropped += 1
+                return False
+            if self._size + record_size > self.hard_max_bytes:
+                self.rejected += 1
+                raise HelyOSOutboxFullError(f'Outbox {self.directory} is full ({self._size} bytes), the message to '
+                                            f'{routing_key} cannot be stored.')
+
+            self._seq += 1
+            self._size += self._logs[kind].append(self._seq, meta, body, self.fsync)
+            self.stored += 1
+        return True
+
+    def _take_token(self):
+        if self.replay_rate is None:
+            return True
+        now = time.monotonic()
+        self._tokens = min(self.replay_rate, self._tokens + (now - self._refilled_at) * self.replay_rate)
+        self._refilled_at = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def replay(self, publish, max_messages=None):
+        """ Publish the stored messages in order, within the replay rate.
+
+            :param publish: publish(exchange, routing_key, properties, body); a message stays in the outbox if it
+                            raises, and the exception is propagated
+            :type publish: func
+            :param max_messages: Maximum number of messages to replay in this call, defaults to None (no limit)
+            :type max_messages: int
+            :return: number of replayed messages
+            :rtype: int
+        """
+        replayed = 0
+        with self._lock:
+            try:
+                while max_messages is None or replayed < max_messages:
+                    heads = [(record[0], log, record) for log in self._logs.values()
+                             for record in (log.peek(),) if record is not None]
+                    if not heads or not self._take_token():
+                        break
+                    _, log, (_, meta, body, _) = min(heads, key=lambda head: head[0])
+                    meta = envelope.loads(meta)
+                    publish(meta['exchange'], meta['routing_key'], pika.BasicProperties(**meta['properties']), body)
+                    log.advance()
+                    replayed += 1
+            finally:
+                self.replayed += replayed
+                self._size = sum(log.size for log in self._logs.values())
+                if replayed:
+                    for log in self._logs.values():
+                        log.save_cursor()
+        return replayed
+
+    def close(self):
+        with self._lock:
+            for log in self._logs.values():
+                log.close()
+
+    def summary(self):
+        """ Stored and replayed messages, dropped droppable messages, deleted droppable segments, messages rejected
+            at the hard limit and size on disk.
+        """
+        return {'pending': self.pending,
+                'stored': self.stored,
+                'replayed': self.replayed,
+                'dropped': self.dropped,
+                'dropped_segments': self.dropped_segments,
+                'rejected': self.rejected,
+                'bytes': self._size}
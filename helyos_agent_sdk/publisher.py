@@ -0,0 +1,136 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from .exceptions import HelyOSPublishError
+
+
+class PublisherStats():
+    """ Counters of a confirm-mode publisher.
+
+        Latencies are measured from `basic_publish` until the broker ack and kept for the last `window` messages.
+    """
+
+    def __init__(self, window=1000):
+        self.published = 0
+        self.acked = 0
+        self.nacked = 0
+        self.started_at = time.monotonic()
+        self.latencies = deque(maxlen=window)
+
+    def summary(self, in_flight=0):
+        """ Return the counters, the throughput of confirmed messages (msg/s) and the confirm latencies (ms). """
+        elapsed = max(time.monotonic() - self.started_at, 1e-9)
+        latencies = sorted(self.latencies)
+        summary = {'published': self.published,
+                   'acked': self.acked,
+                   'nacked': self.nacked,
+                   'in_flight': in_flight,
+                   'throughput': self.acked / elapsed,
+                   'confirm_latency_avg_ms': None,
+                   'confirm_latency_p99_ms': None,
+                   'confirm_latency_max_ms': None}
+        if latencies:
+            summary['confirm_latency_avg_ms'] = 1000 * sum(latencies) / len(latencies)
+            summary['confirm_latency_p99_ms'] = 1000 * latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))]
+            summary['confirm_latency_max_ms'] = 1000 * latencies[-1]
+        return summary
+
+
+class ConfirmPublisher():
+
+    def __init__(self, max_in_flight=1000):
+        """ Confirm-mode publisher for pika asyncio channels.
+
+            Messages are pipelined: `publish()` only waits while `max_in_flight` messages are unconfirmed, and
+            returns a future per message that is resolved with the delivery tag when the broker acks it, or fails
+            with `HelyOSPublishError` when the broker nacks it. Cumulative acks (`multiple=True`) resolve all
+            messages up to the acked delivery tag.
+
+            :param max_in_flight: Maximum number of unconfirmed messages, defaults to 1000
+            :type max_in_flight: int
+        """
+        self.max_in_flight = max_in_flight
+        self.channel = None
+        self.stats = PublisherStats()
+        self._pending = OrderedDict()
+        self._next_tag = 1
+        self._window = None
+
+    @property
+    def in_flight(self):
+        return len(self._pending)
+
+    async def bind(self, channel):
+        """ Put the channel in confirm mode. Messages still pending on a previous channel are failed. """
+        self._fail_pending(HelyOSPublishError('Channel replaced before the message was confirmed.'))
+        self.channel = channel
+        self._next_tag = 1
+        self._window = asyncio.Semaphore(self.max_in_flight)
+        selected = asyncio.get_running_loop().create_future()
+        channel.add_on_close_callback(self._on_channel_closed)
+        channel.confirm_delivery(self._on_ack_nack, callback=lambda frame: selected.done() or selected.set_result(frame))
+        await selected
+
+    async def publish(self, exchange, routing_key, body, properties=None):
+        """ Publish a message and return the future of its confirmation. """
+        await self._window.acquire()
+        try:
+            self.channel.basic_publish(exchange, routing_key, body, properties=properties)
+        except Exception:
+            self._window.release()
+            raise
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[self._next_tag] = (future, time.monotonic())
+        self._next_tag += 1
+        self.stats.published += 1
+        return future
+
+    async def flush(self, timeout=None):
+        """ Wait until all messages published so far are confirmed.
+
+            :return: number of messages that were nacked or lost
+            :rtype: int
+        """
+        futures = [future for future, _ in self._pending.values()]
+        if not futures:
+            return 0
+        results = await asyncio.wait_for(asyncio.gather(*futures, return_exceptions=True), timeout)
+        return sum(isinstance(result, Exception) for result in results)
+
+    def _resolve(self, delivery_tag, acked):
+        future, sent_at = self._pending.pop(delivery_tag)
+        self._window.release()
+        if future.done():
+            return
+        if acked:
+            self.stats.acked += 1
+            self.stats.latencies.append(time.monotonic() - sent_at)
+            future.set_result(delivery_tag)
+        else:
+            self.stats.nacked += 1
+            future.set_exception(HelyOSPublishError(f'Message {delivery_tag} was rejected by the broker.'))
+
+    def _on_ack_nack(self, method_frame):
+        method = method_frame.method
+        acked = method.NAME == 'Basic.Ack'
+        if method.multiple:
+            for delivery_tag in [tag for tag in self._pending if tag <= method.delivery_tag]:
+                self._resolve(delivery_tag, acked)
+        elif method.delivery_tag in self._pending:
+            self._resolve(method.delivery_tag, acked)
+
+    def _on_channel_closed(self, channel, reason):
+        if channel is self.channel:
+            self._fail_pending(HelyOSPublishError(f'Channel closed before the message was confirmed: {reason}'))
+
+    def _fail_pending(self, error):
+        while self._pending:
+            _, (future, _) = self._pending.popitem(last=False)
+            self._window.release()
+            if not future.done():
+                self.stats.nacked += 1
+                future.set_exception(error)
+
+    def summary(self):
+        return self.stats.summary(self.in_flight)
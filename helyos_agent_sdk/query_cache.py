@@ -0,0 +1,179 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from . import envelope
+from .exceptions import *
+
+# queries whose results are changed by each mutation
+INVALIDATED_QUERIES = {'createMapObjects': ('allMapObjects',),
+                       'deleteMapObjects': ('allMapObjects',),
+                       'deleteMapObjectByIds': ('allMapObjects',)}
+
+
+def _yard_ids(request):
+    """ Yards affected by a mutation, or None if they are unknown. """
+    yard_ids = set()
+    for item in request.get('data', None) or [request.get('conditions', None) or {}]:
+        yard_id = item.get('yard_id', None) if isinstance(item, dict) else None
+        if yard_id is None:
+            return None
+        yard_ids.add(yard_id)
+    return yard_ids
+
+
+class QueryCache():
+
+    def __init__(self, max_entries=256, default_ttl=1.0, ttls=None):
+        """ Result cache of :class:`DatabaseConnector` queries
+
+            Query results are cached by query and conditions for a time-to-live that can be set per query. The least
+            recently used results are evicted beyond `max_entries`. Concurrent identical queries are coalesced: only
+            one request is sent to helyOS and the other callers wait for its result. Mutations invalidate the cached
+            results of the queries they change (see `INVALIDATED_QUERIES`), restricted to the yards of the mutated
+            objects when they are known.
+
+            Cached results are shared between callers and must not be modified.
+
+            .. code-block:: python
+
+                db_rpc.enable_cache(ttls={'allYards': 60, 'allAgents': 0.5})
+                yards = db_rpc.call({'query': 'allYards'})
+                db_rpc.cache.summary()
+
+            :param max_entries: Maximum number of cached results, defaults to 256
+            :type max_entries: int
+            :param default_ttl: Time-to-live in seconds of the queries not listed in `ttls`, defaults to 1
+            :type default_ttl: float
+            :param ttls: Time-to-live in seconds per query name; 0 disables the cache for a query, defaults to None
+            :type ttls: dict
+        """
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.ttls = ttls or {}
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+        self._entries = OrderedDict()
+        self._flights = {}
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def ttl(self, query):
+        return self.ttls.get(query, self.default_ttl)
+
+    def _lookup(self, key, query):
+        """ Return ('hit', value), ('wait', flight) or ('fetch', (flight, generation)). Called with the lock held. """
+        entry = self._entries.get(key, None)
+        if entry is not None:
+            expires, value = entry[:2]
+            if expires > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return 'hit', value
+            del self._entries[key]
+
+        flight = self._flights.get(key, None)
+        if flight is not None:
+            self.coalesced += 1
+            return 'wait', flight
+
+        flight = Future()
+        self._flights[key] = flight
+        self.misses += 1
+        return 'fetch', (flight, self._generations.get(query, 0))
+
+    def _store(self, key, query, conditions, value, generation):
+        if self._generations.get(query, 0) != generation:
+            return  # invalidated by a mutation while the query was running
+        self._entries[key] = (time.monotonic() + self.ttl(query), value, query, conditions)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def call(self, request, fetch, timeout=None):
+        """ Return the cached result of a query, or fetch it.
+
+            :param request: Query or mutation of :meth:`DatabaseConnector.call`
+            :type request: dict
+            :param fetch: Function sending the request to helyOS and returning its result
+            :type fetch: func
+            :param timeout: Seconds to wait for a coalesced request, defaults to None (no limit)
+            :type timeout: float
+        """
+        if 'mutation' in request:
+            try:
+                return fetch()
+            finally:
+                # also after a failure: the mutation may have been applied partially
+                self.invalidate(request)
+
+        query = request.get('query', None)
+        if query is None or not self.ttl(query):
+            return fetch()
+
+        key = envelope.dumps(request, canonical=True)
+        with self._lock:
+            action, result = self._lookup(key, query)
+
+        if action == 'hit':
+            return result
+        if action == 'wait':
+            try:
+                return result.result(timeout)
+            except FutureTimeoutError:
+                raise HelyOSTimeoutError(f'No response from helyOS to {query} request.')
+
+        flight, generation = result
+        try:
+            value = fetch()
+        except Exception as err:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.set_exception(err)
+            raise
+
+        with self._lock:
+            self._flights.pop(key, None)
+            self._store(key, query, request.get('conditions', None), value, generation)
+        flight.set_result(value)
+        return value
+
+    def invalidate(self, request):
+        """ Drop the cached results changed by a mutation request. """
+        queries = INVALIDATED_QUERIES.get(request.get('mutation', None), ())
+        if not queries:
+            return
+        yard_ids = _yard_ids(request)
+        with self._lock:
+            for query in queries:
+                self._generations[query] = self._generations.get(query, 0) + 1
+            for key, (_, _, query, conditions) in list(self._entries.items()):
+                if query not in queries:
+                    continue
+                yard_id = conditions.get('yard_id', None) if isinstance(conditions, dict) else None
+                if yard_ids is not None and yard_id is not None and yard_id not in yard_ids:
+                    continue
+                del self._entries[key]
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def summary(self):
+        """ Hits, misses, coalesced requests, evictions, invalidated results and cached results. """
+        with self._lock:
+            requests = self.hits + self.misses + self.coalesced
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'coalesced': self.coalesced,
+                    'hit_ratio': (self.hits + self.coalesced) / requests if requests else None,
+                    'evictions': self.evictions,
+                    'invalidations': self.invalidations,
+                    'entries': len(self._entries)}
@@ -0,0 +1,184 @@
+import threading
+import time
+from collections import deque
+from .exceptions import HelyOSPublishError
+
+STRICT = 'strict'
+WEIGHTED = 'weighted'
+
+
+class TrafficClass():
+
+    def __init__(self, name, suffixes=(), weight=1, max_depth=None, drop_oldest=False):
+        """ Class of outbound messages of an :class:`OutboundScheduler`
+
+            :param name: Class name
+            :type name: str
+            :param suffixes: Routing-key suffixes of the class, e.g. ('visualization',); a class without suffixes
+                             takes the messages of no other class
+            :type suffixes: tuple
+            :param weight: Share of the class in weighted draining, defaults to 1
+            :type weight: int
+            :param max_depth: Maximum number of queued messages, defaults to None (no limit)
+            :type max_depth: int
+            :param drop_oldest: When the queue is full, drop its oldest message instead of making the publisher wait,
+                                defaults to False
+            :type drop_oldest: bool
+        """
+        self.name = name
+        self.suffixes = tuple(suffixes)
+        self.weight = weight
+        self.max_depth = max_depth
+        self.drop_oldest = drop_oldest
+
+        self.queue = deque()
+        self.enqueued = 0
+        self.sent = 0
+        self.dropped = 0
+        self.max_seen_depth = 0
+        self.waits = deque(maxlen=1000)
+        self._current_weight = 0
+
+    def summary(self):
+        waits = sorted(self.waits)
+        return {'depth': len(self.queue),
+                'max_depth': self.max_seen_depth,
+                'enqueued': self.enqueued,
+                'sent': self.sent,
+                'dropped': self.dropped,
+                'wait_avg_ms': 1000 * sum(waits) / len(waits) if waits else None,
+                'wait_p99_ms': 1000 * waits[min(len(waits) - 1, int(0.99 * len(waits)))] if waits else None,
+                'wait_max_ms': 1000 * waits[-1] if waits else None}
+
+
+def default_traffic_classes():
+    """ State, update and other control messages before sensor messages, which are dropped oldest-first. """
+    return [TrafficClass('control', weight=10, max_depth=10000),
+            TrafficClass('sensors', suffixes=('visualization',), weight=1, max_depth=1000, drop_oldest=True)]
+
+
+class OutboundScheduler():
+
+    def __init__(self, traffic_classes=None, policy=STRICT, separate_channels=False, put_timeout=None):
+        """ Priority scheduler of the messages queued for publication
+
+            Replaces the single outbound queue of the I/O thread (see :meth:`HelyOSClient.start_io_thread`) with one
+            bounded queue per traffic class, so that a burst of sensor messages does not delay a state message
+            queued behind it. By default, state, update and other control messages are never dropped: when their
+            queue is full, the publisher waits. Sensor messages are dropped oldest-first.
+
+            With the `strict` policy, a class is only drained when the classes listed before it are empty. With the
+            `weighted` policy, the classes are drained in proportion to their weights (smooth weighted round-robin),
+            so that low-priority classes are not starved. With `separate_channels`, each class is published on its
+            own AMQP channel.
+
+            .. code-block:: python
+
+                helyos_client.start_io_thread(scheduler=OutboundScheduler(policy='weighted'))
+                ...
+                helyos_client.io_thread.scheduler.summary()
+
+            :param traffic_classes: Traffic classes, defaults to :func:`default_traffic_classes`; the first class
+                                    without suffixes takes the unmatched messages (the last class if there is none)
+            :type traffic_classes: list
+            :param policy: 'strict' (in the order of the classes) or 'weighted', defaults to 'strict'
+            :type policy: str
+            :param separate_channels: Publish each class on its own channel, defaults to False
+            :type separate_channels: bool
+            :param put_timeout: Seconds a publisher waits for space in a full queue before HelyOSPublishError is
+                                raised, defaults to None (no limit)
+            :type put_timeout: float
+        """
+        if policy not in (STRICT, WEIGHTED):
+            raise ValueError(f'Scheduling policy not supported: {policy}')
+        self.traffic_classes = traffic_classes or default_traffic_classes()
+        self.policy = policy
+        self.separate_channels = separate_channels
+        self.put_timeout = put_timeout
+
+        self._by_suffix = {suffix: traffic_class for traffic_class in self.traffic_classes
+                           for suffix in traffic_class.suffixes}
+        self._default_class = next((traffic_class for traffic_class in self.traffic_classes
+                                    if not traffic_class.suffixes), self.traffic_classes[-1])
+        self._length = 0
+        self._condition = threading.Condition()
+
+    def __len__(self):
+        return self._length
+
+    def __bool__(self):
+        return self._length > 0
+
+    def classify(self, routing_key):
+        """ Return the traffic class of a routing key (AMQP, '.' separator) or topic (MQTT, '/' separator). """
+        suffix = routing_key[max(routing_key.rfind('.'), routing_key.rfind('/')) + 1:]
+        return self._by_suffix.get(suffix, self._default_class)
+
+    def put(self, item, routing_key, block=True):
+        """ Queue an item; waits while the queue of its class is full, unless the class drops its oldest items.
+
+            :param block: Wait for space, defaults to True; False lets the queue exceed its depth (used on the I/O
+                          thread, which would otherwise wait for itself)
+            :type block: bool
+        """
+        traffic_class = self.classify(routing_key)
+        with self._condition:
+            queue = traffic_class.queue
+            if traffic_class.max_depth is not None and len(queue) >= traffic_class.max_depth:
+                if traffic_class.drop_oldest:
+                    queue.popleft()
+                    traffic_class.dropped += 1
+                    self._length -= 1
+                elif block:
+                    if not self._condition.wait_for(lambda: len(queue) < traffic_class.max_depth, self.put_timeout):
+                        raise HelyOSPublishError(f'Outbound queue {traffic_class.name} is full.')
+            queue.append((time.monotonic(), item))
+            traffic_class.enqueued += 1
+            traffic_class.max_seen_depth = max(traffic_class.max_seen_depth, len(queue))
+            self._length += 1
+
+    def _select(self):
+        if self.policy == STRICT:
+            return next((traffic_class for traffic_class in self.traffic_classes if traffic_class.queue), None)
+
+        selected, total = None, 0
+        for traffic_class in self.traffic_classes:
+            if traffic_class.queue:
+                traffic_class._current_weight += traffic_class.weight
+                total += traffic_class.weight
+                if selected is None or traffic_class._current_weight > selected._current_weight:
+                    selected = traffic_class
+        if selected is not None:
+            selected._current_weight -= total
+        return selected
+
+    def pop(self):
+        """ Return (traffic class, item, enqueue time) of the next item to publish, or None. """
+        with self._condition:
+            traffic_class = self._select()
+            if traffic_class is None:
+                return None
+            queued_at, item = traffic_class.queue.popleft()
+            traffic_class.waits.append(time.monotonic() - queued_at)
+            traffic_class.sent += 1
+            self._length -= 1
+            self._condition.notify_all()
+            return traffic_class, item, queued_at
+
+    def push_front(self, traffic_class, item, queued_at=None):
+        """ Put back an item that could not be published.
+
+            :param queued_at: Enqueue time returned by `pop()`, kept so that the waiting time of the item includes
+                              the failed attempt; defaults to now
+            :type queued_at: float
+        """
+        with self._condition:
+            traffic_class.queue.appendleft((time.monotonic() if queued_at is None else queued_at, item))
+            # pop() counted the item as sent; it is counted again when it is popped and published
+            traffic_class.sent -= 1
+            self._length += 1
+
+    def summary(self):
+        """ Queue depth, sent and dropped messages and waiting time (ms) per traffic class. """
+        with self._condition:
+            return {traffic_class.name: traffic_class.summary() for traffic_class in self.traffic_classes}
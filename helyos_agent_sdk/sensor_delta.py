@@ -0,0 +1,191 @@
+import math
+import time
+
+_MISSING = object()
+
+
+def _copy_sensors(sensors):
+    # one level deeper than dict(): helyOS sensor entries are dicts that applications often update in place
+    return {key: dict(value) if isinstance(value, dict) else value for key, value in sensors.items()}
+
+
+class SensorDeltaEncoder():
+
+    def __init__(self, keyframe_interval=5.0, position_deadband=0, orientation_deadband=0, sensor_deadbands=None):
+        """ Delta and dead-band encoder for sensor messages
+
+            Used by :meth:`AgentConnector.enable_sensor_delta`. A keyframe with the full pose and sensors is sent every
+            `keyframe_interval` seconds. In between, messages carry the full pose but only the sensor keys that
+            changed or were removed since the previous message. Each delta names the sequence number of the message
+            it is based on: a consumer that missed a message (sensor messages may expire under load) ignores the
+            following deltas until the next keyframe.
+
+            A message is suppressed (`encode()` returns None) when the pose moved less than `position_deadband`, no
+            orientation turned more than `orientation_deadband` and no sensor changed, compared to the last
+            published message. Keyframes are never suppressed, so they also keep the connection alive.
+
+            The body of encoded messages has an extra `delta` field:
+
+            .. code-block:: python
+
+                {'pose': {...}, 'sensors': {...changed keys...},
+                 'delta': {'seq': 12, 'keyframe': False, 'base': 11, 'removed': ['old_key']}}
+
+            Use :class:`SensorDeltaDecoder` to rebuild the full sensors on the consumer side.
+
+            :param keyframe_interval: Seconds between keyframes, defaults to 5
+            :type keyframe_interval: float
+            :param position_deadband: Displacement in the pose units below which the pose counts as unchanged, defaults to 0
+            :type position_deadband: float
+            :param orientation_deadband: Orientation change in the pose units below which it counts as unchanged, defaults to 0
+            :type orientation_deadband: float
+            :param sensor_deadbands: Dead-band per sensor key for numeric values. For helyOS sensor entries (dicts with
+                                     a `value` item), the dead-band applies to `value`. Defaults to None (any change)
+            :type sensor_deadbands: dict
+        """
+        self.keyframe_interval = keyframe_interval
+        self.position_deadband = position_deadband
+        self.orientation_deadband = orientation_deadband
+        self.sensor_deadbands = sensor_deadbands or {}
+
+        self.keyframes = 0
+        self.deltas = 0
+        self.suppressed = 0
+
+        self._seq = 0
+        self._keyframe_time = None
+        self._published = None
+        self._published_pose = None
+
+    def force_keyframe(self):
+        """ Send a keyframe with the next message, e.g. after reconnecting. """
+        self._keyframe_time = None
+
+    def _pose_changed(self, previous, current):
+        displacement = math.sqrt((current['x'] - previous['x'])**2 + (current['y'] - previous['y'])**2 +
+                                 ((current['z'] or 0) - (previous['z'] or 0))**2)
+        if displacement > self.position_deadband:
+            return True
+        if len(current['orientations']) != len(previous['orientations']):
+            return True
+        for current_angle, previous_angle in zip(current['orientations'], previous['orientations']):
+            if abs(current_angle - previous_angle) > self.orientation_deadband:
+                return True
+        return False
+
+    def _beyond_deadband(self, key, previous, current):
+        deadband = self.sensor_deadbands.get(key, None)
+        if deadband is None or previous is _MISSING:
+            return True
+        if isinstance(previous, dict) and isinstance(current, dict):
+            previous, current = previous.get('value', None), current.get('value', None)
+        if isinstance(previous, (int, float)) and isinstance(current, (int, float)):
+            return abs(current - previous) > deadband
+        return True
+
+    def encode(self, pose, sensors):
+        """ Encode the body of a sensor message.
+
+            :param pose: {'x', 'y', 'z', 'orientations'}
+            :type pose: dict
+            :param sensors: Full sensors of the agent
+            :type sensors: dict
+            :return: the message body, or None if the message is suppressed by the dead-bands
+            :rtype: dict
+        """
+        now = time.monotonic()
+        self._seq += 1
+        if self._keyframe_time is None or now - self._keyframe_time >= self.keyframe_interval:
+            self._published = _copy_sensors(sensors)
+            self._published_pose = pose
+            self._keyframe_time = now
+            self.keyframes += 1
+            return {'pose': pose, 'sensors': sensors, 'delta': {'seq': self._seq, 'keyframe': True}}
+
+        published = self._published
+        changed = [key for key, value in sensors.items() if published.get(key, _MISSING) != value]
+        if self.sensor_deadbands:
+            changed = [key for key in changed
+                       if self._beyond_deadband(key, published.get(key, _MISSING), sensors[key])]
+        added = sum(1 for key in changed if key not in published)
+        removed = [key for key in published if key not in sensors] if len(published) + added > len(sensors) else []
+        if not changed and not removed and not self._pose_changed(self._published_pose, pose):
+            self._seq -= 1
+            self.suppressed += 1
+            return None
+
+        delta_sensors = {}
+        for key in changed:
+            value = sensors[key]
+            published[key] = dict(value) if isinstance(value, dict) else value
+            delta_sensors[key] = value
+        for key in removed:
+            del published[key]
+        self._published_pose = pose
+        self.deltas += 1
+        return {'pose': pose,
+                'sensors': delta_sensors,
+                'delta': {'seq': self._seq, 'keyframe': False, 'base': self._seq - 1, 'removed': removed}}
+
+    def summary(self):
+        """ Sent keyframes and deltas, and messages suppressed by the dead-bands. """
+        return {'keyframes': self.keyframes,
+                'deltas': self.deltas,
+                'suppressed': self.suppressed}
+
+
+class SensorDeltaDecoder():
+
+    def __init__(self):
+        """ Reference decoder for delta-encoded sensor messages
+
+            Rebuilds the full sensor message of each agent by applying the deltas to the last keyframe. After a missing
+            message, deltas are ignored until the next keyframe. Messages without delta encoding are returned unchanged.
+
+            .. code-block:: python
+
+                decoder = SensorDeltaDecoder()
+                message = decoder.decode(envelope.decode_message(body)[0])
+                if message is not None:
+                    print(message['body']['sensors'])
+        """
+        self._states = {}
+
+    def decode(self, message):
+        """ Return the message with the full pose and sensors.
+
+            :param message: Decoded 'agent_sensors' message
+            :type message: dict
+            :return: the rebuilt message, or None for stale deltas and deltas received after a missing message
+            :rtype: dict
+        """
+        body = message['body']
+        delta = body.get('delta', None)
+        if delta is None:
+            return message
+
+        uuid = message.get('uuid', None)
+        if delta['keyframe']:
+            sensors = dict(body['sensors'])
+        else:
+            state = self._states.get(uuid, None)
+            if state is None or delta['seq'] <= state[0]:
+                return None
+            if delta['base'] != state[0]:
+                # a message was lost, wait for the next keyframe
+                del self._states[uuid]
+                return None
+            sensors = state[1]
+            for key in delta.get('removed', ()):
+                sensors.pop(key, None)
+            sensors.update(body['sensors'])
+
+        self._states[uuid] = (delta['seq'], sensors)
+        return {**message, 'body': {'pose': body['pose'], 'sensors': dict(sensors)}}
+
+    def reset(self, uuid=None):
+        """ Forget the state of one agent, or of all agents. """
+        if uuid is None:
+            self._states.clear()
+        else:
+            self._states.pop(uuid, None)
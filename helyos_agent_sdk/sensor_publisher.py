@@ -0,0 +1,204 @@
+import asyncio
+import logging
+import math
+import threading
+import time
+
+
+class SensorPublisher():
+
+    def __init__(self, agent_connector, rate=10.0, position_threshold=None, orientation_threshold=None,
+                 is_significant=None, signed=False):
+        """ Latest-value sensor publisher
+
+            The control loop only overwrites the latest pose and sensors with `update()`; a background thread publishes
+            the latest sample at a fixed `rate` through `AgentConnector.publish_sensors()`. Samples overwritten before
+            they were published are dropped, never queued. A sample is published immediately, without waiting for the
+            next period, when it moved more than `position_threshold` or turned more than `orientation_threshold`
+            from the last published sample, or when `is_significant(previous, current)` returns True.
+
+            .. code-block:: python
+
+                sensor_publisher = SensorPublisher(agent_connector, rate=5, position_threshold=500)
+                sensor_publisher.start()
+                while running:
+                    sensor_publisher.update(x, y, z, orientations, sensors)  # never blocks on the broker
+
+            For AMQP clients, pika's BlockingConnection is not thread-safe: call `HelyOSClient.start_io_thread()` before
+            starting the publisher if the same client also consumes messages.
+
+            :param agent_connector: Agent connector used to publish the sensors
+            :type agent_connector: AgentConnector
+            :param rate: Publications per second, defaults to 10
+            :type rate: float
+            :param position_threshold: Displacement in the pose units that triggers an immediate publication, defaults to None
+            :type position_threshold: float
+            :param orientation_threshold: Orientation change in the pose units that triggers an immediate publication, defaults to None
+            :type orientation_threshold: float
+            :param is_significant: is_significant(previous: dict, current: dict) -> bool, defaults to None
+            :type is_significant: func
+            :param signed: If the messages should be signed, defaults to False
+            :type signed: bool
+        """
+        self.agent_connector = agent_connector
+        self.period = 1.0 / rate
+        self.position_threshold = position_threshold
+        self.orientation_threshold = orientation_threshold
+        self.is_significant = is_significant
+        self.signed = signed
+
+        self.published = 0
+        self.dropped = 0
+        self.last_publish_latency = None
+
+        self._lock = threading.Lock()
+        self._latest = None
+        self._last_published = None
+        self._wakeup = threading.Event()
+        self._running = False
+        self._thread = None
+
+    def update(self, x, y, z, orientations, sensors={}):
+        """ Overwrite the latest sample. Cheap and non-blocking, to be called from the control loop. """
+        sample = {'x': x, 'y': y, 'z': z, 'orientations': list(orientations), 'sensors': dict(sensors)}
+        with self._lock:
+            if self._latest is not None:
+                self.dropped += 1
+            self._latest = sample
+            significant = self._significant_change(self._last_published, sample)
+        if significant and self._wakeup is not None:
+            self._wakeup.set()
+
+    def _significant_change(self, previous, current):
+        if previous is None:
+            return True
+        if self.is_significant is not None and self.is_significant(previous, current):
+            return True
+        if self.position_threshold is not None:
+            displacement = math.sqrt((current['x'] - previous['x'])**2 + (current['y'] - previous['y'])**2 +
+                                     (current['z'] - previous['z'])**2)
+            if displacement > self.position_threshold:
+                return True
+        if self.orientation_threshold is not None:
+            if len(current['orientations']) != len(previous['orientations']):
+                return True
+            for current_angle, previous_angle in zip(current['orientations'], previous['orientations']):
+                if abs(current_angle - previous_angle) > self.orientation_threshold:
+                    return True
+        return False
+
+    def _take(self):
+        with self._lock:
+            sample, self._latest = self._latest, None
+            if sample is not None:
+                self._last_published = sample
+        return sample
+
+    def _publish(self, sample):
+        started = time.perf_counter()
+        result = self.agent_connector.publish_sensors(sample['x'], sample['y'], sample['z'], sample['orientations'],
+                                                      sample['sensors'], signed=self.signed)
+        self.last_publish_latency = time.perf_counter() - started
+        self.published += 1
+        return result
+
+    def _run(self):
+        next_publication = time.monotonic()
+        while self._running:
+            self._wakeup.wait(max(0, next_publication - time.monotonic()))
+            self._wakeup.clear()
+            if not self._running:
+                break
+            sample = self._take()
+            if sample is not None:
+                try:
+                    self._publish(sample)
+                except Exception:
+                    logging.exception('Error occurred while publishing sensors.')
+            next_publication = time.monotonic() + self.period
+
+    def start(self):
+        """ Start the publisher thread. """
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='helyos-sensor-publisher', daemon=True)
+        self._thread.start()
+
+    def stop(self, flush=True):
+        """ Stop the publisher thread, publishing the pending sample if `flush` is True. """
+        self._running = False
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if flush:
+            sample = self._take()
+            if sample is not None:
+                self._publish(sample)
+
+    def summary(self):
+        """ Published and dropped (coalesced) samples and the duration of the last publication in ms. """
+        return {'published': self.published,
+                'dropped': self.dropped,
+                'last_publish_latency_ms': None if self.last_publish_latency is None else 1000 * self.last_publish_latency}
+
+
+class AsyncSensorPublisher(SensorPublisher):
+
+    def __init__(self, agent_connector, rate=10.0, position_threshold=None, orientation_threshold=None,
+                 is_significant=None, signed=False):
+        """ Latest-value sensor publisher for :class:`AsyncAgentConnector`
+
+            Same behaviour as :class:`SensorPublisher`, but the scheduler is a task on the running event loop.
+            `update()` must be called from the event loop thread.
+        """
+        super().__init__(agent_connector, rate, position_threshold, orientation_threshold, is_significant, signed)
+        self._wakeup = None
+        self._task = None
+
+    async def _publish_async(self, sample):
+        started = time.perf_counter()
+        await self.agent_connector.publish_sensors(sample['x'], sample['y'], sample['z'], sample['orientations'],
+                                                   sample['sensors'], signed=self.signed)
+        self.last_publish_latency = time.perf_counter() - started
+        self.published += 1
+
+    async def _run_async(self):
+        loop = asyncio.get_running_loop()
+        next_publication = loop.time()
+        while self._running:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), max(0, next_publication - loop.time()))
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if not self._running:
+                break
+            sample = self._take()
+            if sample is not None:
+                try:
+                    await self._publish_async(sample)
+                except Exception:
+                    logging.exception('Error occurred while publishing sensors.')
+            next_publication = loop.time() + self.period
+
+    def start(self):
+        """ Start the publisher task on the running event loop. """
+        if self._running:
+            return
+        self._running = True
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run_async())
+
+    async def stop(self, flush=True):
+        """ Stop the publisher task, publishing the pending sample if `flush` is True. """
+        self._running = False
+        if self._task is not None:
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        if flush:
+            sample = self._take()
+            if sample is not None:
+                await self._publish_async(sample)
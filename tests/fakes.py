@@ -0,0 +1,234 @@
+""" In-memory stand-ins for the pika channels and connections and the paho MQTT client used by the tests. """
+import itertools
+import json
+from types import SimpleNamespace
+
+
+class FakeChannel():
+    """ Records the calls made on a pika channel. Callback-style calls (asyncio adapter) are answered at once. """
+
+    _queue_numbers = itertools.count(1)
+
+    def __init__(self, connection=None):
+        self.connection = connection
+        self.is_open = True
+        self.published = []  # (exchange, routing_key, properties, body)
+        self.acks = []  # (delivery_tag, multiple)
+        self.nacks = []  # (delivery_tag, requeue)
+        self.prefetch_count = None
+        self.consumers = {}  # queue -> (on_message_callback, auto_ack)
+        self.bindings = []
+        self.publish_error = None  # raised by basic_publish while set
+        self.close_callbacks = []
+        self.confirm_callback = None
+        self._delivery_tags = itertools.count(1)
+
+    def _answer(self, result, callback):
+        if callback is not None:
+            callback(result)
+        return result
+
+    def basic_publish(self, exchange, routing_key, body, properties=None, mandatory=False):
+        if self.publish_error is not None:
+            raise self.publish_error
+        self.published.append((exchange, routing_key, properties, body))
+
+    def basic_ack(self, delivery_tag=0, multiple=False):
+        self.acks.append((delivery_tag, multiple))
+
+    def basic_nack(self, delivery_tag=0, multiple=False, requeue=True):
+        self.nacks.append((delivery_tag, requeue))
+
+    def basic_qos(self, prefetch_count=0, callback=None, **kwargs):
+        self.prefetch_count = prefetch_count
+        return self._answer(SimpleNamespace(method=None), callback)
+
+    def queue_declare(self, queue='', callback=None, **kwargs):
+        name = queue or f'amq.gen-{next(self._queue_numbers)}'
+        return self._answer(SimpleNamespace(method=SimpleNamespace(queue=name)), callback)
+
+    def queue_bind(self, queue, exchange, routing_key=None, callback=None, **kwargs):
+        self.bindings.append((queue, exchange, routing_key))
+        return self._answer(SimpleNamespace(method=None), callback)
+
+    def basic_consume(self, queue, on_message_callback, auto_ack=False, callback=None, **kwargs):
+        self.consumers[queue] = (on_message_callback, auto_ack)
+        return self._answer(f'ctag-{queue}', callback)
+
+    def add_on_close_callback(self, callback):
+        self.close_callbacks.append(callback)
+
+    def confirm_delivery(self, ack_nack_callback, callback=None):
+        self.confirm_callback = ack_nack_callback
+        return self._answer(SimpleNamespace(method=None), callback)
+
+    def confirm(self, delivery_tag, multiple=False, acked=True):
+        """ Send a publisher confirm (Basic.Ack or Basic.Nack) to the confirm-mode callback. """
+        method = SimpleNamespace(NAME='Basic.Ack' if acked else 'Basic.Nack', delivery_tag=delivery_tag,
+                                 multiple=multiple)
+        self.confirm_callback(SimpleNamespace(method=method))
+
+    def deliver(self, queue, body, properties=None, redelivered=False, routing_key=None):
+        """ Deliver a message to the consumer of a queue and return the result of its callback. """
+        on_message_callback, _ = self.consumers[queue]
+        method = SimpleNamespace(delivery_tag=next(self._delivery_tags), redelivered=redelivered,
+                                 routing_key=routing_key)
+        return on_message_callback(self, method, properties or SimpleNamespace(user_id='helyos_core'), body)
+
+    def close(self, reason='closed'):
+        self.is_open = False
+        for callback in self.close_callbacks:
+            callback(self, reason)
+
+
+class FakeConnection():
+    """ pika BlockingConnection stand-in; thread-safe callbacks run at the next `process_data_events()`. """
+
+    def __init__(self):
+        self.is_open = True
+        self.channels = []
+        self.threadsafe_callbacks = []
+        self.timers = []  # (delay, callback)
+        self.blocked_callbacks = []
+        self.unblocked_callbacks = []
+
+    def channel(self, on_open_callback=None):
+        channel = FakeChannel(self)
+        self.channels.append(channel)
+        if on_open_callback is not None:
+            on_open_callback(channel)
+        return channel
+
+    def process_data_events(self, time_limit=0):
+        callbacks, self.threadsafe_callbacks = self.threadsafe_callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def sleep(self, duration):
+        self.process_data_events(duration)
+
+    def add_callback_threadsafe(self, callback):
+        if not self.is_open:
+            raise RuntimeError('connection is closed')
+        self.threadsafe_callbacks.append(callback)
+
+    def call_later(self, delay, callback):
+        self.timers.append((delay, callback))
+
+    def run_timers(self):
+        timers, self.timers = self.timers, []
+        for _, callback in timers:
+            callback()
+
+    def add_on_connection_blocked_callback(self, callback):
+        self.blocked_callbacks.append(callback)
+
+    def add_on_connection_unblocked_callback(self, callback):
+        self.unblocked_callbacks.append(callback)
+
+    def close(self):
+        self.is_open = False
+        for channel in self.channels:
+            channel.is_open = False
+
+
+class FakeMQTTClient():
+    """ paho-mqtt client stand-in recording published payloads and subscriptions. """
+
+    def __init__(self):
+        self.published = []  # (topic, payload)
+        self.subscriptions = {}  # topic -> callback
+        self.rc = 0
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        self.published.append((topic, payload))
+        return SimpleNamespace(rc=self.rc)
+
+    def subscribe(self, topic, qos=0):
+        self.subscriptions.setdefault(topic, None)
+        return (0, 1)
+
+    def message_callback_add(self, topic, callback):
+        self.subscriptions[topic] = callback
+
+    def deliver(self, topic, payload):
+        """ Deliver a message to the callback of the first subscription matching the topic ('+' wildcards). """
+        levels = topic.split('/')
+        for subscription, callback in self.subscriptions.items():
+            filter_levels = subscription.split('/')
+            if len(filter_levels) == len(levels) and all(f in ('+', level) for f, level in zip(filter_levels, levels)):
+                return callback(self, None, FakeMQTTMessage(topic, payload))
+        raise KeyError(topic)
+
+
+class FakeMQTTMessage():
+
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload
+
+
+class FakeHelyOSDatabase():
+    """ Answers the database requests published by a client whenever its connection processes events.
+
+        `answer(request)` returns the result sent back, or None to leave the request unanswered. Requests are answered
+        in reverse order of arrival, so that replies are never matched by position.
+    """
+
+    def __init__(self, helyos_client, answer):
+        self.helyos_client = helyos_client
+        self.answer = answer
+        self.requests = []
+        self._answered = 0
+        connection = helyos_client.connection
+        process_data_events = connection.process_data_events
+
+        def process_and_answer(time_limit=0):
+            process_data_events(time_limit)
+            self.reply()
+
+        connection.process_data_events = process_and_answer
+
+    def reply(self):
+        published = self.helyos_client.channel.published
+        new_requests, self._answered = published[self._answered:], len(published)
+        for _, _, properties, body in reversed(new_requests):
+            request = json.loads(json.loads(body)['message'])['body']
+            self.requests.append(request)
+            result = self.answer(request)
+            if result is None:
+                continue
+            for channel in self.helyos_client.connection.channels:
+                if properties.reply_to in channel.consumers:
+                    channel.deliver(properties.reply_to, helyos_envelope(result),
+                                    SimpleNamespace(correlation_id=properties.correlation_id))
+
+
+def connect(helyos_client, username='agent_user'):
+    """ Attach a fake connection and channel to a client, as `connect()` would. """
+    helyos_client.connection = FakeConnection()
+    helyos_client.channel = helyos_client.connection.channel()
+    helyos_client.rbmq_username = username
+    helyos_client.rbmq_password = 'secret'
+    return helyos_client
+
+
+def helyos_envelope(message, signature=None):
+    """ JSON envelope of a message sent by helyOS core. """
+    return json.dumps({'message': json.dumps(message), 'signature': signature}).encode('utf-8')
+
+
+def assignment_message(assignment_id=1, work_process_id=10, uuid='agent-1'):
+    return {'type': 'assignment_execution', 'uuid': uuid, '_version': '2',
+            'body': {'id': assignment_id, 'operation': 'drive'},
+            'metadata': {'id': assignment_id, 'yard_id': 1, 'work_process_id': work_process_id,
+                         'status': 'executing', 'context': {'dependencies': []}}}
+
+
+def instant_action_message(action_type, work_process_id=10, assignment_id=None, uuid='agent-1'):
+    if action_type == 'assignment_cancel':
+        return {'type': action_type, 'uuid': uuid, '_version': '2', 'body': {'assignment_id': assignment_id},
+                'metadata': {'id': assignment_id, 'yard_id': 1, 'work_process_id': work_process_id}}
+    return {'type': action_type, 'uuid': uuid,
+            'body': {'work_process_id': work_process_id, 'operation_types_required': [],
+                     'reserved': action_type == 'reserve_for_mission'}}
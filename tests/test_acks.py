@@ -0,0 +1,106 @@
+from concurrent.futures import Future
+from types import SimpleNamespace
+from helyos_agent_sdk.acks import Acknowledger
+from helyos_agent_sdk.client import HelyOSClient
+from helyos_agent_sdk.connector import AgentConnector
+from tests.fakes import FakeChannel, FakeConnection, assignment_message, connect, helyos_envelope
+
+
+def delivery(delivery_tag, redelivered=False):
+    return SimpleNamespace(delivery_tag=delivery_tag, redelivered=redelivered)
+
+
+def test_deliveries_are_acked_when_their_callback_returns():
+    channel = FakeChannel()
+    on_message = Acknowledger().wrap(lambda *args: None)
+    on_message(channel, delivery(1), None, b'')
+    on_message(channel, delivery(2), None, b'')
+    assert channel.acks == [(1, False), (2, False)]
+
+
+def test_batches_are_acked_with_one_cumulative_ack():
+    channel, connection = FakeChannel(), FakeConnection()
+    acknowledger = Acknowledger(prefetch_count=20, batch_size=4, call_later=connection.call_later)
+    on_message = acknowledger.wrap(lambda *args: None)
+    for delivery_tag in range(1, 7):
+        on_message(channel, delivery(delivery_tag), None, b'')
+
+    assert channel.acks == [(4, True)]
+    connection.run_timers()  # max_delay elapsed
+    assert channel.acks == [(4, True), (6, True)]
+    assert acknowledger.summary() == {'acked': 6, 'nacked': 0, 'ack_frames': 2, 'in_progress': 0, 'pending_acks': 0}
+
+
+def test_batch_is_acked_individually_above_a_delivery_still_processed():
+    channel = FakeChannel()
+    acknowledger = Acknowledger(prefetch_count=20, batch_size=3, call_later=FakeConnection().call_later)
+    dispatched = Future()
+    on_message = acknowledger.wrap(lambda ch, method, properties, body: dispatched if method.delivery_tag == 2 else None)
+    for delivery_tag in range(1, 5):
+        on_message(channel, delivery(delivery_tag), None, b'')
+
+    # delivery 2 is still being processed: 3 and 4 must not be covered by a cumulative ack
+    assert channel.acks == [(1, False), (3, False), (4, False)]
+    dispatched.set_result(None)
+    acknowledger.flush()
+    assert channel.acks[-1] == (2, False)
+
+
+def test_batch_size_is_limited_to_half_the_prefetch():
+    assert Acknowledger(prefetch_count=10, batch_size=50).batch_size == 5
+    assert Acknowledger(prefetch_count=0, batch_size=50).batch_size == 50
+
+
+def test_failed_callback_is_requeued_once():
+    channel = FakeChannel()
+
+    def failing_callback(*args):
+        raise ValueError('crashed')
+
+    acknowledger = Acknowledger()
+    on_message = acknowledger.wrap(failing_callback)
+    on_message(channel, delivery(1), None, b'')
+    on_message(channel, delivery(2, redelivered=True), None, b'')
+
+    assert channel.nacks == [(1, True), (2, False)]
+    assert acknowledger.summary()['nacked'] == 2
+
+
+def test_pending_acks_are_sent_before_a_nack():
+    channel = FakeChannel()
+    results = iter([None, ValueError('crashed')])
+
+    def callback(*args):
+        result = next(results)
+        if isinstance(result, Exception):
+            raise result
+
+    on_message = Acknowledger(prefetch_count=20, batch_size=5, call_later=FakeConnection().call_later).wrap(callback)
+    on_message(channel, delivery(1), None, b'')
+    on_message(channel, delivery(2), None, b'')
+    assert channel.acks == [(1, False)] and channel.nacks == [(2, True)]
+
+
+def test_deliveries_of_a_closed_channel_are_not_acked():
+    channel = FakeChannel()
+    acknowledger = Acknowledger()
+    dispatched = Future()
+    acknowledger.wrap(lambda *args: dispatched)(channel, delivery(1), None, b'')
+    channel.close()
+    dispatched.set_result(None)
+    assert channel.acks == []
+
+
+def test_client_consumes_with_prefetch_and_manual_acks():
+    helyos_client = connect(HelyOSClient('localhost', uuid='agent-1'))
+    helyos_client.enable_manual_ack(prefetch_count=20, batch_size=1)
+    received = []
+    AgentConnector(helyos_client).consume_assignment_messages(
+        lambda ch, sender, assignment, *args: received.append(assignment.metadata.id))
+
+    channel = helyos_client.channel
+    queue = helyos_client.assignment_queue.method.queue
+    channel.deliver(queue, helyos_envelope(assignment_message(1)))
+    assert channel.prefetch_count == 20
+    assert channel.consumers[queue][1] is False  # manual acks
+    assert received == [1] and channel.acks == [(1, False)]
@@ -0,0 +1,102 @@
+import asyncio
+from helyos_agent_sdk import envelope
+from helyos_agent_sdk.async_client import AsyncHelyOSClient
+from helyos_agent_sdk.async_connector import AsyncAgentConnector
+from helyos_agent_sdk.async_mqtt_client import AsyncHelyOSMQTTClient
+from helyos_agent_sdk.crypto import verify_signature
+from helyos_agent_sdk.models import AGENT_STATE
+from tests.fakes import FakeMQTTClient, connect, helyos_envelope, assignment_message
+
+
+def test_publish_sends_the_envelope_with_the_amqp_properties():
+    client = connect(AsyncHelyOSClient('localhost', uuid='agent-1'))
+
+    async def main():
+        await client.publish(client.status_routing_key, '{"type": "agent_state"}', corr_id='42')
+
+    asyncio.run(main())
+    exchange, routing_key, properties, body = client.channel.published[0]
+    assert routing_key == 'agent.agent-1.state'
+    assert properties.user_id == 'agent_user'
+    assert properties.correlation_id == '42'
+    assert properties.content_type is None
+    assert envelope.decode_message(body)[0] == {'type': 'agent_state'}
+
+
+def test_signed_publish_can_be_verified_with_the_agent_public_key():
+    client = connect(AsyncHelyOSClient('localhost', uuid='agent-1'))
+    asyncio.run(client.publish(client.status_routing_key, '{"type": "agent_state"}', signed=True))
+
+    _, message_str, signature = envelope.decode_message(client.channel.published[0][3])
+    assert verify_signature(message_str, signature, client.public_key)
+
+
+def test_mqtt_publish_puts_the_headers_in_the_envelope():
+    client = AsyncHelyOSMQTTClient('localhost', uuid='agent-1')
+    client.connection = client.channel = FakeMQTTClient()
+    client.rbmq_username = 'agent_user'
+    asyncio.run(client.publish(client.status_routing_key, '{"type": "agent_state"}'))
+
+    topic, payload = client.channel.published[0]
+    assert topic == client.status_routing_key
+    decoded = envelope.decode_envelope(payload)
+    assert decoded['headers']['user_id'] == 'agent_user'
+
+
+def test_coroutine_callbacks_run_as_tasks_and_do_not_block_deliveries():
+    client = connect(AsyncHelyOSClient('localhost', uuid='agent-1'))
+    connector = AsyncAgentConnector(client)
+    started, release = [], None
+
+    async def assignment_callback(ch, sender, assignment, message_str, signature):
+        started.append(assignment.metadata.id)
+        await release.wait()
+
+    async def main():
+        nonlocal release
+        release = asyncio.Event()
+        await connector.consume_assignment_messages(assignment_callback)
+        queue = client.assignment_queue.method.queue
+        first = client.channel.deliver(queue, helyos_envelope(assignment_message(1)))
+        second = client.channel.deliver(queue, helyos_envelope(assignment_message(2)))
+        await asyncio.sleep(0)
+        assert started == [1, 2]
+        release.set()
+        await asyncio.gather(first, second)
+
+    asyncio.run(main())
+
+
+def test_connector_publish_methods_return_the_result_of_the_client_publish():
+    client = connect(AsyncHelyOSClient('localhost', uuid='agent-1'))
+    connector = AsyncAgentConnector(client)
+    confirmation = object()
+
+    async def publish(*args, **kwargs):
+        return confirmation
+
+    client.publish = publish
+    client.yard_uid = '1'
+
+    async def main():
+        return [await connector.publish_general_updates({'name': 'agent'}),
+                await connector.publish_state(AGENT_STATE.FREE),
+                await connector.publish_sensors(0, 0, 0, [0]),
+                await connector.request_mission('drive', {})]
+
+    assert asyncio.run(main()) == [confirmation] * 4
+
+
+def test_restore_consumers_registers_the_consumers_on_the_new_channel():
+    client = connect(AsyncHelyOSClient('localhost', uuid='agent-1'))
+    received = []
+
+    async def main():
+        await client.consume_assignment_messages(lambda *delivery: received.append(delivery[3]))
+        connect(client)
+        await client.restore_consumers()
+        client.channel.deliver(client.assignment_queue.method.queue, b'{}')
+
+    asyncio.run(main())
+    assert received == [b'{}']
+    assert list(client.channel.consumers) == [client.assignment_queue.method.queue]
@@ -0,0 +1,106 @@
+import asyncio
+import threading
+import pytest
+from helyos_agent_sdk.async_client import AsyncHelyOSClient
+from helyos_agent_sdk.async_connector import AsyncAgentConnector
+from helyos_agent_sdk.cancellation import CancelLane, CancelToken
+from helyos_agent_sdk.client import HelyOSClient
+from helyos_agent_sdk.connector import AgentConnector
+from helyos_agent_sdk.exceptions import HelyOSCancelledError
+from helyos_agent_sdk.models import AssignmentCancelMessage
+from tests.fakes import assignment_message, connect, helyos_envelope, instant_action_message
+
+
+def test_cancel_runs_the_callbacks_once():
+    token, cancelled = CancelToken(1), []
+    token.add_callback(cancelled.append)
+    token.cancel('first')
+    token.cancel('second')
+    token.add_callback(cancelled.append)  # already cancelled: called at once
+
+    assert cancelled == [token, token]
+    assert token.message == 'first'
+    assert token.wait(0)
+    with pytest.raises(HelyOSCancelledError):
+        token.raise_if_cancelled()
+
+
+def test_wait_async_is_woken_from_another_thread():
+    token = CancelToken(1)
+
+    async def main():
+        threading.Timer(0.01, token.cancel).start()
+        return await asyncio.wait_for(token.wait_async(), 5)
+
+    assert asyncio.run(main()) is token
+
+
+def test_cancellation_received_before_its_assignment_is_kept():
+    cancel_lane = CancelLane(max_tokens=2)
+    cancel_lane.cancel(AssignmentCancelMessage(uuid='agent-1', body={'assignment_id': 7}))
+    assert cancel_lane.token(7).cancelled
+
+    cancel_lane.token(8)
+    cancel_lane.token(9)
+    assert not cancel_lane.token(7).cancelled  # evicted: a new token
+    assert cancel_lane.summary()['cancels'] == 1
+
+
+def test_cancel_token_requires_the_dispatcher():
+    agent_connector = AgentConnector(connect(HelyOSClient('localhost', uuid='agent-1')))
+    with pytest.raises(RuntimeError):
+        agent_connector.cancel_token(1)
+    agent_connector.enable_dispatcher()
+    assert agent_connector.cancel_token(1) is agent_connector.cancel_token(1)
+    agent_connector.disable_dispatcher()
+
+
+def test_running_assignment_is_cancelled_before_the_dispatched_callbacks():
+    helyos_client = connect(HelyOSClient('localhost', uuid='agent-1'))
+    agent_connector = AgentConnector(helyos_client)
+    agent_connector.enable_dispatcher(max_workers=2)
+    started, events = threading.Event(), []
+
+    def assignment_callback(ch, sender, assignment, *args):
+        token = agent_connector.cancel_token(assignment)
+        started.set()
+        events.append(('cancelled', token.wait(5)))
+
+    def cancel_callback(ch, sender, cancel, *args):
+        events.append(('cancel callback', threading.current_thread() is threading.main_thread()))
+
+    agent_connector.consume_assignment_messages(assignment_callback)
+    agent_connector.consume_instant_action_messages(cancel_callback=cancel_callback)
+    channel = helyos_client.channel
+    assignment = channel.deliver(helyos_client.assignment_queue.method.queue, helyos_envelope(assignment_message(3)))
+    started.wait(5)
+    channel.deliver(helyos_client.instant_actions_queue.method.queue,
+                    helyos_envelope(instant_action_message('assignment_cancel', assignment_id=3)))
+    assignment.result(5)
+    agent_connector.disable_dispatcher()
+
+    assert ('cancel callback', True) in events  # run on the consuming thread
+    assert ('cancelled', True) in events
+    assert agent_connector.cancel_lane.summary()['handler_latency']['count'] == 1
+
+
+def test_async_connector_cancels_a_running_coroutine_without_dispatcher():
+    helyos_client = connect(AsyncHelyOSClient('localhost', uuid='agent-1'))
+    agent_connector = AsyncAgentConnector(helyos_client)
+
+    async def assignment_callback(ch, sender, assignment, *args):
+        await agent_connector.cancel_token(assignment).wait_async()
+        return 'cancelled'
+
+    async def main():
+        await agent_connector.consume_assignment_messages(assignment_callback)
+        await agent_connector.consume_instant_action_messages(cancel_callback=lambda *args: None)
+        channel = helyos_client.channel
+        assignment = channel.deliver(helyos_client.assignment_queue.method.queue,
+                                     helyos_envelope(assignment_message(3)))
+        await asyncio.sleep(0)
+        channel.deliver(helyos_client.instant_actions_queue.method.queue,
+                        helyos_envelope(instant_action_message('assignment_cancel', assignment_id=3)))
+        return await asyncio.wait_for(assignment, 5)
+
+    assert asyncio.run(main()) == 'cancelled'
@@ -0,0 +1,43 @@
+import pytest
+from helyos_agent_sdk import compact_models, models
+from helyos_agent_sdk.model_codecs import from_dict, to_dict
+from tests.fakes import assignment_message
+
+
+def test_instances_have_slots_and_no_dict():
+    pose = compact_models.Pose(x=10, y=20, orientations=[0])
+    assert not hasattr(pose, '__dict__')
+    with pytest.raises(AttributeError):
+        pose.speed = 1
+
+
+def test_same_fields_defaults_equality_and_repr():
+    assert compact_models.Pose() == compact_models.Pose(x=0, y=0, z=0, orientations=[])
+    request = compact_models.WorkProcessResourcesRequest(work_process_id=3)
+    assert repr(request) == repr(models.WorkProcessResourcesRequest(work_process_id=3))
+    assert not isinstance(request, models.WorkProcessResourcesRequest)
+
+
+def test_default_factories_are_not_shared():
+    first, second = compact_models.Pose(), compact_models.Pose()
+    first.orientations.append(1)
+    assert second.orientations == []
+
+
+def test_nested_models_are_decoded_into_the_slotted_variants():
+    message = from_dict(compact_models.AssignmentCommandMessage, assignment_message(assignment_id=7))
+    assert type(message.metadata) is compact_models.AssignmentMetadata
+    assert message.metadata.id == 7
+
+
+def test_encoded_like_the_models():
+    resources = dict(operation_types_available=['drive'], work_process_id=10, reserved=False)
+    status = dict(id='1', status=models.ASSIGNMENT_STATUS.EXECUTING, result={})
+
+    def state_message(module):
+        body = module.AgentStateBody(status=models.AGENT_STATE.BUSY,
+                                     resources=module.AgentCurrentResources(**resources),
+                                     assignment=module.AssignmentCurrentStatus(**status))
+        return module.AgentStateMessage(uuid='agent-1', body=body)
+
+    assert to_dict(state_message(compact_models)) == to_dict(state_message(models))
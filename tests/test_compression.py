@@ -0,0 +1,58 @@
+import os
+import pytest
+from helyos_agent_sdk import envelope
+from helyos_agent_sdk.client import HelyOSClient
+from helyos_agent_sdk.compression import ZLIB, ZSTD, PayloadCompressor
+from helyos_agent_sdk.crypto import ED25519, verify_signature
+from helyos_agent_sdk.connector import AgentConnector
+from tests.fakes import connect
+
+
+LARGE_MESSAGE = {'type': 'agent_sensors', 'uuid': 'agent-1', 'body': {'points': [[x, x + 1, 0] for x in range(2000)]}}
+
+
+@pytest.mark.parametrize('algorithm', [ZLIB, ZSTD])
+@pytest.mark.parametrize('payload_format', [envelope.JSON, envelope.MSGPACK])
+def test_compressed_envelope_round_trip(algorithm, payload_format):
+    if algorithm == ZSTD:
+        pytest.importorskip('zstandard')
+    if payload_format == envelope.MSGPACK:
+        pytest.importorskip('msgpack')
+    compressor = PayloadCompressor(threshold=1024, algorithm=algorithm)
+    message = envelope.encode(LARGE_MESSAGE, payload_format)
+    body = envelope.encode_envelope(message, payload_format=payload_format, compressor=compressor)
+
+    assert envelope.decode_envelope(body)['compression'] == algorithm
+    assert len(body) < len(message)
+    decoded, received, _ = envelope.decode_message(body)
+    assert decoded == LARGE_MESSAGE
+    assert received == message
+    assert compressor.summary()['compressed'] == 1
+
+
+def test_small_and_incompressible_messages_are_sent_as_they_are():
+    compressor = PayloadCompressor(threshold=1024, algorithm=ZLIB)
+    assert compressor.compress(b'{}') == (None, b'{}')
+    random_bytes = os.urandom(4096)
+    assert compressor.compress(random_bytes)[0] is None
+    assert compressor.summary()['skipped'] == 2
+    assert 'compression' not in envelope.decode_envelope(envelope.encode_envelope('{}', compressor=compressor))
+
+
+def test_signature_covers_the_uncompressed_message():
+    helyos_client = connect(HelyOSClient('localhost', uuid='agent-1', signature_algorithm=ED25519))
+    helyos_client.enable_compression(threshold=1024, algorithm=ZLIB)
+    AgentConnector(helyos_client).publish_general_updates(LARGE_MESSAGE['body'], signed=True)
+
+    body = helyos_client.channel.published[0][3]
+    assert envelope.decode_envelope(body)['compression'] == ZLIB
+    message, message_str, signature = envelope.decode_message(body)
+    assert message['body'] == LARGE_MESSAGE['body']
+    assert verify_signature(message_str, signature, helyos_client.public_key)
+
+
+def test_unknown_algorithm():
+    with pytest.raises(ValueError):
+        PayloadCompressor(algorithm='lz4')
+    with pytest.raises(ValueError):
+        PayloadCompressor().decompress('lz4', b'')
@@ -0,0 +1,59 @@
+import socket
+from helyos_agent_sdk import client
+from helyos_agent_sdk.async_client import AsyncHelyOSClient
+from helyos_agent_sdk.async_mqtt_client import AsyncHelyOSMQTTClient
+from helyos_agent_sdk.client import HelyOSClient, rabbitmq_connection_parameters
+from helyos_agent_sdk.connection_profile import ASYNC_PROFILE, DEFAULT_PROFILE, TEMPORARY_PROFILE, ConnectionProfile
+from tests.fakes import FakeConnection
+
+
+def test_pika_parameters_of_the_profiles():
+    account = rabbitmq_connection_parameters('localhost', 5672, 'agent_user', 'secret')
+    temporary = rabbitmq_connection_parameters('localhost', 5672, 'anonymous', 'anonymous', temporary=True)
+    asyncio_account = rabbitmq_connection_parameters('localhost', 5672, 'agent_user', 'secret', profile=ASYNC_PROFILE)
+
+    assert (account.heartbeat, account.blocked_connection_timeout, account.tcp_options) == (3600, None, None)
+    assert (temporary.heartbeat, temporary.blocked_connection_timeout) == (60, 60)
+    assert asyncio_account.heartbeat == 30
+    assert asyncio_account.tcp_options == {'TCP_KEEPIDLE': 30, 'TCP_KEEPINTVL': 10, 'TCP_KEEPCNT': 5}
+
+
+def test_tcp_user_timeout_option():
+    profile = ConnectionProfile(tcp_user_timeout=20000)
+    assert profile.tcp_options() == {'TCP_USER_TIMEOUT': 20000}
+    assert DEFAULT_PROFILE.tcp_options() is None
+
+
+def test_socket_options_are_applied():
+    profile = ConnectionProfile(tcp_keepalive=True, keepalive_idle=25)
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        profile.apply_to_socket(sock)
+        assert sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY)
+        assert sock.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE)
+        if hasattr(socket, 'TCP_KEEPIDLE'):
+            assert sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE) == 25
+    profile.apply_to_socket(None)
+
+
+def test_default_profiles_of_the_clients():
+    assert HelyOSClient('localhost', uuid='agent-1').connection_profile is None  # DEFAULT_PROFILE
+    assert AsyncHelyOSClient('localhost', uuid='agent-1').connection_profile is ASYNC_PROFILE
+    assert AsyncHelyOSMQTTClient('localhost', uuid='agent-1').connection_profile is ASYNC_PROFILE
+    assert AsyncHelyOSClient('localhost', uuid='agent-1',
+                             connection_profile=TEMPORARY_PROFILE).connection_profile is TEMPORARY_PROFILE
+
+
+def test_account_connection_uses_the_client_profile(monkeypatch):
+    profiles = []
+
+    def connect_rabbitmq(*args, profile=None, **kwargs):
+        profiles.append(profile)
+        return FakeConnection()
+
+    monkeypatch.setattr(client, 'connect_rabbitmq', connect_rabbitmq)
+    profile = ConnectionProfile(heartbeat=15, blocked_connection_timeout=30)
+    helyos_client = HelyOSClient('localhost', uuid='agent-1', connection_profile=profile)
+    helyos_client.connect('agent_user', 'secret')
+
+    assert profiles == [profile]
+    assert helyos_client.rbmq_username == 'agent_user'
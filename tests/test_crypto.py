@@ -0,0 +1,85 @@
+import pytest
+from helyos_agent_sdk.crypto import (ECDSA_P256, ED25519, RSA, SIGNATURE_ALGORITHMS, SignatureVerifier, Signing,
+                                     generate_private_public_keys, public_key_format, verify_signature)
+
+
+MESSAGE = '{"type": "agent_state", "uuid": "agent-1", "body": {"status": "free"}}'
+
+
+@pytest.fixture(scope='module', params=SIGNATURE_ALGORITHMS)
+def key_pair(request):
+    return request.param, generate_private_public_keys(request.param)
+
+
+def test_signature_round_trip(key_pair):
+    algorithm, (private_key, public_key) = key_pair
+    signing = Signing(private_key)
+    signature = signing.return_signature(MESSAGE)
+
+    assert signing.algorithm == algorithm
+    assert verify_signature(MESSAGE, signature, public_key)
+    assert verify_signature(MESSAGE, signature.hex(), public_key.decode('utf-8'))
+    assert signing.verify_own_signature(MESSAGE, signature)
+
+
+def test_binary_messages_are_signed_as_bytes(key_pair):
+    _, (private_key, public_key) = key_pair
+    message = b'\x81\xa4type\xabagent_state'
+    assert verify_signature(message, Signing(private_key).return_signature(message), public_key)
+
+
+def test_tampered_message_is_rejected(key_pair):
+    _, (private_key, public_key) = key_pair
+    signature = Signing(private_key).return_signature(MESSAGE)
+    with pytest.raises(Exception, match='Error verifying signature'):
+        verify_signature(MESSAGE.replace('free', 'busy'), signature, public_key)
+
+
+def test_signing_accepts_str_keys_and_key_objects(key_pair):
+    algorithm, (private_key, _) = key_pair
+    from_str = Signing(private_key.decode('utf-8'))
+    from_object = Signing(from_str.private_key)
+    assert from_object.algorithm == algorithm
+    assert from_object.private_key_string == from_str.private_key_string
+
+
+def test_signature_sizes():
+    sizes = {algorithm: len(Signing(generate_private_public_keys(algorithm)[0]).return_signature(MESSAGE))
+             for algorithm in (RSA, ED25519)}
+    assert sizes == {RSA: 256, ED25519: 64}
+
+
+def test_public_key_format_and_unsupported_algorithm():
+    assert public_key_format(RSA) == 'PEM'
+    assert public_key_format(ECDSA_P256) == 'PEM/ECDSA-P256'
+    with pytest.raises(ValueError):
+        generate_private_public_keys('DSA')
+
+
+def test_verifier_parses_each_public_key_once(key_pair):
+    _, (private_key, public_key) = key_pair
+    signature = Signing(private_key).return_signature(MESSAGE)
+    verifier = SignatureVerifier()
+
+    for key in (public_key, public_key.decode('utf-8'), list(public_key)):
+        assert verifier.verify(MESSAGE, signature, key)
+    assert (verifier.misses, verifier.hits) == (1, 2)
+
+
+def test_verifier_evicts_the_least_recently_used_key():
+    verifier = SignatureVerifier(max_keys=2)
+    keys = [generate_private_public_keys(ED25519)[1] for _ in range(3)]
+    for key in (keys[0], keys[1], keys[0], keys[2]):
+        verifier.load_public_key(key)
+    verifier.load_public_key(keys[0])
+    assert verifier.hits == 2  # keys[1] was evicted, keys[0] stayed
+    verifier.load_public_key(keys[1])
+    assert verifier.misses == 4
+
+
+def test_verify_many_does_not_raise():
+    private_key, public_key = generate_private_public_keys(ED25519)
+    signature = Signing(private_key).return_signature(MESSAGE)
+    results = SignatureVerifier().verify_many([(MESSAGE, signature), (MESSAGE + ' ', signature),
+                                               (MESSAGE, signature, b'not a key')], public_key)
+    assert results == [True, False, False]
@@ -0,0 +1,140 @@
+import threading
+import pytest
+from helyos_agent_sdk.client import HelyOSClient
+from helyos_agent_sdk.database_connector import DatabaseConnector, chunked
+from helyos_agent_sdk.exceptions import HelyOSTimeoutError
+from tests.fakes import FakeHelyOSDatabase, connect
+
+
+def echo(request):
+    return {'echo': request}
+
+
+def database_connector(answer=echo, timeout=5):
+    helyos_client = connect(HelyOSClient('localhost', uuid='agent-1'))
+    helyos_database = FakeHelyOSDatabase(helyos_client, answer)
+    return DatabaseConnector(helyos_client, timeout=timeout), helyos_database
+
+
+def test_call_returns_the_response_of_its_request():
+    db_rpc, _ = database_connector()
+    request = {'query': 'allAgents', 'conditions': {'yard_id': 1}}
+    assert db_rpc.call(request) == {'echo': request}
+    assert db_rpc.latency_stats()['queries']['allAgents']['count'] == 1
+
+
+def test_call_many_matches_replies_by_correlation_id():
+    db_rpc, helyos_database = database_connector()
+    requests = [{'query': 'allYards'}, {'query': 'allAgents'}, {'query': 'allMapObjects'}]
+
+    assert db_rpc.call_many(requests) == [{'echo': request} for request in requests]
+    assert helyos_database.requests == requests[::-1]  # answered in reverse order
+    assert db_rpc.latency_stats()['in_flight'] == 0
+
+
+def test_call_many_raises_on_timeout_and_drops_the_late_replies():
+    db_rpc, helyos_database = database_connector(lambda request: None if request['query'] == 'allAgents' else echo(request))
+
+    with pytest.raises(HelyOSTimeoutError):
+        db_rpc.call_many([{'query': 'allAgents'}, {'query': 'allYards'}], timeout=0.05)
+    stats = db_rpc.latency_stats()
+    assert stats['in_flight'] == 0
+    assert stats['queries']['allAgents']['timeouts'] == 1
+
+    helyos_database.answer = echo
+    helyos_database._answered = 0  # helyOS answers the expired requests now
+    assert db_rpc.call({'query': 'allYards'}) == {'echo': {'query': 'allYards'}}
+
+
+def test_call_many_returns_the_errors_in_place():
+    db_rpc, _ = database_connector(lambda request: None if request['query'] == 'allAgents' else echo(request))
+    responses = db_rpc.call_many([{'query': 'allYards'}, {'query': 'allAgents'}], timeout=0.05,
+                                 return_exceptions=True)
+
+    assert responses[0] == {'echo': {'query': 'allYards'}}
+    assert isinstance(responses[1], HelyOSTimeoutError)
+
+
+def test_send_and_wait():
+    db_rpc, _ = database_connector()
+    first, second = db_rpc.send({'query': 'allYards'}), db_rpc.send({'query': 'allAgents'})
+    assert first.corr_id != second.corr_id
+    assert db_rpc.wait(second) == {'echo': {'query': 'allAgents'}}
+    assert db_rpc.wait(first) == {'echo': {'query': 'allYards'}}
+
+
+def test_concurrent_callers_get_their_own_responses():
+    db_rpc, _ = database_connector()
+    responses = {}
+
+    def call(number):
+        responses[number] = db_rpc.call({'query': 'allAgents', 'conditions': {'id': number}})
+
+    threads = [threading.Thread(target=call, args=(number,)) for number in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(responses[number]['echo']['conditions'] == {'id': number} for number in range(8))
+
+
+def test_lost_connection_fails_the_pending_requests():
+    db_rpc, _ = database_connector(lambda request: None)
+    future = db_rpc.send({'query': 'allAgents'})
+    db_rpc.helyos_client.connection = connect(HelyOSClient('localhost', uuid='agent-1')).connection
+    db_rpc._ensure_connection()
+
+    assert future.exception() is not None
+    assert db_rpc.connection is db_rpc.helyos_client.connection
+
+
+def map_objects(count):
+    return [{'id': number, 'name': f'object-{number}'} for number in range(count)]
+
+
+def test_iter_query_yields_the_result_objects():
+    db_rpc, helyos_database = database_connector(lambda request: map_objects(5))
+    assert list(db_rpc.iter_query('allMapObjects', {'yard_id': 1})) == map_objects(5)
+    assert helyos_database.requests == [{'query': 'allMapObjects', 'conditions': {'yard_id': 1}}]
+
+
+def test_iter_query_pages():
+    db_rpc, _ = database_connector(lambda request: map_objects(5))
+    pages = list(db_rpc.iter_query('allMapObjects', page_size=2))
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert db_rpc.response is None  # the raw response is not kept
+
+
+def test_iter_query_sends_the_request_before_iterating():
+    db_rpc, helyos_database = database_connector(lambda request: map_objects(1))
+    first = db_rpc.iter_query('allMapObjects', {'yard_id': 1})
+    second = db_rpc.iter_query('allMapObjects', {'yard_id': 2})
+    assert len(db_rpc.helyos_client.channel.published) == 2
+    assert list(second) == list(first) == map_objects(1)
+
+
+def test_bulk_mutation_splits_the_items_in_chunks():
+    db_rpc, helyos_database = database_connector(lambda request: {'count': len(request['data'])})
+    result = db_rpc.create_map_objects(map_objects(25), chunk_size=10, max_in_flight=2)
+
+    assert result.ok
+    assert [len(chunk) for chunk in result.chunks] == [10, 10, 5]
+    assert result.responses == [{'count': 10}, {'count': 10}, {'count': 5}]
+    assert sorted(len(request['data']) for request in helyos_database.requests) == [5, 10, 10]
+    assert result.summary()['items'] == 25
+
+
+def test_bulk_mutation_chunks_by_size():
+    items = [{'id': number, 'payload': 'x' * 100} for number in range(10)]
+    assert [len(chunk) for chunk in chunked(items, chunk_size=100, max_bytes=400)] == [3, 3, 3, 1]
+
+
+def test_failed_chunks_do_not_stop_the_others():
+    db_rpc, _ = database_connector(lambda request: None if 3 in request['conditions']['ids'] else {'deleted': True})
+    result = db_rpc.delete_map_objects_by_ids(list(range(6)), chunk_size=2, timeout=0.05)
+
+    assert not result.ok
+    assert result.failed_items() == [2, 3]
+    assert isinstance(result.failures[0][1], HelyOSTimeoutError)
+    assert result.summary()['failed_chunks'] == 1
+    assert result.responses[0] == {'deleted': True}
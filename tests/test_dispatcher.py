@@ -0,0 +1,129 @@
+import asyncio
+import threading
+import time
+import pytest
+from helyos_agent_sdk.client import HelyOSClient
+from helyos_agent_sdk.connector import AgentConnector
+from helyos_agent_sdk.dispatcher import AsyncCallbackDispatcher, CallbackDispatcher, ordering_key
+from helyos_agent_sdk.exceptions import HelyOSDispatcherFullError
+from helyos_agent_sdk.model_codecs import from_dict
+from helyos_agent_sdk.models import AssignmentCommandMessage, WorkProcessResourcesRequest
+from tests.fakes import assignment_message, connect, helyos_envelope, instant_action_message
+
+
+def test_ordering_key_of_the_messages():
+    assert ordering_key(from_dict(AssignmentCommandMessage, assignment_message(1, work_process_id=10))) == 10
+    assert ordering_key(from_dict(AssignmentCommandMessage, assignment_message(1, work_process_id=0))) == 1
+    assert ordering_key(WorkProcessResourcesRequest(work_process_id=10)) == 10
+    assert ordering_key({'type': 'other'}) is None
+
+
+def test_callbacks_of_a_key_run_in_order_and_other_keys_concurrently():
+    dispatcher = CallbackDispatcher(max_workers=4)
+    order, release = [], threading.Event()
+
+    def callback(key, number):
+        if (key, number) == ('a', 0):
+            release.wait(5)
+        order.append((key, number))
+
+    futures = [dispatcher.submit(key, callback, key, number) for number in range(5) for key in ('a', 'b')]
+    for future in futures[1::2]:
+        future.result(5)  # key 'b' completes while the first callback of 'a' is blocked
+    assert [number for key, number in order if key == 'a'] == []
+    release.set()
+    for future in futures:
+        future.result(5)
+    dispatcher.shutdown()
+
+    assert [number for key, number in order if key == 'a'] == list(range(5))
+    assert dispatcher.summary()['completed'] == 10
+
+
+def test_failed_callback_does_not_stop_its_key():
+    dispatcher = CallbackDispatcher(max_workers=2)
+
+    def failing():
+        raise ValueError('crashed')
+
+    failed, next_callback = dispatcher.submit('a', failing), dispatcher.submit('a', lambda: 'ok')
+    assert next_callback.result(5) == 'ok'
+    assert isinstance(failed.exception(), ValueError)
+    dispatcher.shutdown()
+    assert dispatcher.summary()['failed'] == 1
+
+
+def test_submit_waits_when_max_in_flight_callbacks_are_queued():
+    dispatcher = CallbackDispatcher(max_workers=1, max_in_flight=2)
+    release = threading.Event()
+    dispatcher.submit('a', release.wait, 5)
+    dispatcher.submit('a', lambda: None)
+    submitting = threading.Thread(target=dispatcher.submit, args=('b', lambda: None))
+    submitting.start()
+    submitting.join(0.05)
+    assert submitting.is_alive()
+    release.set()
+    submitting.join(5)
+    dispatcher.shutdown()
+    assert dispatcher.summary()['completed'] == 3
+
+
+def test_async_callbacks_of_a_key_run_in_order():
+    order = []
+
+    async def callback(key, number, delay):
+        await asyncio.sleep(delay)
+        order.append((key, number))
+
+    async def main():
+        dispatcher = AsyncCallbackDispatcher(max_in_flight=10)
+        tasks = [dispatcher.submit('a', callback, 'a', number, 0.01 * (3 - number)) for number in range(3)]
+        tasks.append(dispatcher.submit('b', callback, 'b', 0, 0))
+        await asyncio.gather(*tasks)
+        return dispatcher
+
+    dispatcher = asyncio.run(main())
+    assert order == [('b', 0), ('a', 0), ('a', 1), ('a', 2)]
+    assert dispatcher.summary()['completed'] == 4
+
+
+def test_async_dispatcher_rejects_beyond_max_queued():
+    async def main():
+        dispatcher = AsyncCallbackDispatcher(max_in_flight=1, max_queued=2)
+        tasks = [dispatcher.submit(None, asyncio.sleep, 0) for _ in range(2)]
+        with pytest.raises(HelyOSDispatcherFullError):
+            dispatcher.submit(None, asyncio.sleep, 0)
+        await asyncio.gather(*tasks)
+        dispatcher.submit(None, asyncio.sleep, 0)  # room again
+        return dispatcher
+
+    assert asyncio.run(main()).summary()['rejected'] == 1
+
+
+def test_connector_dispatches_the_messages_of_a_work_process_in_order():
+    helyos_client = connect(HelyOSClient('localhost', uuid='agent-1'))
+    helyos_client.enable_manual_ack(prefetch_count=20)
+    agent_connector = AgentConnector(helyos_client)
+    agent_connector.enable_dispatcher(max_workers=4)
+    order = []
+
+    def assignment_callback(ch, sender, assignment, *args):
+        time.sleep(0.02)
+        order.append('assignment')
+
+    agent_connector.consume_assignment_messages(assignment_callback)
+    agent_connector.consume_instant_action_messages(
+        reserve_callback=lambda *args: order.append('reserve'),
+        release_callback=lambda *args: order.append('release'))
+
+    channel = helyos_client.channel
+    futures = [channel.deliver(helyos_client.assignment_queue.method.queue, helyos_envelope(assignment_message(1))),
+               channel.deliver(helyos_client.instant_actions_queue.method.queue,
+                               helyos_envelope(instant_action_message('release_from_mission')))]
+    for future in futures:
+        future.result(5)
+    agent_connector.disable_dispatcher()
+    helyos_client.connection.process_data_events()  # acks of the dispatched callbacks
+
+    assert order == ['assignment', 'release']
+    assert sorted(delivery_tag for delivery_tag, _ in channel.acks) == [1, 2]
@@ -0,0 +1,125 @@
+import json
+import os
+import subprocess
+import sys
+import pytest
+import pytest
+from helyos_agent_sdk import envelope
+from helyos_agent_sdk.client import HelyOSClient
+from helyos_agent_sdk.connector import AgentConnector
+from helyos_agent_sdk.crypto import ED25519, Signing, generate_private_public_keys, verify_signature
+from helyos_agent_sdk.models import AGENT_MESSAGE_TYPE, AGENT_STATE
+from helyos_agent_sdk.mqtt_client import HelyOSMQTTClient
+from tests.fakes import FakeMQTTClient, connect, helyos_envelope, instant_action_message
+
+
+MESSAGE = {'type': 'agent_state', 'uuid': 'agent-1', 'body': {'status': 'free', 'resources': None}}
+
+
+def test_signed_json_envelope_round_trip():
+    private_key, public_key = generate_private_public_keys(ED25519)
+    message_str = envelope.dumps(MESSAGE, canonical=True)
+    body = envelope.encode_envelope(message_str, Signing(private_key).return_signature(message_str).hex())
+
+    for received in (body, memoryview(body), bytearray(body), body.decode('utf-8')):
+        message, received_str, signature = envelope.decode_message(received)
+        assert message == MESSAGE
+        assert verify_signature(received_str, signature, public_key)
+
+
+def test_canonical_encoding_sorts_the_keys():
+    assert envelope.dumps({'b': 1, 'a': {'d': 2, 'c': 3}}, canonical=True) == envelope.dumps(
+        {'a': {'c': 3, 'd': 2}, 'b': 1})
+    assert json.loads(envelope.dumps(MESSAGE)) == MESSAGE
+
+
+def test_headers_are_only_included_when_given():
+    assert 'headers' not in envelope.decode_envelope(envelope.encode_envelope('{}'))
+    body = envelope.encode_envelope('{}', headers={'user_id': 'agent_user'})
+    assert envelope.decode_envelope(body)['headers'] == {'user_id': 'agent_user'}
+
+
+def test_envelope_without_message():
+    assert envelope.decode_message(b'{"signature": null}') == (None, None, None)
+
+
+def test_iter_message_yields_the_array_items():
+    body = envelope.encode_envelope(envelope.encode([{'id': 1}, {'id': 2}]))
+    assert list(envelope.iter_message(body)) == [{'id': 1}, {'id': 2}]
+    assert list(envelope.iter_message(envelope.encode_envelope('{"id": 3}'))) == [{'id': 3}]
+
+
+def test_signed_agent_state_can_be_verified_by_helyos():
+    helyos_client = connect(HelyOSClient('localhost', uuid='agent-1', signature_algorithm=ED25519))
+    AgentConnector(helyos_client).publish_state(AGENT_STATE.FREE, signed=True)
+
+    _, routing_key, _, body = helyos_client.channel.published[0]
+    message, message_str, signature = envelope.decode_message(body)
+    assert routing_key == 'agent.agent-1.state'
+    assert message['body']['status'] == AGENT_STATE.FREE.value
+    assert verify_signature(message_str, signature, helyos_client.public_key)
+
+
+def test_mqtt_other_callback_gets_the_payload_as_str():
+    helyos_client = HelyOSMQTTClient('localhost', uuid='agent-1')
+    helyos_client.connection = helyos_client.channel = FakeMQTTClient()
+    received = []
+    AgentConnector(helyos_client).consume_instant_action_messages(
+        other_callback=lambda ch, sender, received_msg: received.append(received_msg))
+
+    payload = helyos_envelope(instant_action_message('unknown_action'))
+    helyos_client.channel.deliver(helyos_client.instant_actions_routing_key, payload)
+    assert received == [payload.decode('utf-8')]
+
+
+@pytest.mark.parametrize('payload_format', [envelope.MSGPACK, envelope.CBOR])
+def test_signed_binary_envelope_round_trip(payload_format):
+    pytest.importorskip({envelope.MSGPACK: 'msgpack', envelope.CBOR: 'cbor2'}[payload_format])
+    private_key, public_key = generate_private_public_keys(ED25519)
+    message_bytes = envelope.encode(MESSAGE, payload_format, canonical=True)
+    signature = Signing(private_key).return_signature(message_bytes)
+    body = envelope.encode_envelope(message_bytes, signature, payload_format=payload_format)
+
+    assert envelope.detect_format(body) == payload_format
+    message, received, received_signature = envelope.decode_message(memoryview(body))
+    assert message == MESSAGE
+    assert received_signature == signature  # raw bytes, not hex
+    assert verify_signature(received, received_signature, public_key)
+
+
+def test_detect_format_of_json_envelopes():
+    assert envelope.detect_format(b'{"message": null}') == envelope.JSON
+    assert envelope.detect_format('{"message": null}') == envelope.JSON
+    assert envelope.detect_format(b'') == envelope.JSON
+
+
+def test_payload_format_per_message_type():
+    pytest.importorskip('msgpack')
+    helyos_client = connect(HelyOSClient('localhost', uuid='agent-1'))
+    agent_connector = AgentConnector(helyos_client, payload_formats={AGENT_MESSAGE_TYPE.STATE: envelope.MSGPACK})
+    agent_connector.publish_state(AGENT_STATE.FREE)
+    agent_connector.publish_general_updates({'name': 'agent'})
+
+    (_, _, state_properties, state_body), (_, _, update_properties, update_body) = helyos_client.channel.published
+    assert state_properties.content_type == 'application/msgpack'
+    assert envelope.detect_format(state_body) == envelope.MSGPACK
+    assert envelope.decode_message(state_body)[0]['body']['status'] == AGENT_STATE.FREE.value
+    assert update_properties.content_type is None
+    assert envelope.detect_format(update_body) == envelope.JSON
+
+
+def json_backend(**environ):
+    environ = {**{name: value for name, value in os.environ.items() if name != 'HELYOS_JSON_BACKEND'}, **environ}
+    code = 'from helyos_agent_sdk import envelope; print(envelope.JSON_BACKEND)'
+    return subprocess.run([sys.executable, '-c', code], env=environ, capture_output=True, text=True,
+                          check=True).stdout.strip()
+
+
+def test_standard_library_is_the_default_json_backend():
+    assert json_backend() == 'json'
+
+
+def test_orjson_backend_is_opt_in():
+    pytest.importorskip('orjson')
+    assert json_backend(HELYOS_JSON_BACKEND='orjson') == 'orjson'
+
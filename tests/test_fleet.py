@@ -0,0 +1,95 @@
+import asyncio
+import pytest
+from helyos_agent_sdk import envelope, fleet
+from helyos_agent_sdk.connection_profile import ASYNC_PROFILE, ConnectionProfile
+from helyos_agent_sdk.crypto import ED25519
+from helyos_agent_sdk.fleet import AgentFleet
+from helyos_agent_sdk.models import AGENT_STATE
+from tests.fakes import FakeConnection, assignment_message, helyos_envelope
+
+
+@pytest.fixture
+def opened_connections(monkeypatch):
+    connections = []
+
+    async def connect_rabbitmq_async(host, port, username, password, *args, **kwargs):
+        connection = FakeConnection()
+        connection.username = username
+        connection.profile = kwargs.get('profile')
+        connections.append(connection)
+        return connection
+
+    async def open_channel_async(connection):
+        return connection.channel()
+
+    monkeypatch.setattr(fleet, 'connect_rabbitmq_async', connect_rabbitmq_async)
+    monkeypatch.setattr(fleet, 'open_channel_async', open_channel_async)
+    return connections
+
+
+def test_agents_share_the_connections_of_the_account(opened_connections):
+    agent_fleet = AgentFleet('localhost', connections=2)
+    for number in range(5):
+        agent_fleet.add_agent(f'agent-{number}', signature_algorithm=ED25519)
+
+    asyncio.run(agent_fleet.connect('fleet_user', 'secret'))
+    assert len(opened_connections) == 2
+    assert sum(len(connection.channels) for connection in opened_connections) == 5
+    assert {connection.username for connection in opened_connections} == {'fleet_user'}
+    assert agent_fleet.summary()['connected'] == 5
+
+
+def test_account_connections_use_the_connection_profile_of_the_fleet(opened_connections):
+    profile = ConnectionProfile(heartbeat=10)
+    for connection_profile, expected in [(None, ASYNC_PROFILE), (profile, profile)]:
+        agent_fleet = AgentFleet('localhost', connection_profile=connection_profile)
+        agent_fleet.add_agent('agent-1', signature_algorithm=ED25519)
+        asyncio.run(agent_fleet.connect('fleet_user', 'secret'))
+        assert opened_connections.pop().profile is expected
+        assert agent_fleet['agent-1'].helyos_client.connection_profile is expected
+
+
+def test_agents_publish_with_their_uuid_and_are_counted(opened_connections):
+    agent_fleet = AgentFleet('localhost')
+    for uuid in ('agent-1', 'agent-2'):
+        agent_fleet.add_agent(uuid, signature_algorithm=ED25519)
+
+    async def main():
+        await agent_fleet.connect('fleet_user', 'secret')
+        for agent in agent_fleet:
+            await agent.publish_state(AGENT_STATE.FREE)
+
+    asyncio.run(main())
+    published = [message for channel in opened_connections[0].channels for message in channel.published]
+    assert [routing_key for _, routing_key, _, _ in published] == ['agent.agent-1.state', 'agent.agent-2.state']
+    assert envelope.decode_message(published[0][3])[0]['uuid'] == 'agent-1'
+    assert agent_fleet.summary()['published'] == 2
+
+
+def test_fleet_callbacks_receive_the_agent_connector(opened_connections):
+    agent_fleet = AgentFleet('localhost')
+    agent_connector = agent_fleet.add_agent('agent-1', signature_algorithm=ED25519)
+    received = []
+
+    async def main():
+        await agent_fleet.connect('fleet_user', 'secret')
+        await agent_fleet.consume_assignment_messages(
+            lambda connector, ch, sender, assignment, message_str, signature: received.append((connector, assignment)))
+        helyos_client = agent_connector.helyos_client
+        helyos_client.channel.deliver(helyos_client.assignment_queue.method.queue,
+                                      helyos_envelope(assignment_message(uuid='agent-1')))
+        await helyos_client.restore_consumers()
+        helyos_client.channel.deliver(helyos_client.assignment_queue.method.queue,
+                                      helyos_envelope(assignment_message(2, uuid='agent-1')))
+
+    asyncio.run(main())
+    assert received[0][0] is agent_connector
+    assert [assignment.metadata.id for _, assignment in received] == [1, 2]
+    assert agent_fleet.summary()['received'] == 2
+
+
+def test_duplicate_agents_are_rejected():
+    agent_fleet = AgentFleet('localhost')
+    agent_fleet.add_agent('agent-1')
+    with pytest.raises(ValueError):
+        agent_fleet.add_agent('agent-1')
@@ -0,0 +1,125 @@
+import asyncio
+from helyos_agent_sdk.async_client import AsyncHelyOSClient
+from helyos_agent_sdk.async_connector import AsyncAgentConnector
+from helyos_agent_sdk.client import HelyOSClient
+from helyos_agent_sdk.connector import AgentConnector
+from helyos_agent_sdk.fleet_consumer import AsyncFleetConsumer, FleetConsumer
+from helyos_agent_sdk.mqtt_client import HelyOSMQTTClient
+from tests.fakes import FakeMQTTClient, assignment_message, connect, helyos_envelope, instant_action_message
+
+
+def recording_connector(helyos_client, received):
+    agent_connector = AgentConnector(helyos_client)
+    agent_connector.assignment_callback = lambda ch, sender, assignment, *args: received.append(
+        ('assignment', helyos_client.uuid, assignment.metadata.id))
+    agent_connector.reserve_callback = lambda ch, sender, request, *args: received.append(
+        ('reserve', helyos_client.uuid, request.work_process_id))
+    return agent_connector
+
+
+def test_wildcard_queue_routes_deliveries_by_uuid():
+    gateway = connect(HelyOSClient('localhost', uuid='gateway'))
+    received, unrouted = [], []
+    fleet_consumer = FleetConsumer(gateway, unrouted_callback=lambda *delivery: unrouted.append(delivery))
+    for uuid in ('agent-1', 'agent-2'):
+        fleet_consumer.add_connector(recording_connector(HelyOSClient('localhost', uuid=uuid), received))
+    fleet_consumer.start()
+
+    channel = gateway.channel
+    assert [binding[2] for binding in channel.bindings] == ['agent.*.assignment', 'agent.*.instantActions']
+    assert channel.consumers[fleet_consumer.queue][1]  # auto_ack
+    channel.deliver(fleet_consumer.queue, helyos_envelope(assignment_message(5, uuid='agent-2')),
+                    routing_key='agent.agent-2.assignment')
+    channel.deliver(fleet_consumer.queue, helyos_envelope(instant_action_message('reserve_for_mission', 7)),
+                    routing_key='agent.agent-1.instantActions')
+    channel.deliver(fleet_consumer.queue, helyos_envelope(assignment_message(6, uuid='agent-9')),
+                    routing_key='agent.agent-9.assignment')
+
+    assert received == [('assignment', 'agent-2', 5), ('reserve', 'agent-1', 7)]
+    assert len(unrouted) == 1
+    assert fleet_consumer.summary() == {'agents': 2, 'routed': 2, 'unrouted': 1}
+
+
+def test_uuids_with_separators_and_removed_agents():
+    fleet_consumer = FleetConsumer(connect(HelyOSClient('localhost', uuid='gateway')))
+    delivered = []
+    fleet_consumer.add_agent('site.a.7', assignment_callback=lambda *delivery: delivered.append(delivery))
+    fleet_consumer._route('agent.site.a.7.assignment', 'delivery')
+    fleet_consumer.remove_agent('site.a.7')
+    fleet_consumer._route('agent.site.a.7.assignment', 'delivery')
+
+    assert delivered == [('delivery',)]
+    assert fleet_consumer.summary() == {'agents': 0, 'routed': 1, 'unrouted': 1}
+
+
+def test_routing_keys_without_the_agent_prefix_are_unrouted():
+    fleet_consumer = FleetConsumer(connect(HelyOSClient('localhost', uuid='gateway')))
+    delivered = []
+    fleet_consumer.add_agent('agent-1', assignment_callback=lambda *delivery: delivered.append(delivery))
+    for routing_key in ('yard.agent-1.assignment', 'agent.assignment', 'agent-1.assignment',
+                        'agent/agent-1/assignment'):
+        fleet_consumer._route(routing_key, 'delivery')
+
+    assert delivered == []
+    assert fleet_consumer.summary() == {'agents': 1, 'routed': 0, 'unrouted': 4}
+
+
+def test_manual_acknowledgements_of_the_wildcard_queue():
+    gateway = connect(HelyOSClient('localhost', uuid='gateway'))
+    gateway.enable_manual_ack(prefetch_count=4)
+    fleet_consumer = FleetConsumer(gateway)
+    fleet_consumer.add_agent('agent-1', assignment_callback=lambda *delivery: None,
+                             instant_actions_callback=lambda *delivery: 1 / 0)
+    fleet_consumer.start()
+
+    channel = gateway.channel
+    assert not channel.consumers[fleet_consumer.queue][1]  # auto_ack
+    assert channel.prefetch_count == 4
+    channel.deliver(fleet_consumer.queue, b'{}', routing_key='agent.agent-1.assignment')
+    channel.deliver(fleet_consumer.queue, b'{}', routing_key='agent.agent-1.instantActions')
+    assert (gateway.acknowledger.acked, gateway.acknowledger.nacked) == (1, 1)
+
+
+def test_mqtt_wildcard_subscription():
+    gateway = HelyOSMQTTClient('localhost', uuid='gateway')
+    gateway.connection = gateway.channel = FakeMQTTClient()
+    received = []
+    fleet_consumer = FleetConsumer(gateway)
+    fleet_consumer.add_connector(recording_connector(HelyOSMQTTClient('localhost', uuid='agent-1'), received))
+    fleet_consumer.start()
+
+    assert set(gateway.channel.subscriptions) == {'agent/+/assignment', 'agent/+/instantActions'}
+    gateway.channel.deliver('agent/agent-1/assignment', helyos_envelope(assignment_message(3)))
+    assert received == [('assignment', 'agent-1', 3)]
+    assert fleet_consumer._route('agent.agent-1.assignment', 'delivery') is None
+    assert fleet_consumer.summary() == {'agents': 1, 'routed': 1, 'unrouted': 1}
+
+
+def test_handler_errors_do_not_stop_the_consumer():
+    fleet_consumer = FleetConsumer(connect(HelyOSClient('localhost', uuid='gateway')))
+    fleet_consumer.add_agent('agent-1', assignment_callback=lambda *delivery: 1 / 0)
+    fleet_consumer.start()
+    fleet_consumer.helyos_client.channel.deliver(fleet_consumer.queue, b'{}', routing_key='agent.agent-1.assignment')
+    assert fleet_consumer.routed == 1
+
+
+def test_async_fleet_consumer_schedules_coroutine_callbacks():
+    gateway = connect(AsyncHelyOSClient('localhost', uuid='gateway'))
+    received = []
+
+    async def assignment_callback(ch, sender, assignment, message_str, signature):
+        await asyncio.sleep(0)
+        received.append(assignment.metadata.id)
+
+    async def main():
+        agent_connector = AsyncAgentConnector(AsyncHelyOSClient('localhost', uuid='agent-1'))
+        agent_connector.assignment_callback = assignment_callback
+        fleet_consumer = AsyncFleetConsumer(gateway)
+        fleet_consumer.add_connector(agent_connector)
+        await fleet_consumer.start()
+        task = gateway.channel.deliver(fleet_consumer.queue, helyos_envelope(assignment_message(4)),
+                                       routing_key='agent.agent-1.assignment')
+        await task
+
+    asyncio.run(main())
+    assert received == [4]
@@ -0,0 +1,139 @@
+import threading
+import time
+import pika
+import pytest
+from helyos_agent_sdk.exceptions import HelyOSTimeoutError
+from helyos_agent_sdk.client import AGENTS_DL_EXCHANGE, HelyOSClient
+from helyos_agent_sdk.io_thread import AMQPIOThread
+from helyos_agent_sdk.outbox import Outbox
+from tests.fakes import connect
+
+
+def io_thread_of(helyos_client, **kwargs):
+    return AMQPIOThread(connect(helyos_client), **kwargs)
+
+
+def test_enqueued_messages_are_published_in_batches_by_the_connection_callback():
+    io_thread = io_thread_of(HelyOSClient('localhost', uuid='agent-1'), max_batch=2)
+    for number in range(3):
+        io_thread.enqueue('xchange', f'key.{number}', None, b'body')
+    connection = io_thread.helyos_client.connection
+    assert len(connection.threadsafe_callbacks) == 1  # a single wake-up for the three messages
+
+    connection.process_data_events()
+    assert [message[1] for message in io_thread.helyos_client.channel.published] == ['key.0', 'key.1']
+    io_thread._drain()
+    assert io_thread.summary() == {'queued': 0, 'sent': 3, 'batches': 2, 'dropped': 0}
+
+
+def test_message_failing_with_a_connection_error_stays_first_in_the_queue():
+    io_thread = io_thread_of(HelyOSClient('localhost', uuid='agent-1'))
+    channel = io_thread.helyos_client.channel
+    io_thread.enqueue('xchange', 'key.0', None, b'body')
+    io_thread.enqueue('xchange', 'key.1', None, b'body')
+    channel.publish_error = pika.exceptions.AMQPConnectionError('lost')
+
+    with pytest.raises(pika.exceptions.AMQPConnectionError):
+        io_thread._drain()
+    assert [item[1] for item in io_thread.outbound] == ['key.0', 'key.1']
+
+    channel.publish_error = None
+    io_thread._drain()
+    assert [message[1] for message in channel.published] == ['key.0', 'key.1']
+
+
+def test_poison_message_is_dropped_after_max_attempts():
+    io_thread = io_thread_of(HelyOSClient('localhost', uuid='agent-1'), max_attempts=3)
+    channel = io_thread.helyos_client.channel
+    io_thread.enqueue('xchange', 'poison', None, b'body')
+    channel.publish_error = ValueError('cannot be sent')
+
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            io_thread._drain()
+    io_thread._drain()
+    assert io_thread.dropped == 1 and not io_thread.outbound
+
+    channel.publish_error = None
+    io_thread.enqueue('xchange', 'next', None, b'body')
+    io_thread._drain()
+    assert [message[1] for message in channel.published] == ['next']
+
+
+def test_messages_left_after_the_stop_deadline_go_to_the_outbox(tmp_path):
+    helyos_client = HelyOSClient('localhost', uuid='agent-1')
+    io_thread = io_thread_of(helyos_client, stop_timeout=0)
+    helyos_client.outbox = Outbox(str(tmp_path), replay_rate=None)
+    io_thread.enqueue('xchange', 'agent.agent-1.state', pika.BasicProperties(user_id='agent_user'), b'state')
+    io_thread._stop_deadline = time.monotonic() - 1
+
+    io_thread._run()
+    assert helyos_client.channel.published == []
+    assert helyos_client.outbox.summary()['stored'] == 1
+    assert io_thread.dropped == 0
+
+    replayed = []
+    helyos_client.outbox.replay(lambda *message: replayed.append(message))
+    assert replayed[0][1] == 'agent.agent-1.state' and replayed[0][2].user_id == 'agent_user'
+
+
+def test_messages_left_after_the_stop_deadline_are_dropped_without_outbox():
+    io_thread = io_thread_of(HelyOSClient('localhost', uuid='agent-1'), stop_timeout=0)
+    io_thread.enqueue('xchange', 'key', None, b'body')
+    io_thread._stop_deadline = time.monotonic() - 1
+
+    io_thread._run()
+    assert io_thread.dropped == 1
+
+
+def test_stop_publishes_the_queued_messages():
+    io_thread = io_thread_of(HelyOSClient('localhost', uuid='agent-1'))
+    io_thread.start()
+    for number in range(100):
+        io_thread.enqueue('xchange', f'key.{number}', None, b'body')
+    io_thread.stop(timeout=5)
+
+    assert not io_thread.is_alive
+    assert len(io_thread.helyos_client.channel.published) == 100
+    assert io_thread.summary()['sent'] == 100
+
+
+def test_consumers_are_registered_again_after_a_reconnection(monkeypatch):
+    helyos_client = connect(HelyOSClient('localhost', uuid='agent-1'))
+    io_thread = AMQPIOThread(helyos_client)
+    received = []
+    helyos_client.consume_assignment_messages(lambda ch, method, properties, body: received.append(body))
+
+    def lose_connection(time_limit=0):
+        raise pika.exceptions.AMQPConnectionError('lost')
+
+    def reconnect(username, password):
+        connect(helyos_client, username)
+        # stop after the first loop on the new connection
+        helyos_client.connection.process_data_events = lambda time_limit=0: setattr(io_thread, '_running', False)
+
+    helyos_client.connection.process_data_events = lose_connection
+    monkeypatch.setattr(helyos_client, 'connect', reconnect)
+    io_thread._running = True
+    io_thread._run()
+
+    channel = helyos_client.channel
+    queue = helyos_client.assignment_queue.method.queue
+    assert (queue, AGENTS_DL_EXCHANGE, helyos_client.assignment_routing_key) in channel.bindings
+    channel.deliver(queue, b'assignment')
+    assert received == [b'assignment']
+
+
+def test_call_times_out_when_the_thread_does_not_run_the_function():
+    io_thread = io_thread_of(HelyOSClient('localhost', uuid='agent-1'), call_timeout=0.05)
+    stopped = threading.Event()
+    io_thread._thread = threading.Thread(target=stopped.wait)  # alive, but never pumps the connection
+    io_thread._thread.start()
+    calls = []
+
+    with pytest.raises(HelyOSTimeoutError):
+        io_thread.call(calls.append, 'called')
+    io_thread.helyos_client.connection.process_data_events()
+    assert calls == []  # cancelled
+    stopped.set()
+
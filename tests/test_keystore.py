@@ -0,0 +1,68 @@
+import os
+import stat
+import threading
+from helyos_agent_sdk.client import HelyOSClient
+from helyos_agent_sdk.crypto import ED25519, generate_private_public_keys, verify_signature
+from helyos_agent_sdk.keystore import AgentKeystore
+
+
+def test_key_is_generated_once_and_kept_across_restarts(tmp_path):
+    keystore = AgentKeystore(str(tmp_path / 'keys'))
+    first = keystore.load_or_create('agent-1', ED25519)
+    second = AgentKeystore(str(tmp_path / 'keys')).load_or_create('agent-1', ED25519)
+
+    assert first == second
+    assert stat.S_IMODE(os.stat(keystore.path('agent-1', ED25519)).st_mode) == 0o600
+    assert stat.S_IMODE(os.stat(keystore.directory).st_mode) == 0o700
+
+
+def test_existing_key_directory_is_made_private(tmp_path):
+    directory = tmp_path / 'keys'
+    directory.mkdir(mode=0o755)
+    os.chmod(directory, 0o755)
+    AgentKeystore(str(directory)).load_or_create('agent-1', ED25519)
+    assert stat.S_IMODE(os.stat(directory).st_mode) == 0o700
+
+
+def test_save_does_not_replace_an_existing_key(tmp_path):
+    keystore = AgentKeystore(str(tmp_path))
+    stored_private_key = keystore.load_or_create('agent-1', ED25519)[0]
+    other_private_key = generate_private_public_keys(ED25519)[0]
+
+    assert not keystore.save('agent-1', other_private_key, ED25519)
+    assert keystore.load('agent-1', ED25519)[0] == stored_private_key
+    assert keystore.save('agent-1', other_private_key, ED25519, overwrite=True)
+    assert keystore.load('agent-1', ED25519)[0] == other_private_key
+
+
+def test_uuid_is_sanitized_in_the_file_name(tmp_path):
+    keystore = AgentKeystore(str(tmp_path))
+    assert os.path.dirname(keystore.path('../agent/1')) == str(tmp_path)
+
+
+def test_client_keys_are_created_lazily_from_the_keystore(tmp_path):
+    keystore = AgentKeystore(str(tmp_path))
+    helyos_client = HelyOSClient('localhost', uuid='agent-1', signature_algorithm=ED25519, keystore=keystore)
+    assert helyos_client._private_key is None
+    assert keystore.load('agent-1', ED25519) is None
+
+    signature = helyos_client.signing_helper.return_signature('message')
+    assert verify_signature('message', signature, helyos_client.public_key)
+    assert keystore.load('agent-1', ED25519) == (helyos_client.private_key, helyos_client.public_key)
+
+
+def test_concurrent_first_access_returns_the_same_key_pair():
+    helyos_client = HelyOSClient('localhost', uuid='agent-1', signature_algorithm=ED25519)
+    pairs = []
+    barrier = threading.Barrier(8)
+
+    def read_keys():
+        barrier.wait()
+        pairs.append((helyos_client.private_key, helyos_client.public_key))
+
+    threads = [threading.Thread(target=read_keys) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(pairs)) == 1
@@ -0,0 +1,59 @@
+import pytest
+from helyos_agent_sdk import envelope
+from helyos_agent_sdk.model_codecs import codec, from_dict, to_dict
+from helyos_agent_sdk.models import (AGENT_STATE, ASSIGNMENT_STATUS, AgentCurrentResources, AgentStateBody,
+                                     AgentStateMessage, AssignmentCommandMessage, AssignmentCurrentStatus,
+                                     AssignmentMetadata, MissionRequestMessage, WorkProcessClearanceMessage,
+                                     WorkProcessResourcesRequest)
+from tests.fakes import assignment_message
+
+
+def agent_state_message():
+    body = AgentStateBody(status=AGENT_STATE.BUSY,
+                          resources=AgentCurrentResources(operation_types_available=['drive'], work_process_id=10,
+                                                          reserved=True),
+                          assignment=AssignmentCurrentStatus(id='1', status=ASSIGNMENT_STATUS.EXECUTING,
+                                                             result={'done': [1, 2]}))
+    return AgentStateMessage(uuid='agent-1', body=body)
+
+
+@pytest.mark.parametrize('message', [agent_state_message(),
+                                     MissionRequestMessage(uuid='agent-1', body={'data': {'x': 1}})])
+def test_encoder_matches_dataclasses_json(message):
+    assert to_dict(message) == message.to_dict(encode_json=True)
+
+
+def test_nested_models_are_decoded():
+    message = from_dict(AssignmentCommandMessage, assignment_message(assignment_id=7, work_process_id=3))
+    assert isinstance(message.metadata, AssignmentMetadata)
+    assert (message.metadata.id, message.metadata.work_process_id) == (7, 3)
+
+    clearance = from_dict(WorkProcessClearanceMessage, {'uuid': 'agent-1', 'body': {'work_process_id': 3}})
+    assert clearance.body == WorkProcessResourcesRequest(work_process_id=3)
+    # as the connector always did: a missing metadata is decoded as AssignmentMetadata(**{})
+    assert isinstance(clearance.metadata, AssignmentMetadata) and clearance.metadata.id == 0
+
+
+def test_unknown_keys_are_ignored_and_the_input_is_not_modified():
+    data = assignment_message()
+    data['unknown'] = True
+    original = {**data, 'metadata': dict(data['metadata'])}
+    assert from_dict(AssignmentCommandMessage, data).uuid == 'agent-1'
+    assert data == original
+
+
+def test_missing_required_fields_raise_type_error():
+    with pytest.raises(TypeError):
+        from_dict(AssignmentCommandMessage, {'body': {}})
+
+
+def test_round_trip_through_the_payload_formats():
+    model_codec = codec(WorkProcessResourcesRequest)
+    request = WorkProcessResourcesRequest(work_process_id=3, operation_types_required=['drive'], reserved=True)
+    assert model_codec.from_bytes(model_codec.to_bytes(request)) == request
+    pytest.importorskip('msgpack')
+    assert model_codec.from_bytes(model_codec.to_bytes(request, envelope.MSGPACK)) == request
+
+
+def test_codecs_are_compiled_once():
+    assert codec(AssignmentMetadata) is codec(AssignmentMetadata)
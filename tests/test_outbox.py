@@ -0,0 +1,145 @@
+import os
+import pika
+import pytest
+from helyos_agent_sdk import envelope
+from helyos_agent_sdk.async_client import AsyncHelyOSClient
+from helyos_agent_sdk.client import HelyOSClient
+from helyos_agent_sdk.exceptions import HelyOSOutboxFullError, HelyOSUnsupportedError
+from helyos_agent_sdk.outbox import CRITICAL, Outbox
+from tests.fakes import connect
+
+
+def replay_all(outbox, max_messages=None):
+    replayed = []
+    outbox.replay(lambda exchange, routing_key, properties, body: replayed.append((routing_key, body)), max_messages)
+    return replayed
+
+
+def segment_paths(directory, kind=CRITICAL):
+    log_directory = os.path.join(directory, kind)
+    return sorted(os.path.join(log_directory, name) for name in os.listdir(log_directory) if name.endswith('.log'))
+
+
+def test_messages_are_replayed_in_publication_order_across_the_logs(tmp_path):
+    outbox = Outbox(str(tmp_path), replay_rate=None)
+    for routing_key in ('agent.a.state', 'agent.a.visualization', 'agent.a.update', 'agent.a.visualization'):
+        outbox.put('xchange', routing_key, None, routing_key.encode())
+
+    assert [routing_key for routing_key, _ in replay_all(outbox)] == [
+        'agent.a.state', 'agent.a.visualization', 'agent.a.update', 'agent.a.visualization']
+    assert not outbox.pending
+
+
+def test_properties_are_kept(tmp_path):
+    outbox = Outbox(str(tmp_path), replay_rate=None)
+    outbox.put('xchange', 'agent.a.state', pika.BasicProperties(user_id='agent_user', correlation_id='7'), b'{}')
+    replayed = []
+    outbox.replay(lambda *message: replayed.append(message))
+    exchange, routing_key, properties, body = replayed[0]
+    assert (exchange, properties.user_id, properties.correlation_id, body) == ('xchange', 'agent_user', '7', b'{}')
+
+
+def test_cursor_is_kept_after_reopening(tmp_path):
+    outbox = Outbox(str(tmp_path), segment_bytes=200, replay_rate=None)
+    for number in range(10):
+        outbox.put('xchange', 'agent.a.state', None, f'message-{number}'.encode())
+    assert len(replay_all(outbox, max_messages=4)) == 4
+    outbox.close()
+
+    reopened = Outbox(str(tmp_path), segment_bytes=200, replay_rate=None)
+    assert [body for _, body in replay_all(reopened)] == [f'message-{number}'.encode() for number in range(4, 10)]
+    reopened.put('xchange', 'agent.a.state', None, b'message-10')
+    assert [body for _, body in replay_all(reopened)] == [b'message-10']  # sequence numbers continue
+
+
+def test_torn_record_at_the_end_is_truncated_on_reopening(tmp_path):
+    outbox = Outbox(str(tmp_path), replay_rate=None)
+    for number in range(3):
+        outbox.put('xchange', 'agent.a.state', None, f'message-{number}'.encode())
+    outbox.close()
+    last_segment = segment_paths(str(tmp_path))[-1]
+    size = os.path.getsize(last_segment)
+    with open(last_segment, 'r+b') as segment:
+        segment.truncate(size - 3)
+
+    reopened = Outbox(str(tmp_path), replay_rate=None)
+    assert [body for _, body in replay_all(reopened)] == [b'message-0', b'message-1']
+
+
+def test_record_with_a_wrong_crc_is_not_replayed(tmp_path):
+    outbox = Outbox(str(tmp_path), replay_rate=None)
+    for number in range(3):
+        outbox.put('xchange', 'agent.a.state', None, f'message-{number}'.encode())
+    outbox.close()
+    last_segment = segment_paths(str(tmp_path))[-1]
+    with open(last_segment, 'r+b') as segment:
+        data = segment.read()
+        segment.seek(data.rindex(b'message-2'))
+        segment.write(b'MESSAGE')
+
+    assert [body for _, body in replay_all(Outbox(str(tmp_path), replay_rate=None))] == [b'message-0', b'message-1']
+
+
+def test_failed_publication_keeps_the_message(tmp_path):
+    outbox = Outbox(str(tmp_path), replay_rate=None)
+    outbox.put('xchange', 'agent.a.state', None, b'state')
+
+    def publish(*message):
+        raise pika.exceptions.AMQPConnectionError('lost')
+
+    with pytest.raises(pika.exceptions.AMQPConnectionError):
+        outbox.replay(publish)
+    assert replay_all(outbox) == [('agent.a.state', b'state')]
+
+
+def test_droppable_messages_make_room_and_are_rejected_first(tmp_path):
+    outbox = Outbox(str(tmp_path), max_bytes=2000, segment_bytes=500, replay_rate=None, hard_max_bytes=4000)
+    for _ in range(20):
+        outbox.put('xchange', 'agent.a.visualization', None, b'x' * 100)
+    assert outbox.summary()['dropped_segments'] > 0
+    assert outbox.summary()['bytes'] <= 2000
+
+    for _ in range(20):
+        assert outbox.put('xchange', 'agent.a.state', None, b'x' * 100)
+    assert not outbox.put('xchange', 'agent.a.visualization', None, b'x' * 100)
+    assert outbox.summary()['dropped'] == 1
+
+
+def test_hard_limit_rejects_the_critical_messages(tmp_path):
+    outbox = Outbox(str(tmp_path), max_bytes=500, replay_rate=None, hard_max_bytes=1000)
+    with pytest.raises(HelyOSOutboxFullError):
+        for _ in range(20):
+            outbox.put('xchange', 'agent.a.state', None, b'x' * 100)
+    assert outbox.summary()['rejected'] == 1
+    assert outbox.summary()['bytes'] <= 1000
+
+
+def test_replay_rate(tmp_path):
+    outbox = Outbox(str(tmp_path), replay_rate=5)
+    for _ in range(20):
+        outbox.put('xchange', 'agent.a.state', None, b'state')
+    outbox._tokens = 5
+    assert len(replay_all(outbox)) == 5
+
+
+def test_client_stores_the_messages_while_the_broker_is_unreachable(tmp_path):
+    helyos_client = connect(HelyOSClient('localhost', uuid='agent-1'))
+    helyos_client.enable_outbox(str(tmp_path), replay_rate=None)
+    channel = helyos_client.channel
+
+    channel.publish_error = pika.exceptions.AMQPConnectionError('lost')
+    helyos_client.publish(helyos_client.status_routing_key, '{"n": 1}')
+    assert helyos_client.outbox.pending and not channel.published
+
+    channel.publish_error = None
+    helyos_client.publish(helyos_client.status_routing_key, '{"n": 2}')
+    assert [envelope.decode_message(body)[0] for _, _, _, body in channel.published] == [{'n': 1}, {'n': 2}]
+    assert not helyos_client.outbox.pending
+
+
+def test_async_client_has_no_outbox(tmp_path):
+    helyos_client = AsyncHelyOSClient('localhost', uuid='agent-1')
+    with pytest.raises(HelyOSUnsupportedError):
+        helyos_client.enable_outbox(str(tmp_path))
+    with pytest.raises(HelyOSUnsupportedError):
+        helyos_client.start_io_thread()
@@ -0,0 +1,90 @@
+import asyncio
+import pytest
+from helyos_agent_sdk.async_client import AsyncHelyOSClient
+from helyos_agent_sdk.async_connector import AsyncAgentConnector
+from helyos_agent_sdk.exceptions import HelyOSPublishError
+from helyos_agent_sdk.models import AGENT_STATE
+from helyos_agent_sdk.publisher import ConfirmPublisher
+from tests.fakes import FakeChannel, connect
+
+
+async def bound_publisher(max_in_flight=1000):
+    publisher = ConfirmPublisher(max_in_flight=max_in_flight)
+    channel = FakeChannel()
+    await publisher.bind(channel)
+    return publisher, channel
+
+
+def test_ack_resolves_the_future_with_the_delivery_tag():
+    async def main():
+        publisher, channel = await bound_publisher()
+        future = await publisher.publish('xchange', 'key', b'body')
+        channel.confirm(1)
+        assert await future == 1
+        assert publisher.summary()['acked'] == 1
+        assert publisher.in_flight == 0
+
+    asyncio.run(main())
+
+
+def test_nack_fails_the_future():
+    async def main():
+        publisher, channel = await bound_publisher()
+        future = await publisher.publish('xchange', 'key', b'body')
+        channel.confirm(1, acked=False)
+        with pytest.raises(HelyOSPublishError):
+            await future
+        assert publisher.stats.nacked == 1
+
+    asyncio.run(main())
+
+
+def test_cumulative_ack_resolves_all_messages_up_to_the_tag():
+    async def main():
+        publisher, channel = await bound_publisher()
+        futures = [await publisher.publish('xchange', 'key', b'body') for _ in range(3)]
+        channel.confirm(2, multiple=True)
+        assert [future.done() for future in futures] == [True, True, False]
+        channel.confirm(3)
+        assert await publisher.flush(timeout=1) == 0
+
+    asyncio.run(main())
+
+
+def test_publish_waits_while_the_window_is_full():
+    async def main():
+        publisher, channel = await bound_publisher(max_in_flight=1)
+        await publisher.publish('xchange', 'key', b'first')
+        second = asyncio.ensure_future(publisher.publish('xchange', 'key', b'second'))
+        await asyncio.sleep(0)
+        assert not second.done() and len(channel.published) == 1
+        channel.confirm(1)
+        await second
+        assert len(channel.published) == 2
+
+    asyncio.run(main())
+
+
+def test_closing_the_channel_fails_the_pending_messages():
+    async def main():
+        publisher, channel = await bound_publisher()
+        futures = [await publisher.publish('xchange', 'key', b'body') for _ in range(2)]
+        channel.close()
+        assert await publisher.flush(timeout=1) == 0  # nothing left pending
+        assert all(isinstance(future.exception(), HelyOSPublishError) for future in futures)
+
+    asyncio.run(main())
+
+
+def test_connector_returns_the_confirmation_future_of_each_message():
+    client = connect(AsyncHelyOSClient('localhost', uuid='agent-1', publisher_confirms=True))
+    connector = AsyncAgentConnector(client)
+
+    async def main():
+        await client.publisher.bind(client.channel)
+        confirmation = await connector.publish_state(AGENT_STATE.FREE)
+        assert not confirmation.done()
+        client.channel.confirm(1)
+        assert await confirmation == 1
+
+    asyncio.run(main())
@@ -0,0 +1,135 @@
+import threading
+import time
+import pytest
+from helyos_agent_sdk.client import HelyOSClient
+from helyos_agent_sdk.database_connector import DatabaseConnector
+from helyos_agent_sdk.query_cache import QueryCache
+from tests.fakes import FakeHelyOSDatabase, connect
+
+
+class CountingFetch():
+
+    def __init__(self, value='result'):
+        self.value = value
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.value
+
+
+def map_objects_query(yard_id):
+    return {'query': 'allMapObjects', 'conditions': {'yard_id': yard_id}}
+
+
+def test_results_are_cached_by_query_and_conditions():
+    cache, fetch = QueryCache(), CountingFetch()
+    cache.call(map_objects_query(1), fetch)
+    cache.call({'conditions': {'yard_id': 1}, 'query': 'allMapObjects'}, fetch)
+    cache.call(map_objects_query(2), fetch)
+
+    assert fetch.calls == 2
+    assert cache.summary()['hits'] == 1
+
+
+def test_results_expire_after_their_ttl():
+    cache, fetch = QueryCache(default_ttl=0.01, ttls={'allYards': 0}), CountingFetch()
+    cache.call(map_objects_query(1), fetch)
+    time.sleep(0.02)
+    cache.call(map_objects_query(1), fetch)
+    cache.call({'query': 'allYards'}, fetch)
+    cache.call({'query': 'allYards'}, fetch)
+    assert fetch.calls == 4
+
+
+def test_least_recently_used_results_are_evicted():
+    cache, fetch = QueryCache(max_entries=2), CountingFetch()
+    for yard_id in (1, 2, 1, 3):
+        cache.call(map_objects_query(yard_id), fetch)
+    cache.call(map_objects_query(1), fetch)
+    assert fetch.calls == 3
+    assert cache.summary()['evictions'] == 1
+
+
+def test_concurrent_identical_queries_are_sent_once():
+    cache = QueryCache()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def slow_fetch():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 'result'
+
+    results = []
+    first = threading.Thread(target=lambda: results.append(cache.call(map_objects_query(1), slow_fetch)))
+    first.start()
+    started.wait(5)
+    others = [threading.Thread(target=lambda: results.append(cache.call(map_objects_query(1), slow_fetch, timeout=5)))
+              for _ in range(4)]
+    for thread in others:
+        thread.start()
+    while cache.summary()['coalesced'] < 4:
+        time.sleep(0.001)
+    release.set()
+    for thread in [first] + others:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == ['result'] * 5
+
+
+def test_failed_fetch_is_not_cached():
+    cache = QueryCache()
+
+    def failing_fetch():
+        raise ValueError('lost')
+
+    with pytest.raises(ValueError):
+        cache.call(map_objects_query(1), failing_fetch)
+    fetch = CountingFetch()
+    assert cache.call(map_objects_query(1), fetch) == 'result'
+    assert fetch.calls == 1
+
+
+def test_mutations_invalidate_the_results_of_their_yards():
+    cache, fetch = QueryCache(), CountingFetch()
+    cache.call(map_objects_query(1), fetch)
+    cache.call(map_objects_query(2), fetch)
+    cache.call({'query': 'allYards'}, fetch)
+
+    cache.call({'mutation': 'createMapObjects', 'data': [{'name': 'wall', 'yard_id': 1}]}, fetch)
+    assert cache.summary()['invalidations'] == 1
+    cache.call(map_objects_query(2), fetch)
+    cache.call({'query': 'allYards'}, fetch)
+    assert fetch.calls == 4  # 3 queries and the mutation
+
+    cache.call({'mutation': 'deleteMapObjectByIds', 'conditions': {'ids': [1, 2]}}, fetch)
+    assert cache.summary()['entries'] == 1  # yards unknown: all map object results dropped
+
+
+def test_result_of_a_query_running_during_a_mutation_is_not_stored():
+    cache = QueryCache()
+
+    def fetch_during_mutation():
+        cache.invalidate({'mutation': 'createMapObjects', 'data': [{'yard_id': 1}]})
+        return 'stale'
+
+    assert cache.call(map_objects_query(1), fetch_during_mutation) == 'stale'
+    assert cache.summary()['entries'] == 0
+
+
+def test_database_connector_cache():
+    helyos_client = connect(HelyOSClient('localhost', uuid='agent-1'))
+    helyos_database = FakeHelyOSDatabase(helyos_client, lambda request: [{'id': 1}])
+    db_rpc = DatabaseConnector(helyos_client, timeout=5)
+    db_rpc.enable_cache()
+
+    db_rpc.call(map_objects_query(1))
+    db_rpc.call(map_objects_query(1))
+    db_rpc.call_many([{'mutation': 'deleteMapObjects', 'conditions': {'yard_id': 1}}])
+    db_rpc.call(map_objects_query(1))
+
+    assert [request.get('query', request.get('mutation')) for request in helyos_database.requests] == \
+        ['allMapObjects', 'deleteMapObjects', 'allMapObjects']
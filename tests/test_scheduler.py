@@ -0,0 +1,103 @@
+import threading
+import pytest
+from helyos_agent_sdk.client import HelyOSClient
+from helyos_agent_sdk.exceptions import HelyOSPublishError
+from helyos_agent_sdk.io_thread import AMQPIOThread
+from helyos_agent_sdk.scheduler import WEIGHTED, OutboundScheduler, TrafficClass
+from tests.fakes import connect
+
+
+def drain(scheduler):
+    items = []
+    next_item = scheduler.pop()
+    while next_item is not None:
+        items.append(next_item[1])
+        next_item = scheduler.pop()
+    return items
+
+
+def test_messages_are_classified_by_routing_key_suffix():
+    scheduler = OutboundScheduler()
+    assert scheduler.classify('agent.a.visualization').name == 'sensors'
+    assert scheduler.classify('agent.a.state').name == 'control'
+    assert scheduler.classify('unknown').name == 'control'
+    assert scheduler.classify('agent/a/visualization').name == 'sensors'
+    assert scheduler.classify('agent/a.b/state').name == 'control'
+
+
+def test_strict_policy_sends_control_messages_first():
+    scheduler = OutboundScheduler()
+    for number in range(3):
+        scheduler.put(f'sensors-{number}', 'agent.a.visualization')
+    scheduler.put('state', 'agent.a.state')
+
+    assert drain(scheduler) == ['state', 'sensors-0', 'sensors-1', 'sensors-2']
+    assert len(scheduler) == 0
+
+
+def test_weighted_policy_does_not_starve_the_low_priority_class():
+    scheduler = OutboundScheduler([TrafficClass('control', weight=3), TrafficClass('sensors', ('visualization',))],
+                                  policy=WEIGHTED)
+    for number in range(8):
+        scheduler.put('control', 'agent.a.state')
+        scheduler.put('sensors', 'agent.a.visualization')
+
+    assert drain(scheduler)[:8] == ['control', 'control', 'sensors', 'control'] * 2
+
+
+def test_full_droppable_class_drops_its_oldest_messages():
+    scheduler = OutboundScheduler([TrafficClass('control'),
+                                   TrafficClass('sensors', ('visualization',), max_depth=2, drop_oldest=True)])
+    for number in range(5):
+        scheduler.put(number, 'agent.a.visualization')
+
+    assert drain(scheduler) == [3, 4]
+    assert scheduler.summary()['sensors']['dropped'] == 3
+
+
+def test_full_class_makes_the_publisher_wait():
+    scheduler = OutboundScheduler([TrafficClass('control', max_depth=1)], put_timeout=5)
+    scheduler.put('first', 'agent.a.state')
+    waiting = threading.Thread(target=scheduler.put, args=('second', 'agent.a.state'))
+    waiting.start()
+    waiting.join(0.05)
+    assert waiting.is_alive()
+
+    assert scheduler.pop()[1] == 'first'
+    waiting.join(5)
+    assert drain(scheduler) == ['second']
+    assert scheduler.summary()['control']['dropped'] == 0
+
+
+def test_full_class_raises_after_put_timeout():
+    scheduler = OutboundScheduler([TrafficClass('control', max_depth=1)], put_timeout=0.01)
+    scheduler.put('first', 'agent.a.state')
+    with pytest.raises(HelyOSPublishError):
+        scheduler.put('second', 'agent.a.state')
+    scheduler.put('second', 'agent.a.state', block=False)  # the I/O thread does not wait for itself
+    assert len(scheduler) == 2
+
+
+def test_push_front_restores_the_order():
+    scheduler = OutboundScheduler()
+    scheduler.put('first', 'agent.a.state')
+    scheduler.put('second', 'agent.a.state')
+    traffic_class, item, queued_at = scheduler.pop()
+    scheduler.push_front(traffic_class, item, queued_at)
+    assert traffic_class.queue[0] == (queued_at, 'first')
+    assert drain(scheduler) == ['first', 'second']
+    assert scheduler.summary()['control']['sent'] == 2
+
+
+def test_io_thread_publishes_each_class_on_its_own_channel():
+    helyos_client = connect(HelyOSClient('localhost', uuid='agent-1'))
+    io_thread = AMQPIOThread(helyos_client, scheduler=OutboundScheduler(separate_channels=True))
+    io_thread.enqueue('xchange', 'agent.agent-1.visualization', None, b'sensors')
+    io_thread.enqueue('xchange', 'agent.agent-1.state', None, b'state')
+    io_thread._drain()
+
+    published = [(channel, message[1]) for channel in helyos_client.connection.channels for message in channel.published]
+    assert len(helyos_client.connection.channels) == 3
+    assert sorted(routing_key for _, routing_key in published) == ['agent.agent-1.state', 'agent.agent-1.visualization']
+    assert published[0][0] is not published[1][0]
+    assert io_thread.summary()['scheduler']['control']['sent'] == 1
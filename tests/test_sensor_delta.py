@@ -0,0 +1,88 @@
+from helyos_agent_sdk import envelope
+from helyos_agent_sdk.client import HelyOSClient
+from helyos_agent_sdk.connector import AgentConnector
+from helyos_agent_sdk.sensor_delta import SensorDeltaDecoder, SensorDeltaEncoder
+from tests.fakes import connect
+
+
+POSE = {'x': 0, 'y': 0, 'z': 0, 'orientations': [0]}
+
+
+def sensors_message(body, uuid='agent-1'):
+    return {'type': 'agent_sensors', 'uuid': uuid, 'body': body}
+
+
+def test_deltas_carry_the_changed_and_removed_keys():
+    encoder = SensorDeltaEncoder(keyframe_interval=60)
+    keyframe = encoder.encode(POSE, {'battery': {'value': 90}, 'door': 'closed'})
+    delta = encoder.encode(POSE, {'battery': {'value': 89}})
+
+    assert keyframe['delta'] == {'seq': 1, 'keyframe': True}
+    assert delta['sensors'] == {'battery': {'value': 89}}
+    assert delta['delta'] == {'seq': 2, 'keyframe': False, 'base': 1, 'removed': ['door']}
+
+
+def test_in_place_updates_of_sensor_entries_are_detected():
+    encoder = SensorDeltaEncoder(keyframe_interval=60)
+    sensors = {'battery': {'value': 90}}
+    encoder.encode(POSE, sensors)
+    sensors['battery']['value'] = 80
+    assert encoder.encode(POSE, sensors)['sensors'] == {'battery': {'value': 80}}
+
+
+def test_changes_within_the_deadbands_are_suppressed():
+    encoder = SensorDeltaEncoder(keyframe_interval=60, position_deadband=10, sensor_deadbands={'battery': 2})
+    encoder.encode(POSE, {'battery': {'value': 90}})
+
+    assert encoder.encode(dict(POSE, x=5), {'battery': {'value': 91}}) is None
+    assert encoder.encode(dict(POSE, x=20), {'battery': {'value': 91}})['sensors'] == {}
+    assert encoder.encode(dict(POSE, x=20), {'battery': {'value': 95}})['delta']['base'] == 2
+    assert encoder.summary() == {'keyframes': 1, 'deltas': 2, 'suppressed': 1}
+
+
+def test_keyframe_after_the_interval_and_on_request():
+    encoder = SensorDeltaEncoder(keyframe_interval=0)
+    encoder.encode(POSE, {})
+    assert encoder.encode(POSE, {})['delta']['keyframe']
+
+    encoder = SensorDeltaEncoder(keyframe_interval=60)
+    encoder.encode(POSE, {})
+    encoder.force_keyframe()
+    assert encoder.encode(POSE, {})['delta']['keyframe']
+
+
+def test_decoder_rebuilds_the_full_sensors():
+    encoder, decoder = SensorDeltaEncoder(keyframe_interval=60), SensorDeltaDecoder()
+    states = [{'battery': 90, 'door': 'closed'}, {'battery': 89, 'door': 'closed'}, {'battery': 89}, {'battery': 88}]
+    for sensors in states:
+        decoded = decoder.decode(sensors_message(encoder.encode(POSE, sensors)))
+        assert decoded['body']['sensors'] == sensors
+
+
+def test_decoder_waits_for_a_keyframe_after_a_lost_message():
+    encoder, decoder = SensorDeltaEncoder(keyframe_interval=60), SensorDeltaDecoder()
+    decoder.decode(sensors_message(encoder.encode(POSE, {'battery': 90})))
+    encoder.encode(POSE, {'battery': 89})  # lost
+    assert decoder.decode(sensors_message(encoder.encode(POSE, {'battery': 88}))) is None
+    assert decoder.decode(sensors_message(encoder.encode(POSE, {'battery': 87}))) is None
+
+    encoder.force_keyframe()
+    assert decoder.decode(sensors_message(encoder.encode(POSE, {'battery': 86})))['body']['sensors'] == {'battery': 86}
+
+
+def test_messages_without_delta_are_returned_unchanged():
+    message = sensors_message({'pose': POSE, 'sensors': {'battery': 90}})
+    assert SensorDeltaDecoder().decode(message) is message
+
+
+def test_publish_sensors_with_delta_encoding():
+    helyos_client = connect(HelyOSClient('localhost', uuid='agent-1'))
+    agent_connector = AgentConnector(helyos_client)
+    agent_connector.enable_sensor_delta(keyframe_interval=60, position_deadband=1)
+    agent_connector.publish_sensors(0, 0, 0, [0], {'battery': 90})
+    agent_connector.publish_sensors(0.5, 0, 0, [0], {'battery': 90})
+    agent_connector.publish_sensors(0, 0, 0, [0], {'battery': 80})
+
+    decoder = SensorDeltaDecoder()
+    bodies = [decoder.decode(envelope.decode_message(body)[0])['body'] for _, _, _, body in helyos_client.channel.published]
+    assert [body['sensors'] for body in bodies] == [{'battery': 90}, {'battery': 80}]
@@ -0,0 +1,77 @@
+import asyncio
+import time
+from helyos_agent_sdk.sensor_publisher import AsyncSensorPublisher, SensorPublisher
+
+
+class RecordingConnector():
+
+    def __init__(self):
+        self.samples = []
+
+    def publish_sensors(self, x, y, z, orientations, sensors, signed=False):
+        self.samples.append((x, y, z, orientations, sensors))
+
+
+class AsyncRecordingConnector(RecordingConnector):
+
+    async def publish_sensors(self, x, y, z, orientations, sensors, signed=False):
+        super().publish_sensors(x, y, z, orientations, sensors, signed)
+
+
+def test_samples_overwritten_before_publication_are_dropped():
+    connector = RecordingConnector()
+    publisher = SensorPublisher(connector, rate=10)
+    for x in range(5):
+        publisher.update(x, 0, 0, [0])
+    publisher.stop(flush=True)
+
+    assert connector.samples == [(4, 0, 0, [0], {})]
+    assert publisher.summary()['published'] == 1
+    assert publisher.summary()['dropped'] == 4
+
+
+def test_position_and_orientation_thresholds():
+    publisher = SensorPublisher(RecordingConnector(), position_threshold=100, orientation_threshold=0.5)
+    previous = {'x': 0, 'y': 0, 'z': 0, 'orientations': [0.0], 'sensors': {}}
+
+    assert publisher._significant_change(None, previous)
+    assert not publisher._significant_change(previous, dict(previous, x=60, y=60))
+    assert publisher._significant_change(previous, dict(previous, x=80, y=80))
+    assert publisher._significant_change(previous, dict(previous, orientations=[0.6]))
+    assert publisher._significant_change(previous, dict(previous, orientations=[0.0, 0.0]))
+
+
+def test_significant_change_is_published_before_the_next_period():
+    connector = RecordingConnector()
+    publisher = SensorPublisher(connector, rate=0.01, position_threshold=100)
+    publisher.start()
+    try:
+        publisher.update(0, 0, 0, [0])
+        deadline = time.monotonic() + 2
+        while len(connector.samples) < 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        publisher.update(500, 0, 0, [0])
+        while len(connector.samples) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        publisher.stop(flush=False)
+
+    assert [sample[0] for sample in connector.samples] == [0, 500]
+
+
+def test_async_publisher_publishes_the_latest_sample():
+    connector = AsyncRecordingConnector()
+
+    async def main():
+        publisher = AsyncSensorPublisher(connector, rate=100)
+        publisher.start()
+        publisher.update(1, 2, 3, [0])
+        await asyncio.sleep(0.05)
+        publisher.update(4, 5, 6, [0])
+        await publisher.stop(flush=True)
+        return publisher
+
+    publisher = asyncio.run(main())
+    assert connector.samples[0][:3] == (1, 2, 3)
+    assert connector.samples[-1][:3] == (4, 5, 6)
+    assert publisher.published == len(connector.samples)